@@ -1,13 +1,13 @@
-import datetime as dt
 from pathlib import Path
 
 import iris
-from metpy.interpolate import interpolate_to_grid
 import numpy as np
 
 from .plot_gauge_data import load_jja_gauge_data
 
-from cosmic.config import CONSTRAINT_CHINA
+from cosmic.regions import extract_region
+from cosmic.time_selection import select_time
+from cosmic.util import CressmanGridder
 
 
 def fmt_daterange_jja_year(year):
@@ -32,24 +32,22 @@ def extract_dataset(datadir, dataset, daterange):
         filename = f'cmorph_ppt_{season}.{daterange}.asia_precip.ppt_thresh_0p1.nc'
         amount_jja = iris.load_cube(f'{datadir}/{filename}',
                                     f'amount_of_precip_{season}')
-        amount_jja_china = amount_jja.collapsed('time', iris.analysis.MEAN).extract(CONSTRAINT_CHINA)
+        amount_jja_china = extract_region(amount_jja, 'china').collapsed('time', iris.analysis.MEAN)
     elif dataset == 'cmorph_8km_N1280':
         datadir = Path(f'{datadir}/cmorph_data/8km-30min')
         season = 'jja'
         filename = f'cmorph_ppt_{season}.{daterange}.asia_precip.ppt_thresh_0p1.N1280.nc'
         amount_jja = iris.load_cube(f'{datadir}/{filename}',
                                     f'amount_of_precip_{season}')
-        amount_jja_china = amount_jja.collapsed('time', iris.analysis.MEAN).extract(CONSTRAINT_CHINA)
+        amount_jja_china = extract_region(amount_jja, 'china').collapsed('time', iris.analysis.MEAN)
     elif dataset == 'aphrodite':
         datadir = Path(f'{datadir}/aphrodite_data/025deg')
         amount = iris.load_cube(str(datadir / 'APHRO_MA_025deg_V1901.2009.nc'),
                                 ' daily precipitation analysis interpolated onto 0.25deg grids')
-        epoch2009 = dt.datetime(2009, 1, 1)
-        time_index = np.array([epoch2009 + dt.timedelta(minutes=m) for m in amount.coord('time').points])
-        jja = ((time_index >= dt.datetime(2009, 6, 1)) & (time_index < dt.datetime(2009, 9, 1)))
-        amount_jja = amount[jja]
+        # N.B. one year per file.
+        amount_jja = select_time(amount, season='JJA')
         amount_jja_mean = amount_jja.collapsed('time', iris.analysis.MEAN)
-        amount_jja_china = amount_jja_mean.extract(CONSTRAINT_CHINA)
+        amount_jja_china = extract_region(amount_jja_mean, 'china')
     elif dataset == 'gauge_china_2419':
         df_station_info, df_precip, df_precip_jja, df_precip_station_jja = load_jja_gauge_data(datadir)
         if False:
@@ -64,16 +62,15 @@ def extract_dataset(datadir, dataset, daterange):
         lat = np.array([16.375] + list(lat) + [80.375])
         precip = np.array([0] + list(precip) + [0])
 
-        gx, gy, griddata = interpolate_to_grid(lon, lat, precip,
-                                               interp_type='cressman', minimum_neighbors=1,
-                                               hres=0.25, search_radius=0.48)
-        lat_coord = iris.coords.Coord(gy[:, 0], standard_name='latitude', units='degrees')
-        lon_coord = iris.coords.Coord(gx[0], standard_name='longitude', units='degrees')
+        gridder = CressmanGridder(lon, lat, hres=0.25, search_radius=0.48, minimum_neighbors=1)
+        griddata = gridder.grid(precip)
+        lat_coord = iris.coords.DimCoord(gridder.gy[:, 0], standard_name='latitude', units='degrees')
+        lon_coord = iris.coords.DimCoord(gridder.gx[0], standard_name='longitude', units='degrees')
         coords = [(lat_coord, 0), (lon_coord, 1)]
         amount_jja_mean = iris.cube.Cube(griddata,
                                          long_name='precipitation', units='mm hr-1',
                                          dim_coords_and_dims=coords)
-        amount_jja_china = amount_jja_mean.extract(CONSTRAINT_CHINA)
+        amount_jja_china = extract_region(amount_jja_mean, 'china')
     elif dataset[:2] == 'u-':
         # UM_N1280 run:
         runid = dataset[2:7]
@@ -82,6 +79,6 @@ def extract_dataset(datadir, dataset, daterange):
         filename = f'{runid}a.p9{season}.{daterange}.asia_precip.ppt_thresh_0p1.nc'
         amount_jja = iris.load_cube(f'{datadir / filename}',
                                     f'amount_of_precip_{season}')
-        amount_jja_china = amount_jja.collapsed('time', iris.analysis.MEAN).extract(CONSTRAINT_CHINA)
+        amount_jja_china = extract_region(amount_jja, 'china').collapsed('time', iris.analysis.MEAN)
 
     iris.save(amount_jja_china, f'data/{dataset}_china_amount.{daterange}.nc')
@@ -0,0 +1,209 @@
+"""Collocate gridded precip with gauge stations: extract each station's time series from gridded data.
+
+The grid cell indices (and weights) for all stations are calculated once for each grid and cached, keyed on
+a fingerprint of the grid and the station positions. Files are then streamed, one block of times at a time,
+and only the chunks containing station cells are read. Output is a tidy daily table (one row per
+station/day) with the same station_id/datetime columns as the gauge store, so it can be merged directly
+with gauge data.
+
+example usage:
+    df_station_info = load_station_info(gauge_store_path)
+    collocator = StationGridCollocator.from_cube(df_station_info, iris.load_cube(filenames[0]))
+    df_grid_daily = collocate_files(collocator, filenames)
+    df_compare = merge_with_gauge_precip(df_grid_daily, gauge_store_path)
+"""
+import os
+import sys
+import logging
+from hashlib import sha1
+from pathlib import Path
+
+import iris
+import numpy as np
+import pandas as pd
+
+from cosmic.cosmic_errors import CosmicError
+from cosmic.datasets.gauge_china2419.query_gauge_data import query_gauge_precip
+from cosmic.time_selection import TimeIndex
+from cosmic.util import grid_fingerprint
+
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class StationGridCollocator:
+    """Indices (and weights) of the grid cells for each station on a regular lat/lon grid.
+
+    method='nearest' uses the nearest cell, method='bilinear' the bilinear weighted mean of the 4 cells
+    surrounding the station. Stations outside the grid get NaN values.
+    Also, caches the indices/weights to a file for quicker subsequent use."""
+
+    METHODS = ['nearest', 'bilinear']
+
+    def __init__(self, station_ids, station_lat, station_lon, lat, lon, method='nearest', cache_dir='.'):
+        if method not in self.METHODS:
+            raise CosmicError(f'Unknown method: {method}, must be one of {self.METHODS}')
+        self.station_ids = np.asarray(station_ids, dtype=np.int32)
+        self.method = method
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        station_lat = np.asarray(station_lat, dtype=np.float64)
+        # Put station lons in the same range as the grid's lons (e.g. 0-360 or -180-180).
+        station_lon = (np.asarray(station_lon, dtype=np.float64) - lon[0]) % 360 + lon[0]
+
+        sha1hash = sha1()
+        sha1hash.update(grid_fingerprint(lat, lon).encode())
+        sha1hash.update(self.station_ids.tobytes())
+        sha1hash.update(station_lat.tobytes())
+        sha1hash.update(station_lon.tobytes())
+        sha1hash.update(method.encode())
+        cache_key = Path(cache_dir) / f'.cache_collocation.{sha1hash.hexdigest()}.npz'
+
+        if cache_key.exists():
+            logger.debug(f'loading collocation indices from file {cache_key}')
+            cache = np.load(cache_key)
+            self.lat_idx, self.lon_idx, self.weights = cache['lat_idx'], cache['lon_idx'], cache['weights']
+        else:
+            logger.debug(f'generating collocation indices and saving to {cache_key}')
+            if method == 'nearest':
+                self.lat_idx, self.lon_idx, self.weights = self._nearest(station_lat, station_lon, lat, lon)
+            else:
+                self.lat_idx, self.lon_idx, self.weights = self._bilinear(station_lat, station_lon, lat, lon)
+            np.savez(cache_key, lat_idx=self.lat_idx, lon_idx=self.lon_idx, weights=self.weights)
+
+    @classmethod
+    def from_cube(cls, df_station_info, cube, method='nearest', cache_dir='.'):
+        return cls(df_station_info.station_id.values, df_station_info.lat.values, df_station_info.lon.values,
+                   cube.coord('latitude').points, cube.coord('longitude').points, method, cache_dir)
+
+    @staticmethod
+    def _lower_index(coord, values):
+        """Index i such that coord[i] <= value < coord[i + 1] for increasing or decreasing coord."""
+        if coord[0] > coord[-1]:
+            return len(coord) - 2 - StationGridCollocator._lower_index(coord[::-1], values)
+        return np.clip(np.searchsorted(coord, values, side='right') - 1, 0, len(coord) - 2)
+
+    @staticmethod
+    def _outside(coord, values):
+        return (values < coord.min()) | (values > coord.max())
+
+    def _nearest(self, station_lat, station_lon, lat, lon):
+        idxs = []
+        for coord, values in [(lat, station_lat), (lon, station_lon)]:
+            i0 = self._lower_index(coord, values)
+            closer_upper = np.abs(coord[i0 + 1] - values) < np.abs(coord[i0] - values)
+            idxs.append((i0 + closer_upper)[:, None])
+        weights = np.ones((len(station_lat), 1))
+        weights[self._outside(lat, station_lat) | self._outside(lon, station_lon)] = np.nan
+        return idxs[0], idxs[1], weights
+
+    def _bilinear(self, station_lat, station_lon, lat, lon):
+        ilat = self._lower_index(lat, station_lat)
+        ilon = self._lower_index(lon, station_lon)
+        flat = (station_lat - lat[ilat]) / (lat[ilat + 1] - lat[ilat])
+        flon = (station_lon - lon[ilon]) / (lon[ilon + 1] - lon[ilon])
+        lat_idx = np.stack([ilat, ilat, ilat + 1, ilat + 1], axis=1)
+        lon_idx = np.stack([ilon, ilon + 1, ilon, ilon + 1], axis=1)
+        weights = np.stack([(1 - flat) * (1 - flon), (1 - flat) * flon, flat * (1 - flon), flat * flon], axis=1)
+        weights[self._outside(lat, station_lat) | self._outside(lon, station_lon)] = np.nan
+        return lat_idx, lon_idx, weights
+
+    def extract(self, cube, time_block=240):
+        """Extract station time series from cube, reading one block of times at a time.
+
+        Only the (netCDF/dask) chunks that contain station cells are read.
+        :param cube: (time, lat, lon) cube with the grid this collocator was made for
+        :param time_block: number of times to read at once
+        :return: array (time, station)
+        """
+        if cube.coord_dims('time') != (0,) or cube.ndim != 3:
+            raise CosmicError('cube must have dims (time, lat, lon)')
+        lazy_data = cube.lazy_data()
+        flat_lat_idx = self.lat_idx.ravel()
+        flat_lon_idx = self.lon_idx.ravel()
+
+        station_data = np.empty((cube.shape[0], len(self.station_ids)), dtype=np.float64)
+        for t0 in range(0, cube.shape[0], time_block):
+            t1 = min(t0 + time_block, cube.shape[0])
+            # vindex puts the point dim first: (point, time).
+            cell_values = lazy_data[t0:t1].vindex[:, flat_lat_idx, flat_lon_idx].compute()
+            cell_values = np.ma.filled(cell_values.astype(np.float64), np.nan).T
+            cell_values = cell_values.reshape(t1 - t0, *self.weights.shape)
+            station_data[t0:t1] = (cell_values * self.weights).sum(axis=2)
+        return station_data
+
+
+def _daily_sums(cube, station_data, station_ids):
+    # Calendar aware: works for e.g. 360_day calendars as well as gregorian.
+    time_index = TimeIndex(cube.coord('time'))
+    day_keys = time_index.year * 10000 + time_index.month * 100 + time_index.day
+    days, day_index = np.unique(day_keys, return_inverse=True)
+
+    valid = ~np.isnan(station_data)
+    precip_sum = np.zeros((len(days), station_data.shape[1]))
+    num_samples = np.zeros((len(days), station_data.shape[1]), dtype=np.int32)
+    np.add.at(precip_sum, day_index, np.where(valid, station_data, 0))
+    np.add.at(num_samples, day_index, valid)
+    return pd.DataFrame({
+        'station_id': np.tile(station_ids, len(days)),
+        'day_key': np.repeat(days, len(station_ids)),
+        'precip_sum': precip_sum.ravel(),
+        'num_samples': num_samples.ravel(),
+    })
+
+
+def collocate_files(collocator, filenames, constraint=None, time_block=240):
+    """Stream files, extracting station values and aggregating them to daily means.
+
+    Days that span files are handled by accumulating sums and counts over all files.
+
+    :param collocator: StationGridCollocator for the grid of the files
+    :param filenames: files to stream, e.g. monthly precip files
+    :param constraint: constraint to load one cube from each file
+    :param time_block: number of times to read at once
+    :return: DataFrame with columns station_id, datetime, precip (daily mean rate * 24: mm day-1), num_samples
+    """
+    dfs = []
+    for filename in filenames:
+        logger.info(f'collocating {filename}')
+        cube = iris.load_cube(str(filename), constraint)
+        if cube.units == 'kg m-2 s-1':
+            factor = 3600
+        elif cube.units == 'mm hr-1':
+            factor = 1
+        else:
+            raise CosmicError(f'Unexpected units {cube.units} for {filename}')
+        station_data = collocator.extract(cube, time_block) * factor
+        dfs.append(_daily_sums(cube, station_data, collocator.station_ids))
+
+    df = pd.concat(dfs).groupby(['station_id', 'day_key'], as_index=False)[['precip_sum', 'num_samples']].sum()
+    day_keys = df.day_key.values
+    # N.B. dates that do not exist in the gregorian calendar (e.g. 30 Feb in 360_day) become NaT and are dropped.
+    df['datetime'] = pd.to_datetime({'year': day_keys // 10000, 'month': day_keys // 100 % 100,
+                                     'day': day_keys % 100}, errors='coerce')
+    num_dropped = df.datetime.isna().sum()
+    if num_dropped:
+        logger.warning(f'dropping {num_dropped} rows with non-gregorian dates')
+    df = df[df.datetime.notna()]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        precip = df.precip_sum.values / df.num_samples.values * 24
+    df_daily = pd.DataFrame({
+        'station_id': df.station_id.values.astype(np.int32),
+        'datetime': df.datetime.values,
+        'precip': precip.astype(np.float32),
+        'num_samples': df.num_samples.values,
+    })
+    return df_daily.sort_values(['station_id', 'datetime']).reset_index(drop=True)
+
+
+def merge_with_gauge_precip(df_grid_daily, gauge_store_path):
+    """Merge daily gridded station values with gauge values for the same stations and days.
+
+    :return: DataFrame with columns station_id, datetime, precip_grid, precip_gauge, num_samples
+    """
+    df_gauge = query_gauge_precip(gauge_store_path, df_grid_daily.datetime.min(), df_grid_daily.datetime.max(),
+                                  station_ids=np.unique(df_grid_daily.station_id))
+    return pd.merge(df_grid_daily, df_gauge[['station_id', 'datetime', 'precip']],
+                    on=['station_id', 'datetime'], suffixes=('_grid', '_gauge'))
@@ -3,23 +3,27 @@ from pathlib import Path
 
 import cartopy.crs as ccrs
 import matplotlib.pyplot as plt
-from metpy.interpolate import interpolate_to_grid
 import numpy as np
 import pandas as pd
 
 from basmati.hydrosheds import load_hydrobasins_geodataframe
-from cosmic.util import load_cmap_data
+from cosmic.util import load_cmap_data, CressmanGridder
 from basmati.utils import build_raster_from_lon_lat
+from cosmic.datasets.gauge_china2419.convert_gauge_data import STORE_FILENAME
+from cosmic.datasets.gauge_china2419.query_gauge_data import (load_station_info, query_gauge_precip,
+                                                               calc_station_mean_precip)
 
 
 def load_jja_gauge_data(basedir):
     gauge_data_dir = Path('gauge_china2419/pre/SURF_CLI_CHN_PRE_MUT_HOMO/SURF_CLI_CHN_PRE_MUT_HOMO')
-
-    df_station_info = pd.read_hdf(basedir / gauge_data_dir / 'station_data.hdf', 'station_info')
-    df_precip = pd.read_hdf(basedir / gauge_data_dir / 'station_data.hdf', 'precip')
-    df_precip.precip.replace(-999, np.NaN)
-    df_precip_jja = df_precip[(df_precip.datetime >= dt.datetime(2009, 6, 1)) & (df_precip.datetime <= dt.datetime(2009, 8, 31))]
-    df_precip_station_jja = pd.merge(df_station_info, df_precip_jja.groupby('station_id').mean(), on='station_id')
+    store_path = basedir / gauge_data_dir / STORE_FILENAME
+
+    df_station_info = load_station_info(store_path)
+    # N.B. only reads 2009 rows.
+    df_precip = query_gauge_precip(store_path, dt.datetime(2009, 1, 1), dt.datetime(2009, 12, 31))
+    df_precip_jja = df_precip[(df_precip.datetime >= dt.datetime(2009, 6, 1)) &
+                              (df_precip.datetime <= dt.datetime(2009, 8, 31))]
+    df_precip_station_jja = calc_station_mean_precip(df_station_info, df_precip_jja)
     return df_station_info, df_precip, df_precip_jja, df_precip_station_jja
 
 
@@ -42,11 +46,9 @@ def plot_precip_station_jja_cressman(ax, hydrosheds_dir, df_precip_station_jja,
     else:
         lat = df_precip_station_jja.lat
 
-    gx, gy, griddata = interpolate_to_grid(df_precip_station_jja.lon, 
-                                           lat, 
-                                           df_precip_station_jja.precip, 
-                                           interp_type='cressman', minimum_neighbors=1,
-                                           hres=grid_spacing, search_radius=search_rad)
+    gridder = CressmanGridder(df_precip_station_jja.lon.values, lat.values,
+                              hres=grid_spacing, search_radius=search_rad, minimum_neighbors=1)
+    griddata = gridder.grid(df_precip_station_jja.precip.values)
     griddata = np.ma.masked_where(np.isnan(griddata), griddata)
     lon_min = df_precip_station_jja.lon.min()
     lon_max = df_precip_station_jja.lon.max()
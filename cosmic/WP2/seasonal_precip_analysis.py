@@ -7,6 +7,8 @@ from pathlib import Path
 import numpy as np
 import iris
 
+from cosmic.nc_write_profiles import save_cubes
+
 DEFAULT_DATADIR = Path('/gws/nopw/j04/cosmic/mmuetz/data/u-ak543/ap9.pp/')
 DEFAULT_PRECIP_THRESH = 0.1  # mm hr-1
 
@@ -49,6 +51,19 @@ def gen_nc_precip_filenames(datadir, season, start_year_month, end_year_month,
     return nc_season
 
 
+def _nan_filled(data):
+    """Return data as an ndarray with missing values as NaN, without copying if possible.
+
+    Data loaded from files written with a NaN _FillValue (e.g. CMORPH) comes back masked, but the
+    underlying data already holds NaN at the masked points, so there is no need to fill.
+    """
+    if not np.ma.isMaskedArray(data):
+        return data
+    if np.isnan(data.fill_value) or not np.ma.is_masked(data):
+        return np.ma.getdata(data)
+    return data.filled(np.nan)
+
+
 def calc_precip_amount_freq_intensity(season, season_cube, precip_thresh, 
                                       num_per_day=24, convert_kgpm2ps1_to_mmphr=True,
                                       calc_method='low_mem', ignore_mask=True):
@@ -84,34 +99,38 @@ def calc_precip_amount_freq_intensity(season, season_cube, precip_thresh,
         # Using -1 tells reshape to infer the dimension from the others.
         # Convert from kg m-2 s-1 to mm hr-1 by multiplying by 3600 (# s/hr)
         # This method causes all data to be loaded into memory.
-        reshaped_data = season_cube.data.reshape(num_days, num_per_day, 
-                                                 season_cube.shape[1], 
-                                                 season_cube.shape[2]) * factor
-        if ignore_mask:
-            reshaped_data = reshaped_data.filled(0)
+        reshaped_data = _nan_filled(season_cube.data).reshape(num_days, num_per_day,
+                                                              season_cube.shape[1],
+                                                              season_cube.shape[2])
+        if factor != 1:
+            reshaped_data = reshaped_data * factor
 
         # The freq, amount and intensity must all be collapsed on the first dimension.
-        freq_mask = reshaped_data < precip_thresh
-        season_freq_data = 1 - freq_mask.sum(axis=0) / num_days
+        # N.B. NaN >= precip_thresh is False, so missing values are never counted (ignore_mask).
+        freq_keep = reshaped_data >= precip_thresh
+        season_freq_count = freq_keep.sum(axis=0)
+        season_freq_data = season_freq_count / num_days
         # N.B. this is a *thresholded* amount. It will be very similar to the mean, but not identical.
         # Keep units as mm hr-1, by dividing by number of hours.
-        season_amount_data = (np.ma.masked_array(reshaped_data, mask=freq_mask).sum(axis=0) / 
-                              num_days).filled(0)
+        season_amount_total = np.where(freq_keep, reshaped_data, 0).sum(axis=0)
+        season_amount_data = season_amount_total / num_days
 
-        season_intensity_data = np.ma.masked_array(reshaped_data, mask=freq_mask).mean(axis=0).filled(0)
+        season_intensity_data = np.divide(season_amount_total, season_freq_count,
+                                          out=np.zeros_like(season_amount_total),
+                                          where=season_freq_count != 0)
 
         max_diff = np.max(np.abs(season_intensity_data * season_freq_data - season_amount_data))
         logger.info(f'max diff: {max_diff}')
     elif calc_method == 'low_mem':
         # Use a moving window over the array to calc freq and amount.
         # Will make use of freq * intensity = amount to calc intensity.
+        # Missing data is handled as NaN: no masks are allocated or filled in the loop.
         data_shape = (num_per_day, season_cube.shape[1], season_cube.shape[2])
         season_freq_data = np.zeros(data_shape)
         season_amount_data = np.zeros(data_shape)
-        if ignore_mask:
-            data_mask = np.zeros(data_shape, dtype=bool)
-        else:
-            data_mask = np.ones(data_shape, dtype=bool)
+        if not ignore_mask:
+            # Number of non-missing values at each point.
+            season_valid_count = np.zeros(data_shape)
 
         for i in range(num_days):
             if i % 10 == 0:
@@ -120,31 +139,37 @@ def calc_precip_amount_freq_intensity(season, season_cube, precip_thresh,
                 logger.debug(f'calc for day {i + 1} of {num_days}')
             # N.B. only load slice into memory because slices *cube*, not *cube.data*.
             logger.debug('loading slice')
-            sliced_data = season_cube[i * num_per_day: (i + 1) * num_per_day].data * factor
-            if ignore_mask:
-                logger.debug('filling missing values')
-                sliced_data = sliced_data.filled(0)
-            else:
-                logger.debug('updating mask')
-                data_mask &= sliced_data.mask
-
-            # freq_keep should not be masked. Do not want to add a masked var as it will keep the mask.
+            sliced_data = _nan_filled(season_cube[i * num_per_day: (i + 1) * num_per_day].data)
+            if factor != 1:
+                sliced_data = sliced_data * factor
+            if not ignore_mask:
+                logger.debug('updating valid count')
+                season_valid_count += ~np.isnan(sliced_data)
+
+            # N.B. NaN >= precip_thresh is False, so missing values are never counted.
             logger.debug('applying threshold')
-            freq_keep = (sliced_data >= precip_thresh).data
+            freq_keep = sliced_data >= precip_thresh
             season_freq_data += freq_keep
             logger.debug('calculating amount total')
-            season_amount_data[freq_keep] = season_amount_data[freq_keep] + sliced_data[freq_keep]
+            np.add(season_amount_data, sliced_data, out=season_amount_data, where=freq_keep)
 
         if ignore_mask:
             season_amount_data = season_amount_data / num_days
             season_freq_data = season_freq_data / num_days
-            season_intensity_data = (np.ma.masked_array(season_amount_data,
-                                                        season_freq_data == 0) / season_freq_data).filled(0)
+            season_intensity_data = np.divide(season_amount_data, season_freq_data,
+                                              out=np.zeros_like(season_amount_data),
+                                              where=season_freq_data != 0)
         else:
-            season_amount_data = np.ma.masked_array(season_amount_data / num_days,
-                                                    (season_freq_data == 0) | data_mask)
-            season_intensity_data = np.ma.masked_array(season_amount_data / season_freq_data,
-                                                       (season_freq_data == 0) | data_mask)
+            # NaN-aware counts: normalize by the number of valid values at each point.
+            # Points with no valid values, or no precip above thresh (intensity), are NaN.
+            no_data = season_valid_count == 0
+            season_intensity_data = np.divide(season_amount_data, season_freq_data,
+                                              out=np.full(data_shape, np.nan),
+                                              where=season_freq_data != 0)
+            season_amount_data = np.divide(season_amount_data, season_valid_count,
+                                           out=np.full(data_shape, np.nan), where=~no_data)
+            season_freq_data = np.divide(season_freq_data, season_valid_count,
+                                         out=np.full(data_shape, np.nan), where=~no_data)
     logger.info(f'performed {calc_method} in {timer() - start:.02f}s')
 
     hourly_coords = [(season_cube[:num_per_day].coord('time'), 0),
@@ -193,7 +218,8 @@ def save_analysis_cubes(datadir, season, precip_thresh, analysis_cubes,
     output_filepath = datadir / output_file_tpl.format(season=season, 
                                                        thresh_text=thresh_text, 
                                                        **output_file_kwargs)
-    iris.save(analysis_cubes, str(output_filepath))
+    # Analysis cubes are (hourly) maps.
+    save_cubes(analysis_cubes, output_filepath, profile='map')
     return analysis_cubes
 
 
@@ -60,6 +60,8 @@ STANDARD_NAMES = {
     'HadGEM3-GC31-LM': 'N96',
 }
 
+# N.B. these constraints are evaluated for every coord cell: cosmic.regions does the same subsetting
+# much faster using index slices, and handles the GMT boundary.
 CONSTRAINT_ASIA = (iris.Constraint(coord_values={'latitude': lambda cell: 0.9 < cell < 56.1})
                    & iris.Constraint(coord_values={'longitude': lambda cell: 56.9 < cell < 151.1}))
 
@@ -1,23 +1,61 @@
+"""Retrieve UM output from MASS using moo select.
+
+Retrievals (one per runid/stream/year/month, or per runid/stream/year with several months batched into one
+query) are run concurrently, up to max_concurrent at once. Retrievals that fail with transient MASS errors
+(see TRANSIENT_ERRORS) are retried with exponential backoff. Failed retrievals are logged at the end, and do not
+stop other retrievals from running.
+
+example usage:
+    cosmic-retrieve-from-mass u-ak543_ap9_precip.py --max-concurrent 4 --batch-months
+"""
 import os
 import sys
 import logging
 import subprocess as sp
 import re
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from timeit import default_timer as timer
 
 from cosmic.util import load_module, sysrun
+from cosmic.processing.convert_pp_to_nc import MONTH_MAP
 
 logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
                     format='%(asctime)s %(levelname)8s: %(message)s')
 logger = logging.getLogger(__name__)
 
+# MASS errors that are worth retrying: the storage system is down or too busy to accept the request.
+TRANSIENT_ERRORS = ['SSC_STORAGE_SYSTEM_UNAVAILABLE', 'SSC_TASK_REJECTION']
+
+
+class Retrieval:
+    """One moo select: one or more months of a year for a runid/stream."""
+
+    def __init__(self, runid, stream, year, months, stream_info):
+        self.runid = runid
+        self.stream = stream
+        self.year = year
+        self.months = tuple(months)
+        self.stream_info = stream_info
+
+    def __repr__(self):
+        return f'Retrieval({self.runid}, {self.stream}, {self.year}, {self.months})'
+
 
 def resolve_output_dir(config, runid, stream, year, month, output_name):
     return (config.BASE_OUTPUT_DIRPATH / runid /
             f'{stream}.pp' / f'{output_name}_{year}{month:02}')
 
 
+def resolve_batch_dir(config, runid, stream, year, months, output_name):
+    """Dir that a batched retrieval is written to, before its files are moved to the per-month dirs."""
+    months_str = '_'.join(f'{m:02}' for m in months)
+    return (config.BASE_OUTPUT_DIRPATH / runid /
+            f'{stream}.pp' / f'.batch_{output_name}_{year}_{months_str}')
+
+
 def check_access(runid):
     try:
         comp_proc = sysrun(f'moo ls moose:/crum/{runid}')
@@ -34,23 +72,34 @@ def check_access(runid):
         raise
 
 
-def write_stream_query(queries_dir, runid, stream, year, month, stashcodes, stream_info):
-    if len(stashcodes) == 1:
-        # No brackets surrounding one stashcode.
-        stashcode_str = str(stashcodes[0])
+def _format_query_value(values):
+    if len(values) == 1:
+        # No brackets surrounding one value.
+        return str(values[0])
     else:
-        # Brackets surrounding comma separated list of stashcodes.
-        stashcode_str = '(' + ', '.join([str(s) for s in stashcodes]) + ')'
+        # Brackets surrounding comma separated list of values.
+        return '(' + ', '.join([str(v) for v in values]) + ')'
+
+
+def write_stream_query(queries_dir, runid, stream, year, month, stashcodes, stream_info):
+    """Write a moo select query file.
+
+    :param month: month, or tuple of months to select in one query
+    :return: path to query file
+    """
+    months = month if isinstance(month, tuple) else (month, )
+    stashcode_str = _format_query_value(stashcodes)
+    months_str = '_'.join(f'{m:02}' for m in months)
 
     output_name = stream_info['output_name']
-    query_filepath = queries_dir / f'{runid}_{stream}_{year}{month:02}_{output_name}_select_query'
+    query_filepath = queries_dir / f'{runid}_{stream}_{year}{months_str}_{output_name}_select_query'
     logger.debug(f'  writing {query_filepath}')
     lines = []
     lines.append('begin')
     lines.append(f'  stash={stashcode_str}')
     lines.append(f'  year={year}')
-    lines.append(f'  mon={month}')
-    for element, element_val in stream_info['extra_elements']:
+    lines.append(f'  mon={_format_query_value(months)}')
+    for element, element_val in stream_info['extra_elements'].items():
         lines.append(f'  {element}={element_val}')
     lines.append('end')
     with open(query_filepath, 'w') as fp:
@@ -58,8 +107,9 @@ def write_stream_query(queries_dir, runid, stream, year, month, stashcodes, stre
     return query_filepath
 
 
-def run_moo_select(config, runid, stream, year, month, stream_info, query_filepath):
-    output_dir = resolve_output_dir(config, runid, stream, year, month, stream_info['output_name'])
+def run_moo_select(config, runid, stream, year, month, stream_info, query_filepath, output_dir=None):
+    if output_dir is None:
+        output_dir = resolve_output_dir(config, runid, stream, year, month, stream_info['output_name'])
     if not output_dir.exists():
         os.makedirs(output_dir)
     cmd = f'moo select {query_filepath} moose:/crum/{runid}/{stream}.pp/ {output_dir}'
@@ -77,11 +127,73 @@ def run_moo_select(config, runid, stream, year, month, stream_info, query_filepa
         raise
 
 
+def parse_pp_year_month(filename, stream):
+    """Parse year and month from a UM pp filename, e.g. ak543a.p92006jan.pp or ak543a.p920060601.pp for ap9.
+
+    :return: (year, month)
+    """
+    # Filenames have the stream without its leading 'a' (e.g. p9 for ap9), followed by the date.
+    match = re.search(rf'\.{stream[1:]}(\d{{4}})([a-z]{{3}}|\d{{2}})', filename)
+    if not match:
+        raise ValueError(f'Cannot parse year/month from {filename}')
+    year, month_str = match.groups()
+    month = MONTH_MAP[month_str] if month_str in MONTH_MAP else int(month_str)
+    return int(year), month
+
+
+def distribute_batch_files(config, retrieval, batch_dir):
+    """Move the files retrieved by a batched query into their per-month output dirs."""
+    output_name = retrieval.stream_info['output_name']
+    for path in sorted(batch_dir.iterdir()):
+        year, month = parse_pp_year_month(path.name, retrieval.stream)
+        output_dir = resolve_output_dir(config, retrieval.runid, retrieval.stream, year, month, output_name)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        logger.debug(f'  {path} -> {output_dir}')
+        path.rename(output_dir / path.name)
+    batch_dir.rmdir()
+
+
 def retrieve_from_MASS(config, queries_dir, runid, stream,
                        year, month, stashcodes, stream_info):
+    """Retrieve one month, or a batch of months if month is a tuple."""
     query_filepath = write_stream_query(queries_dir, runid, stream,
                                         year, month, stashcodes, stream_info)
-    run_moo_select(config, runid, stream, year, month, stream_info, query_filepath)
+    if isinstance(month, tuple) and len(month) > 1:
+        retrieval = Retrieval(runid, stream, year, month, stream_info)
+        batch_dir = resolve_batch_dir(config, runid, stream, year, month, stream_info['output_name'])
+        ret = run_moo_select(config, runid, stream, year, month, stream_info, query_filepath, batch_dir)
+        distribute_batch_files(config, retrieval, batch_dir)
+        return ret
+    if isinstance(month, tuple):
+        month = month[0]
+    return run_moo_select(config, runid, stream, year, month, stream_info, query_filepath)
+
+
+def retrieve_with_retries(config, queries_dir, retrieval, max_retries=5, retry_delay=60):
+    """Retrieve, retrying transient MASS errors with exponential backoff (retry_delay, 2 * retry_delay, ...)."""
+    for attempt in range(max_retries + 1):
+        try:
+            return retrieve_from_MASS(config, queries_dir, retrieval.runid, retrieval.stream,
+                                      retrieval.year, retrieval.months, retrieval.stream_info['stashcodes'],
+                                      retrieval.stream_info)
+        except sp.CalledProcessError as cpe:
+            transient_error = next((e for e in TRANSIENT_ERRORS if e in cpe.stderr), None)
+            if transient_error is None or attempt == max_retries:
+                raise
+            delay = retry_delay * 2**attempt
+            logger.warning(f'{retrieval}: {transient_error}, retry {attempt + 1}/{max_retries} in {delay}s')
+            time.sleep(delay)
+
+
+def retrieval_output_size(config, retrieval):
+    """Total size in bytes of files in the output dirs of retrieval."""
+    size = 0
+    for month in retrieval.months:
+        output_dir = resolve_output_dir(config, retrieval.runid, retrieval.stream, retrieval.year, month,
+                                        retrieval.stream_info['output_name'])
+        if output_dir.exists():
+            size += sum(p.stat().st_size for p in output_dir.iterdir() if p.is_file())
+    return size
 
 
 def gen_years_months(start_year_month, end_year_month):
@@ -98,34 +210,88 @@ def gen_years_months(start_year_month, end_year_month):
     return years_months
 
 
-def main(config_filename):
-    logger.info('retrieve_from_mass')
-    config = load_module(config_filename)
-    logger.debug(config.ACTIVE_RUNIDS)
-
-    # Check have access to all runids.
-    for runid in config.ACTIVE_RUNIDS:
-        # check_access(runid)
-        pass
-
-    # Use config to download relevant data.
+def gen_retrievals(config, batch_months=False):
+    """Generate all retrievals for config: one per month, or one per year if batch_months."""
+    retrievals = []
     for runid in config.ACTIVE_RUNIDS:
         mass_info = config.MASS_INFO[runid]
-        queries_dir = Path('queries')
-        queries_dir.mkdir(exist_ok=True)
-
         for stream, stream_info in mass_info['stream'].items():
-            stashcodes = stream_info['stashcodes']
             if 'years_months' in stream_info:
                 years_months = stream_info['years_months']
             else:
                 years_months = gen_years_months(stream_info['start_year_month'],
                                                 stream_info['end_year_month'])
-            for i, (year, month) in enumerate(years_months):
-                N = len(years_months)
-                logger.info(f'Retrieving {i+1}/{N} {runid}: {stream} {year}/{month} {stashcodes}')
-                start = timer()
-                retrieve_from_MASS(config, queries_dir, runid, stream,
-                                   year, month, stashcodes, stream_info)
-                end = timer()
-                logger.info(f'Retrieved in {end - start:02f}s')
+            if batch_months:
+                months_for_year = {}
+                for year, month in years_months:
+                    months_for_year.setdefault(year, []).append(month)
+                for year, months in months_for_year.items():
+                    retrievals.append(Retrieval(runid, stream, year, months, stream_info))
+            else:
+                for year, month in years_months:
+                    retrievals.append(Retrieval(runid, stream, year, [month], stream_info))
+    return retrievals
+
+
+def run_retrievals(config, retrievals, queries_dir, max_concurrent=4, max_retries=5, retry_delay=60):
+    """Run retrievals concurrently, logging progress and throughput.
+
+    :return: list of (retrieval, exception) for all failed retrievals
+    """
+    queries_dir.mkdir(exist_ok=True)
+    num_retrievals = len(retrievals)
+    failed = []
+    total_bytes = 0
+    start = timer()
+
+    def _retrieve(retrieval):
+        retrieval_start = timer()
+        retrieve_with_retries(config, queries_dir, retrieval, max_retries, retry_delay)
+        return timer() - retrieval_start
+
+    with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+        futures = {executor.submit(_retrieve, r): r for r in retrievals}
+        for i, future in enumerate(as_completed(futures)):
+            retrieval = futures[future]
+            try:
+                retrieval_time = future.result()
+            except Exception as e:
+                logger.error(f'Failed {retrieval}: {e}')
+                failed.append((retrieval, e))
+                continue
+            retrieval_bytes = retrieval_output_size(config, retrieval)
+            total_bytes += retrieval_bytes
+            elapsed = timer() - start
+            logger.info(f'Retrieved {i + 1}/{num_retrievals} {retrieval} '
+                        f'{retrieval_bytes / 1e6:.1f}MB in {retrieval_time:.02f}s; '
+                        f'total {total_bytes / 1e6:.1f}MB in {elapsed:.02f}s '
+                        f'({total_bytes / 1e6 / elapsed:.2f}MB/s)')
+
+    if failed:
+        logger.error(f'{len(failed)}/{num_retrievals} retrievals failed:')
+        for retrieval, e in failed:
+            logger.error(f'  {retrieval}')
+    return failed
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Retrieve data defined in a config file from MASS')
+    parser.add_argument('config_filename')
+    parser.add_argument('--max-concurrent', '-N', type=int, default=4,
+                        help='max number of moo selects to run at once')
+    parser.add_argument('--batch-months', action='store_true',
+                        help='retrieve all months of a year in one moo select')
+    parser.add_argument('--max-retries', type=int, default=5,
+                        help='max retries for transient MASS errors')
+    parser.add_argument('--retry-delay', type=float, default=60,
+                        help='initial retry delay (s), doubled after each retry')
+    args = parser.parse_args(argv)
+
+    logger.info('retrieve_from_mass')
+    config = load_module(args.config_filename)
+    logger.debug(config.ACTIVE_RUNIDS)
+
+    retrievals = gen_retrievals(config, args.batch_months)
+    failed = run_retrievals(config, retrievals, Path('queries'), args.max_concurrent,
+                            args.max_retries, args.retry_delay)
+    return failed
@@ -1,10 +1,23 @@
 import os
+import sys
+import base64
 import gzip
+import http.client
+import logging
+import threading
+import urllib.parse
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import shutil
 
+from cosmic.cosmic_errors import CosmicError
 from cosmic.util import sysrun
 
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
 GZ_FILE_TPL = 'APHRO_MA_025deg_V1901.{year}.nc.gz'
 FILE_TPL = 'APHRO_MA_025deg_V1901.{year}.nc'
 ALL_YEARS = list(range(1998, 2016))
@@ -45,3 +58,143 @@ class AphroditeDownloader:
 
         os.chdir(cwd)
 
+
+
+class StreamingAphroditeDownloader(AphroditeDownloader):
+    """Download APHRODITE years concurrently over persistent, authenticated HTTP connections.
+
+    The gzip stream is decompressed as it arrives and written to <file>.nc.part, which is renamed to
+    <file>.nc when complete: no .gz file is written. If the connection drops, the transfer is resumed
+    from the last byte received using a Range request, continuing with the same decompressor. N.B. the
+    decompressor state only exists in this process, so a .part file left by a previous run is restarted.
+
+    example usage:
+        downloader = StreamingAphroditeDownloader(datadir, username, password, num_workers=4)
+        failed_years = downloader.download_all()
+    """
+    def __init__(self, datadir, username, password, num_workers=4, url=None, timeout=60,
+                 max_retries=5, chunk_size=1024 * 1024):
+        super().__init__(datadir, username, password)
+        self.url = urllib.parse.urlsplit(url or self.URL)
+        self.num_workers = num_workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.chunk_size = chunk_size
+
+        credentials = base64.b64encode(f'{username}:{password}'.encode()).decode()
+        self._headers = {'Authorization': f'Basic {credentials}'}
+        # One connection per worker thread, reused for all the years it downloads.
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self, reconnect=False):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and reconnect:
+            conn.close()
+            conn = None
+        if conn is None:
+            if self.url.scheme == 'https':
+                conn = http.client.HTTPSConnection(self.url.hostname, self.url.port, timeout=self.timeout)
+            else:
+                conn = http.client.HTTPConnection(self.url.hostname, self.url.port, timeout=self.timeout)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+    def _stream_year(self, year, fp):
+        """Stream the gzipped file for year, writing decompressed data to fp.
+
+        :return: number of compressed bytes received
+        """
+        path = self.url.path + GZ_FILE_TPL.format(year=year)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        received = 0
+        total_size = None
+        attempt = 0
+        while True:
+            headers = dict(self._headers)
+            if received:
+                headers['Range'] = f'bytes={received}-'
+            try:
+                conn = self._connection(reconnect=attempt > 0)
+                conn.request('GET', path, headers=headers)
+                response = conn.getresponse()
+                if response.status == 206:
+                    skip = 0
+                    if total_size is None:
+                        total_size = int(response.getheader('Content-Range').split('/')[1])
+                elif response.status == 200:
+                    # Range not supported (or not requested): skip any bytes that have already been received.
+                    skip = received
+                    if total_size is None and response.getheader('Content-Length') is not None:
+                        total_size = int(response.getheader('Content-Length'))
+                else:
+                    response.read()
+                    raise CosmicError(f'HTTP error {response.status} ({response.reason}) for {path}')
+
+                while True:
+                    chunk = response.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    if skip:
+                        num_skip = min(skip, len(chunk))
+                        chunk = chunk[num_skip:]
+                        skip -= num_skip
+                    received += len(chunk)
+                    fp.write(decompressor.decompress(chunk))
+                if total_size is not None and received < total_size:
+                    raise http.client.IncompleteRead(b'', total_size - received)
+                break
+            except (http.client.HTTPException, OSError) as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                logger.warning(f'{path}: {e!r}, resuming from byte {received} (attempt {attempt})')
+
+        fp.write(decompressor.flush())
+        if not decompressor.eof:
+            raise CosmicError(f'{path}: gzip stream truncated after {received} bytes')
+        return received
+
+    def download(self, year):
+        newpath = self.datadir / FILE_TPL.format(year=year)
+        if newpath.exists():
+            logger.info(f'Skipping (already exists): {newpath}')
+            return
+        part_path = newpath.parent / (newpath.name + '.part')
+        logger.info(f'downloading {year} to {newpath}')
+        with open(part_path, 'wb') as fp:
+            received = self._stream_year(year, fp)
+        part_path.rename(newpath)
+        logger.info(f'downloaded {newpath} ({received} compressed bytes)')
+
+    def download_years(self, years):
+        """Download years concurrently, using up to num_workers connections.
+
+        :param years: years to download
+        :return: list of years that could not be downloaded
+        """
+        failed = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+                futures = {executor.submit(self.download, year): year for year in years}
+                for future, year in futures.items():
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.error(f'could not download {year}: {e!r}')
+                        failed.append(year)
+        finally:
+            self.close()
+        return failed
+
+    def download_all(self):
+        return self.download_years(ALL_YEARS)
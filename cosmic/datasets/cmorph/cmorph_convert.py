@@ -1,12 +1,19 @@
+import calendar
 import datetime as dt
 from pathlib import Path
 import bz2
 import tarfile
 
+import dask
+import dask.array as da
 import numpy as np
 import iris
 
-from cosmic.config import CONSTRAINT_ASIA, CONSTRAINT_EU
+from cosmic.nc_write_profiles import save_cubes
+from cosmic.regions import get_region, load_region, load_region_cube
+
+NLAT_8KM = 1649
+NLON_8KM = 4948
 
 
 def convert_cmorph_0p25deg_3hrly_to_netcdf4_month(data_dir, output_dir, year, month):
@@ -26,10 +33,10 @@ def convert_cmorph_0p25deg_3hrly_to_netcdf4_month(data_dir, output_dir, year, mo
         times.append((curr_time - epoch).total_seconds() / 3600)
         curr_time += dt.timedelta(hours=3)
 
-    lat_coord = iris.coords.Coord(lat, standard_name='latitude', units='degrees')
-    lon_coord = iris.coords.Coord(lon, standard_name='longitude', units='degrees')
-    time_coord = iris.coords.Coord(times, standard_name='time',
-                                   units=('hours since 1970-01-01 00:00:00'))
+    lat_coord = iris.coords.DimCoord(lat, standard_name='latitude', units='degrees')
+    lon_coord = iris.coords.DimCoord(lon, standard_name='longitude', units='degrees')
+    time_coord = iris.coords.DimCoord(times, standard_name='time',
+                                      units=('hours since 1970-01-01 00:00:00'))
 
     data = _load_raw_0p25deg_3hrly_year(data_dir, year, month, '??')
 
@@ -40,18 +47,23 @@ def convert_cmorph_0p25deg_3hrly_to_netcdf4_month(data_dir, output_dir, year, mo
 
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
-    iris.save(cmorph_ppt_cube, output_dir / f'cmorph_ppt_{year}{month:02}.nc', zlib=True)
+    # Global data is only ever subset to regions: whole maps are read at each time.
+    save_cubes(cmorph_ppt_cube, output_dir / f'cmorph_ppt_{year}{month:02}.nc', profile='map',
+               fill_value=np.nan)
 
 
-def convert_cmorph_8km_30min_to_netcdf4_month(raw_filename, output_filenames, year, month):
+def _gen_8km_lat_lon():
     lon0 = 0.036378335
     dlon = 0.072756669
-    nlon = 4948
     lat0 = -59.963614
     dlat = 0.072771377
-    nlat = 1649
-    lat = np.linspace(lat0, lat0 + dlat * (nlat - 1), nlat)
-    lon = np.linspace(lon0, lon0 + dlon * (nlon - 1), nlon)
+    lat = np.linspace(lat0, lat0 + dlat * (NLAT_8KM - 1), NLAT_8KM)
+    lon = np.linspace(lon0, lon0 + dlon * (NLON_8KM - 1), NLON_8KM)
+    return lat, lon
+
+
+def convert_cmorph_8km_30min_to_netcdf4_month(raw_filename, output_filenames, year, month):
+    lat, lon = _gen_8km_lat_lon()
 
     epoch = dt.datetime(1970, 1, 1)
     start_time = dt.datetime(year, month, 1, 0, 15)
@@ -61,8 +73,8 @@ def convert_cmorph_8km_30min_to_netcdf4_month(raw_filename, output_filenames, ye
         month_end_time = dt.datetime(year + 1, 1, 1, 0, 30)
     curr_time = start_time
 
-    lat_coord = iris.coords.Coord(lat, standard_name='latitude', units='degrees')
-    lon_coord = iris.coords.Coord(lon, standard_name='longitude', units='degrees')
+    lat_coord = iris.coords.DimCoord(lat, standard_name='latitude', units='degrees')
+    lon_coord = iris.coords.DimCoord(lon, standard_name='longitude', units='degrees')
     end_time = start_time + dt.timedelta(days=1)
 
     day = 1
@@ -73,8 +85,8 @@ def convert_cmorph_8km_30min_to_netcdf4_month(raw_filename, output_filenames, ye
             curr_time += dt.timedelta(minutes=30)
         assert curr_time == end_time
 
-        time_coord = iris.coords.Coord(times, standard_name='time',
-                                       units=('hours since 1970-01-01 00:00:00'))
+        time_coord = iris.coords.DimCoord(times, standard_name='time',
+                                          units=('hours since 1970-01-01 00:00:00'))
 
         data = _load_raw_8km_3min_year(raw_filename, year, month, day)
 
@@ -83,19 +95,71 @@ def convert_cmorph_8km_30min_to_netcdf4_month(raw_filename, output_filenames, ye
                                          long_name='precipitation', units='mm hr-1',
                                          dim_coords_and_dims=coords)
 
-        iris.save(cmorph_ppt_cube, output_filenames[day], zlib=True)
+        save_cubes(cmorph_ppt_cube, output_filenames[day], profile='map', fill_value=np.nan)
         end_time += dt.timedelta(days=1)
         day += 1
 
 
+def convert_cmorph_8km_30min_to_asia_netcdf4_month(raw_filename, output_filename, year, month, num_days=None):
+    """Convert one month of raw CMORPH 8km-30min data straight to an Asia netCDF4 file.
+
+    Equivalent to running convert_cmorph_8km_30min_to_netcdf4_month then extract_asia_8km_30min, but the
+    Asia lat/lon window is worked out once and sliced directly out of each decoded raw file.
+    No global daily files are written, and the data is only read/written once.
+    Data is streamed to disk one raw (hourly) file at a time, so memory use is low.
+    Missing data is stored as NaN, with a NaN _FillValue.
+    If num_days is set, only the first num_days days of the month are converted.
+    """
+    lat, lon = _gen_8km_lat_lon()
+    lat_slice, lon_slice = get_region('asia').index_slices(lat, lon)
+    asia_lat = lat[lat_slice]
+    asia_lon = lon[lon_slice]
+
+    with tarfile.open(raw_filename) as tar:
+        members = [m for m in sorted(tar.getmembers(), key=lambda ti: ti.name) if m.isfile()]
+    # One raw file per hour, each containing 2 30min fields.
+    num_hours = calendar.monthrange(year, month)[1] * 24
+    if num_days:
+        num_hours = num_days * 24
+        members = members[:num_hours]
+    assert len(members) == num_hours, f'Expected {num_hours} files in {raw_filename}, found {len(members)}'
+
+    epoch = dt.datetime(1970, 1, 1)
+    start_time = dt.datetime(year, month, 1, 0, 15)
+    times = [(start_time + dt.timedelta(minutes=30 * i) - epoch).total_seconds() / 3600
+             for i in range(num_hours * 2)]
+
+    window_shape = (2, len(asia_lat), len(asia_lon))
+    # N.B. tar members are read directly using their offsets, so the tar index is only scanned once.
+    hourly_data = [da.from_delayed(dask.delayed(_load_raw_8km_30min_window)(raw_filename,
+                                                                            member.offset_data, member.size,
+                                                                            lat_slice, lon_slice),
+                                   window_shape, dtype=np.float32)
+                   for member in members]
+    data = da.concatenate(hourly_data, axis=0)
+
+    lat_coord = iris.coords.DimCoord(asia_lat, standard_name='latitude', units='degrees')
+    lon_coord = iris.coords.DimCoord(asia_lon, standard_name='longitude', units='degrees')
+    time_coord = iris.coords.DimCoord(times, standard_name='time',
+                                      units=('hours since 1970-01-01 00:00:00'))
+    coords = [(time_coord, 0), (lat_coord, 1), (lon_coord, 2)]
+    asia_cmorph_ppt_cube = iris.cube.Cube(data,
+                                          long_name='precipitation', units='mm hr-1',
+                                          dim_coords_and_dims=coords)
+
+    Path(output_filename).parent.mkdir(parents=True, exist_ok=True)
+    # Regional data is read both by day (AFI) and per cell (diurnal cycle analysis).
+    save_cubes(asia_cmorph_ppt_cube, output_filename, profile='balanced', fill_value=np.nan)
+
+
 def extract_asia(data_dir, year):
     # N.B. run in dir for one month: only loads data for one month.
     filenames = sorted(Path(data_dir).glob(f'cmorph_ppt_{year}??.nc'))
 
     for filename in filenames:
-        asia_cmorph_ppt_cube = iris.load_cube(str(filename), CONSTRAINT_ASIA)
+        asia_cmorph_ppt_cube = load_region_cube(filename, 'asia')
         output_filename = filename.parent / (filename.stem + '.asia.nc')
-        iris.save(asia_cmorph_ppt_cube, str(output_filename), zlib=False)
+        save_cubes(asia_cmorph_ppt_cube, output_filename, profile='balanced')
 
 
 def extract_asia_8km_30min(filenames, output_filename, year, month):
@@ -103,10 +167,9 @@ def extract_asia_8km_30min(filenames, output_filename, year, month):
     # N.B. run in dir for one month: only loads data for one month.
     # filenames = sorted(Path(data_dir).glob(f'cmorph_ppt_{year}????.nc'))
 
-    asia_cmorph_ppt_cube = iris.load([str(f) for f in filenames.values()],
-                                     CONSTRAINT_ASIA).concatenate_cube()
+    asia_cmorph_ppt_cube = load_region(list(filenames.values()), 'asia').concatenate_cube()
     # Compression saves A LOT of space: 5.0G -> 67M.
-    iris.save(asia_cmorph_ppt_cube, str(output_filename), zlib=True)
+    save_cubes(asia_cmorph_ppt_cube, output_filename, profile='balanced')
 
 
 def extract_europe_8km_30min(data_dir, year, month):
@@ -115,12 +178,12 @@ def extract_europe_8km_30min(data_dir, year, month):
     # N.B. run in dir for one month: only loads data for one month.
     filenames = sorted(Path(data_dir).glob(f'cmorph_ppt_{year}????.nc'))
 
-    eu_cmorph_ppt_cube = iris.load([str(f) for f in filenames], CONSTRAINT_EU).concatenate_cube()
+    eu_cmorph_ppt_cube = load_region(filenames, 'europe').concatenate_cube()
     output_filename = data_dir / (f'cmorph_ppt_{year}{month:02}.europe.nc')
-    iris.save(eu_cmorph_ppt_cube.intersection(longitude=(-22, 37)), str(output_filename), zlib=True)
+    save_cubes(eu_cmorph_ppt_cube, output_filename, profile='balanced')
 
 
-def _load_raw_0p25deg_3hrly_year(data_dir, year, month):
+def _load_raw_0p25deg_3hrly_year(data_dir, year, month, day):
     if isinstance(year, int):
         year = f'{year:04}'
     if isinstance(month, int):
@@ -129,43 +192,64 @@ def _load_raw_0p25deg_3hrly_year(data_dir, year, month):
         day = f'{day:02}'
 
     filenames = sorted(Path(data_dir).glob(f'CMORPH_V1.0_ADJ_0.25deg-3HLY_{year}{month}{day}.bz2'))
-    data = []
-    for filename in filenames:
+    # Decode straight into one preallocated array: no per-file arrays or masks.
+    data = np.empty((len(filenames), 8, 480, 1440), dtype=np.float32)
+    for i, filename in enumerate(filenames):
         print(filename)
-        data.append(_load_raw_0p25deg_3hrly(filename))
-    return np.ma.masked_array(data)
+        _load_raw_0p25deg_3hrly(filename, out=data[i])
+    return data
 
 
 def _load_raw_8km_3min_year(filename, year, month, day):
-    data = []
     with tarfile.open(filename) as tar:
-        for member in [m for m in sorted(tar.getmembers(), key=lambda ti: ti.name) if m.isfile()]:
-            # member.name == '199801/CMORPH_V1.0_ADJ_8km-30min_1998010408.bz2'
-            if member.name[-8:-6] == f'{day:02}':
-                print(member)
-                data.append(_load_raw_8km_30min(tar.extractfile(member)))
-    return np.ma.masked_array(data)
+        # member.name == '199801/CMORPH_V1.0_ADJ_8km-30min_1998010408.bz2'
+        members = [m for m in sorted(tar.getmembers(), key=lambda ti: ti.name)
+                   if m.isfile() and m.name[-8:-6] == f'{day:02}']
+        data = np.empty((len(members), 2, NLAT_8KM, NLON_8KM), dtype=np.float32)
+        for i, member in enumerate(members):
+            print(member)
+            _load_raw_8km_30min(tar.extractfile(member), out=data[i])
+    return data
+
+
+def _read_raw_cmorph(fp, out):
+    """Decompress raw CMORPH data directly into out, replacing missing values (-999) with NaN."""
+    buf = memoryview(out.reshape(-1)).cast('B')
+    nbytes = 0
+    with bz2.open(fp) as bzfp:
+        while nbytes < len(buf):
+            nread = bzfp.readinto(buf[nbytes:])
+            if not nread:
+                raise IOError(f'Raw CMORPH data too short: expected {len(buf)} bytes, read {nbytes}')
+            nbytes += nread
+    out[out == -999] = np.nan
+    return out
 
 
-def _load_raw_0p25deg_3hrly(filename):
-    with bz2.open(filename) as fp:
-        buf = fp.read()
-        raw_cmorph_data = np.frombuffer(buf, '<f4')
+def _load_raw_0p25deg_3hrly(filename, out=None):
+    if out is None:
+        out = np.empty((8, 480, 1440), dtype=np.float32)
+    _read_raw_cmorph(filename, out)
 
     # Data is in mm/3hr, convert to mm/hr.
-    masked_cmorph_data = np.ma.masked_array(raw_cmorph_data,
-                                            raw_cmorph_data == -999).reshape(8, 480, 1440) / 3
+    out /= 3
+    return out
 
-    return masked_cmorph_data
 
+def _load_raw_8km_30min(fp, out=None):
+    if out is None:
+        out = np.empty((2, NLAT_8KM, NLON_8KM), dtype=np.float32)
+    # Data is in mm/hr
+    return _read_raw_cmorph(fp, out)
 
-def _load_raw_8km_30min(fp):
-    with bz2.open(fp) as bzfp:
-        buf = bzfp.read()
-        raw_cmorph_data = np.frombuffer(buf, '<f4')
 
-    # Data is in mm/hr
-    masked_cmorph_data = np.ma.masked_array(raw_cmorph_data,
-                                            raw_cmorph_data == -999).reshape(2, 1649, 4948)
+def _load_raw_8km_30min_window(raw_filename, offset, size, lat_slice, lon_slice):
+    with open(raw_filename, 'rb') as fp:
+        fp.seek(offset)
+        buf = bz2.decompress(fp.read(size))
+    # Copy the window so that the full decoded buffer can be freed straight away.
+    raw_cmorph_data = np.frombuffer(buf, '<f4').reshape(2, NLAT_8KM, NLON_8KM)[:, lat_slice, lon_slice].copy()
 
-    return masked_cmorph_data
+    # Data is in mm/hr
+    raw_cmorph_data[raw_cmorph_data == -999] = np.nan
+    return raw_cmorph_data
@@ -2,14 +2,23 @@ import os
 import sys
 import datetime as dt
 import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
+import ftplib
 from ftplib import FTP
 
+from cosmic.cosmic_errors import CosmicError
+
 
 logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
                     format='%(asctime)s %(levelname)8s: %(message)s')
 logger = logging.getLogger(__name__)
 
+CMORPH_FTP_HOST = 'ftp.cpc.ncep.noaa.gov'
+
 
 def range_years_months_days(start_date, end_date):
     current_date = start_date
@@ -34,6 +43,16 @@ def range_years_months(start_date, end_date):
     return years_months
 
 
+def ftp_filepath_0p25deg_3hrly(year, month, day):
+    filename = f'CMORPH_V1.0_ADJ_0.25deg-3HLY_{year}{month:02}{day:02}.bz2'
+    return f'/precip/CMORPH_V1.0/CRT/0.25deg-3HLY/{year}/{year}{month:02}/{filename}'
+
+
+def ftp_filepath_8km_30min(year, month):
+    filename = f'CMORPH_V1.0_ADJ_8km-30min_{year}{month:02}.tar'
+    return f'/precip/CMORPH_V1.0/CRT/8km-30min/{year}/{filename}'
+
+
 class CmorphDownloader():
     def __init__(self, download_dir):
         self.download_dir = Path(download_dir)
@@ -43,7 +62,7 @@ class CmorphDownloader():
 
     def _download(self, ftp_filepath, local_filepath):
         print(f'downloading {ftp_filepath} to {local_filepath}')
-        ftp = FTP('ftp.cpc.ncep.noaa.gov')
+        ftp = FTP(CMORPH_FTP_HOST)
         ftp.login()
         with open(local_filepath, 'wb') as fp:
             ftp.retrbinary(f'RETR {ftp_filepath}', fp.write)
@@ -65,7 +84,7 @@ class CmorphDownloader():
             return
 
         logger.info(f'downloading file: {filename.stem}')
-        ftp_filepath = f'/precip/CMORPH_V1.0/CRT/0.25deg-3HLY/{year}/{year}{month:02}/{filename}'
+        ftp_filepath = ftp_filepath_0p25deg_3hrly(year, month, day)
 
         self._download(ftp_filepath, compressed_filepath)
 
@@ -77,6 +96,189 @@ class CmorphDownloader():
             return
 
         logger.info(f'downloading file: {filename.stem}')
-        ftp_filepath = f'/precip/CMORPH_V1.0/CRT/8km-30min/{year}/{filename}'
+        ftp_filepath = ftp_filepath_8km_30min(year, month)
 
         self._download(ftp_filepath, filepath)
+
+
+class PooledCmorphDownloader(CmorphDownloader):
+    """Download CMORPH files concurrently over a small pool of persistent FTP sessions.
+
+    Files are downloaded to <filename>.part and renamed when complete, so a file that exists is always a
+    complete download. Partial .part files are resumed using REST. Sizes are checked against the server
+    listing (MLSD, or SIZE if MLSD is not supported), both after download and for files that already exist.
+
+    example usage:
+        with PooledCmorphDownloader('cmorph_data/raw', num_sessions=4) as dl:
+            dl.download_range_0p25deg_3hrly(dt.datetime(1998, 1, 1), dt.datetime(1999, 1, 1))
+    """
+    def __init__(self, download_dir, num_sessions=4, host=CMORPH_FTP_HOST, port=21,
+                 user='', passwd='', timeout=60, max_retries=3):
+        super().__init__(download_dir)
+        self.num_sessions = num_sessions
+        self.host = host
+        self.port = port
+        self.user = user
+        self.passwd = passwd
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        self._sessions = queue.Queue()
+        self._num_open_sessions = 0
+        self._lock = threading.Lock()
+        self._dir_sizes = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _connect(self):
+        logger.debug(f'opening FTP session to {self.host}:{self.port}')
+        ftp = FTP()
+        ftp.connect(self.host, self.port, timeout=self.timeout)
+        ftp.login(self.user, self.passwd)
+        ftp.voidcmd('TYPE I')
+        return ftp
+
+    @contextmanager
+    def _session(self):
+        """Borrow a session from the pool, opening a new one if fewer than num_sessions are open.
+
+        Sessions that raise an error are closed and not returned to the pool.
+        """
+        ftp = None
+        with self._lock:
+            if self._sessions.empty() and self._num_open_sessions < self.num_sessions:
+                self._num_open_sessions += 1
+                open_new = True
+            else:
+                open_new = False
+        try:
+            ftp = self._connect() if open_new else self._sessions.get()
+            yield ftp
+        except Exception:
+            if ftp is not None:
+                try:
+                    ftp.close()
+                except ftplib.all_errors:
+                    pass
+            with self._lock:
+                self._num_open_sessions -= 1
+            raise
+        else:
+            self._sessions.put(ftp)
+
+    def close(self):
+        while not self._sessions.empty():
+            ftp = self._sessions.get()
+            try:
+                ftp.quit()
+            except ftplib.all_errors:
+                ftp.close()
+            with self._lock:
+                self._num_open_sessions -= 1
+
+    def _remote_size(self, ftp, ftp_filepath):
+        """Size of file on server, from a (cached) MLSD listing of its dir, or SIZE.
+
+        :return: size in bytes, or None if the server does not report it
+        """
+        dirname, filename = ftp_filepath.rsplit('/', 1)
+        with self._lock:
+            dir_sizes = self._dir_sizes.get(dirname)
+        if dir_sizes is None:
+            try:
+                dir_sizes = {name: int(facts['size'])
+                             for name, facts in ftp.mlsd(dirname, facts=['size', 'type'])
+                             if facts.get('type') == 'file' and 'size' in facts}
+            except ftplib.error_perm:
+                # MLSD not supported: fall back to SIZE for each file.
+                dir_sizes = {}
+            with self._lock:
+                self._dir_sizes[dirname] = dir_sizes
+        if filename in dir_sizes:
+            return dir_sizes[filename]
+        try:
+            return ftp.size(ftp_filepath)
+        except ftplib.error_perm:
+            return None
+
+    def _download_once(self, ftp_filepath, local_filepath):
+        part_filepath = local_filepath.parent / (local_filepath.name + '.part')
+        with self._session() as ftp:
+            remote_size = self._remote_size(ftp, ftp_filepath)
+            if local_filepath.exists():
+                local_size = local_filepath.stat().st_size
+                if remote_size is None or local_size == remote_size:
+                    logger.info(f'{local_filepath} exists: skipping')
+                    return
+                logger.warning(f'{local_filepath} size {local_size} != server size {remote_size}: '
+                               're-downloading')
+                local_filepath.unlink()
+
+            offset = part_filepath.stat().st_size if part_filepath.exists() else 0
+            if remote_size is not None and offset > remote_size:
+                logger.warning(f'{part_filepath} larger than server file: restarting')
+                offset = 0
+            if offset:
+                logger.info(f'resuming {ftp_filepath} from byte {offset}')
+            else:
+                logger.info(f'downloading {ftp_filepath}')
+
+            if remote_size is None or offset < remote_size:
+                with open(part_filepath, 'ab' if offset else 'wb') as fp:
+                    ftp.retrbinary(f'RETR {ftp_filepath}', fp.write, rest=offset or None)
+
+        downloaded_size = part_filepath.stat().st_size
+        if remote_size is not None and downloaded_size != remote_size:
+            raise CosmicError(f'{part_filepath} size {downloaded_size} != server size {remote_size}')
+        part_filepath.rename(local_filepath)
+        logger.info(f'downloaded {local_filepath}')
+
+    def _download(self, ftp_filepath, local_filepath):
+        local_filepath = Path(local_filepath)
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                return self._download_once(ftp_filepath, local_filepath)
+            except (CosmicError,) + ftplib.all_errors as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f'attempt {attempt} failed for {ftp_filepath}: {e!r}, retrying')
+
+    def download_files(self, ftp_local_filepaths):
+        """Download files concurrently, using up to num_sessions sessions.
+
+        :param ftp_local_filepaths: list of (ftp_filepath, local_filepath) tuples
+        :return: list of ftp_filepaths that could not be downloaded
+        """
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.num_sessions) as executor:
+            futures = {executor.submit(self._download, ftp_filepath, local_filepath): ftp_filepath
+                       for ftp_filepath, local_filepath in ftp_local_filepaths}
+            for future, ftp_filepath in futures.items():
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f'could not download {ftp_filepath}: {e!r}')
+                    failed.append(ftp_filepath)
+        return failed
+
+    def download_range_0p25deg_3hrly(self,
+                                     start_date=dt.datetime(1998, 1, 1),
+                                     end_date=dt.datetime.now()):
+        ftp_local_filepaths = []
+        for year, month, day in range_years_months_days(start_date, end_date):
+            ftp_filepath = ftp_filepath_0p25deg_3hrly(year, month, day)
+            ftp_local_filepaths.append((ftp_filepath, self.download_dir / Path(ftp_filepath).name))
+        return self.download_files(ftp_local_filepaths)
+
+    def download_range_8km_30min(self,
+                                 start_date=dt.datetime(1998, 1, 1),
+                                 end_date=dt.datetime.now()):
+        ftp_local_filepaths = []
+        for year, month in range_years_months(start_date, end_date):
+            ftp_filepath = ftp_filepath_8km_30min(year, month)
+            ftp_local_filepaths.append((ftp_filepath, self.download_dir / Path(ftp_filepath).name))
+        return self.download_files(ftp_local_filepaths)
@@ -0,0 +1,163 @@
+"""Lazy, memory-mapped access to raw CMORPH data.
+
+Raw CMORPH files are bz2 compressed, flat, little-endian float32 grids. Each raw file is decompressed once
+into a local cache directory, after which it is accessed through an np.memmap. The data is exposed as a
+lazy (dask) array on an iris cube with proper time/lat/lon coords. Subsetting the cube (e.g. extracting a
+region) before realising the data means only the required pages are read from the cache.
+
+example usage:
+    cube = load_raw_8km_30min_month_cube('CMORPH_V1.0_ADJ_8km-30min_199801.tar', 1998, 1, 'cmorph_cache')
+    asia_cube = cube[:, 837:1595, 782:2077]
+    dask_array = asia_cube.lazy_data()
+"""
+import bz2
+import calendar
+import datetime as dt
+import os
+import shutil
+import sys
+import logging
+import tarfile
+from pathlib import Path
+
+import dask.array as da
+import numpy as np
+import iris
+
+from cosmic.datasets.cmorph.cmorph_convert import NLAT_8KM, NLON_8KM, _gen_8km_lat_lon
+
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
+RAW_8KM_30MIN_SHAPE = (2, NLAT_8KM, NLON_8KM)
+RAW_0P25DEG_3HRLY_SHAPE = (8, 480, 1440)
+
+
+class CmorphRawCache:
+    """Cache of decompressed raw CMORPH files.
+
+    Each raw .bz2 file is decompressed (streamed, so low memory) to <cache_dir>/<name>.f4, which can then be
+    opened as an np.memmap. Files are written to a temporary path and renamed so that an interrupted
+    decompression never leaves a partial file in the cache.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def cache_path(self, raw_name):
+        # e.g. 199801/CMORPH_V1.0_ADJ_8km-30min_1998010408.bz2 -> CMORPH_V1.0_ADJ_8km-30min_1998010408.f4
+        return self.cache_dir / (Path(raw_name).stem + '.f4')
+
+    def _decompress_to_cache(self, fp, cache_path):
+        tmp_path = cache_path.parent / ('.tmp.' + cache_path.name)
+        with bz2.open(fp) as bzfp, open(tmp_path, 'wb') as cache_fp:
+            shutil.copyfileobj(bzfp, cache_fp, 16 * 1024 * 1024)
+        tmp_path.rename(cache_path)
+
+    def cache_tar(self, tar_filename):
+        """Decompress all members of a raw CMORPH tar file into the cache.
+
+        :param tar_filename: raw CMORPH tar file (e.g. CMORPH_V1.0_ADJ_8km-30min_199801.tar)
+        :return: sorted list of paths to cached files
+        """
+        cache_paths = []
+        with tarfile.open(tar_filename) as tar:
+            for member in [m for m in sorted(tar.getmembers(), key=lambda ti: ti.name) if m.isfile()]:
+                cache_path = self.cache_path(member.name)
+                if not cache_path.exists():
+                    logger.debug(f'caching {member.name}')
+                    self._decompress_to_cache(tar.extractfile(member), cache_path)
+                cache_paths.append(cache_path)
+        return cache_paths
+
+    def cache_files(self, filenames):
+        """Decompress raw CMORPH .bz2 files into the cache.
+
+        :param filenames: raw CMORPH .bz2 files
+        :return: sorted list of paths to cached files
+        """
+        cache_paths = []
+        for filename in sorted(filenames):
+            cache_path = self.cache_path(filename)
+            if not cache_path.exists():
+                logger.debug(f'caching {filename}')
+                self._decompress_to_cache(filename, cache_path)
+            cache_paths.append(cache_path)
+        return cache_paths
+
+
+def memmap_dask_array(cache_paths, shape):
+    """Build a lazy array from cached raw files, one chunk per file.
+
+    :param cache_paths: cached files, each with the given shape
+    :param shape: shape of the data in each file (first dim is time)
+    :return: dask array with shape (len(cache_paths) * shape[0], shape[1], shape[2]).
+    """
+    arrays = []
+    for cache_path in cache_paths:
+        mmap = np.memmap(cache_path, dtype='<f4', mode='r', shape=shape)
+        # Passing a name avoids dask hashing the contents of each file.
+        arrays.append(da.from_array(mmap, chunks=shape, name=f'cmorph-raw-{cache_path.stem}'))
+    raw_data = da.concatenate(arrays, axis=0)
+    # Missing values are NaN, consistent with the converted netCDF files.
+    return da.where(raw_data == -999, np.float32(np.nan), raw_data)
+
+
+def _build_cube(data, times, lat, lon):
+    lat_coord = iris.coords.DimCoord(lat, standard_name='latitude', units='degrees')
+    lon_coord = iris.coords.DimCoord(lon, standard_name='longitude', units='degrees')
+    time_coord = iris.coords.DimCoord(times, standard_name='time',
+                                      units=('hours since 1970-01-01 00:00:00'))
+    coords = [(time_coord, 0), (lat_coord, 1), (lon_coord, 2)]
+    return iris.cube.Cube(data, long_name='precipitation', units='mm hr-1', dim_coords_and_dims=coords)
+
+
+def load_raw_8km_30min_month_cube(raw_tar_filename, year, month, cache_dir):
+    """Load one month of raw 8km-30min CMORPH data as a lazy cube, backed by memmaps of the cached data.
+
+    :param raw_tar_filename: raw CMORPH tar file for year/month
+    :param year: year of data
+    :param month: month of data
+    :param cache_dir: directory to cache decompressed files in
+    :return: precipitation cube (mm hr-1) with lazy data
+    """
+    cache_paths = CmorphRawCache(cache_dir).cache_tar(raw_tar_filename)
+    num_hours = calendar.monthrange(year, month)[1] * 24
+    assert len(cache_paths) == num_hours, f'Expected {num_hours} files, found {len(cache_paths)}'
+
+    epoch = dt.datetime(1970, 1, 1)
+    start_time = dt.datetime(year, month, 1, 0, 15)
+    times = [(start_time + dt.timedelta(minutes=30 * i) - epoch).total_seconds() / 3600
+             for i in range(num_hours * 2)]
+    lat, lon = _gen_8km_lat_lon()
+
+    # Data is in mm/hr
+    data = memmap_dask_array(cache_paths, RAW_8KM_30MIN_SHAPE)
+    return _build_cube(data, times, lat, lon)
+
+
+def load_raw_0p25deg_3hrly_month_cube(data_dir, year, month, cache_dir):
+    """Load one month of raw 0.25deg-3hrly CMORPH data as a lazy cube, backed by memmaps of the cached data.
+
+    :param data_dir: directory containing the raw daily CMORPH files
+    :param year: year of data
+    :param month: month of data
+    :param cache_dir: directory to cache decompressed files in
+    :return: precipitation cube (mm hr-1) with lazy data
+    """
+    filenames = Path(data_dir).glob(f'CMORPH_V1.0_ADJ_0.25deg-3HLY_{year}{month:02}??.bz2')
+    cache_paths = CmorphRawCache(cache_dir).cache_files(filenames)
+    num_days = calendar.monthrange(year, month)[1]
+    assert len(cache_paths) == num_days, f'Expected {num_days} files, found {len(cache_paths)}'
+
+    epoch = dt.datetime(1970, 1, 1)
+    start_time = dt.datetime(year, month, 1, 1, 30)
+    times = [(start_time + dt.timedelta(hours=3 * i) - epoch).total_seconds() / 3600
+             for i in range(num_days * 8)]
+    lat = np.linspace(-59.875, 59.875, 480)
+    lon = np.linspace(0.125, 360 - 0.125, 1440)
+
+    # Data is in mm/3hr, convert to mm/hr.
+    data = memmap_dask_array(cache_paths, RAW_0P25DEG_3HRLY_SHAPE) / 3
+    return _build_cube(data, times, lat, lon)
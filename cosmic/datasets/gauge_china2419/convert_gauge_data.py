@@ -1,9 +1,28 @@
+import os
+import sys
+import logging
+from multiprocessing import Pool
 from pathlib import Path
 from argparse import ArgumentParser
+from timeit import default_timer as timer
 
+import numpy as np
 import pandas as pd
 
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
 BASEDIR = Path('/home/markmuetz/Datasets/gauge_china2419/pre/SURF_CLI_CHN_PRE_MUT_HOMO/SURF_CLI_CHN_PRE_MUT_HOMO')
+# HDF table store: station_info, and precip partitioned by year under keys precip/y<year>.
+STORE_FILENAME = 'station_data_by_year.hdf'
+PRECIP_DTYPES = {
+    'year': np.int16,
+    'month': np.int8,
+    'day': np.int8,
+    'precip': np.float32,
+    'station_id': np.int32,
+}
 
 
 def read_station_precip_data(basedir):
@@ -21,6 +40,62 @@ def read_station_precip_data(basedir):
     return df_precip
 
 
+def _parse_station_file(filename):
+    """Parse one station file (whitespace separated year, month, day, precip) into compact arrays."""
+    names = ['year', 'month', 'day', 'precip']
+    df_station = pd.read_csv(filename, header=None, sep=r'\s+', names=names,
+                             dtype={name: PRECIP_DTYPES[name] for name in names}, engine='c')
+    arrays = {name: df_station[name].values for name in names}
+    arrays['station_id'] = np.full(len(df_station), int(filename.stem[-5:]), dtype=PRECIP_DTYPES['station_id'])
+    return arrays
+
+
+def bulk_read_station_precip_data(basedir, num_procs=os.cpu_count()):
+    """Parse all station files in parallel into one DataFrame with compact dtypes.
+
+    :param basedir: base directory of dataset
+    :param num_procs: number of processes to parse files with
+    :return: DataFrame with columns year, month, day, precip, station_id, datetime
+    """
+    filenames = sorted((basedir / 'datasets/DAY').glob('SURF_CLI_CHN_PRE_MUT_HOMO-DAY-?????.txt'))
+    logger.info(f'parsing {len(filenames)} station files using {num_procs} processes')
+    with Pool(num_procs) as pool:
+        station_arrays = pool.map(_parse_station_file, filenames, chunksize=16)
+
+    df_precip = pd.DataFrame({col: np.concatenate([arrays[col] for arrays in station_arrays])
+                              for col in PRECIP_DTYPES})
+    # Vectorised: months since epoch + days.
+    months = (df_precip.year.values.astype(np.int64) - 1970) * 12 + df_precip.month.values - 1
+    df_precip['datetime'] = (months.astype('datetime64[M]').astype('datetime64[D]') +
+                             (df_precip.day.values.astype(np.int64) - 1).astype('timedelta64[D]'))
+    return df_precip
+
+
+def write_station_data_store(store_path, df_station_info, df_precip):
+    """Write station info, and precip as one table per year indexed on station_id and datetime.
+
+    Reads of a date range only need to open the partitions for those years, and reads of a set of stations
+    can use the table indexes.
+    """
+    with pd.HDFStore(store_path, mode='w', complevel=4, complib='blosc:lz4') as store:
+        store.put('station_info', df_station_info)
+        for year, df_year in df_precip.groupby('year', sort=True):
+            df_year = df_year.sort_values(['station_id', 'datetime'])
+            key = f'precip/y{year}'
+            store.put(key, df_year.reset_index(drop=True), format='table',
+                      data_columns=['station_id', 'datetime'], index=False)
+            store.create_table_index(key, columns=['station_id', 'datetime'], optlevel=9, kind='full')
+
+
+def convert_station_data(basedir, num_procs=os.cpu_count()):
+    start = timer()
+    df_station_info = read_station_info(basedir)
+    df_precip = bulk_read_station_precip_data(basedir, num_procs)
+    logger.info(f'  parsed {len(df_precip)} rows in {timer() - start:.02f}s')
+    write_station_data_store(basedir / STORE_FILENAME, df_station_info, df_precip)
+    logger.info(f'  converted in: {timer() - start:.02f}s')
+
+
 def read_station_info(basedir):
     df_station_info = pd.read_excel(basedir / 'documents' / 'SURF_CLI_CHN_PRE_MUT_HOMO_STATION.xls', 
                                     names=['station_id', 'station_name', 'province', 'level', 'lat_0p01deg', 'lon_0p01deg', 'alt_m', 'alt_p', 'start_date', 'end_date'],
@@ -42,8 +117,4 @@ if __name__ == '__main__':
     args = parser.parse_args()
     basedir = Path(args.basedir)
 
-    df_station_info = read_station_info(basedir)
-    df_precip = read_station_precip_data(basedir)
-
-    df_station_info.to_hdf(basedir / 'station_data.hdf', 'station_info')
-    df_precip.to_hdf(basedir / 'station_data.hdf', 'precip')
+    convert_station_data(basedir)
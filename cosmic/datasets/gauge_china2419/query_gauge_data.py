@@ -0,0 +1,87 @@
+"""Queries on the year-partitioned gauge store written by convert_gauge_data.
+
+Only the partitions for the years in the date range are opened, and only rows matching the date range (and
+stations) are read, using the table indexes on datetime and station_id.
+
+example usage:
+    df_precip_jja = query_gauge_precip(store_path, dt.datetime(2009, 6, 1), dt.datetime(2009, 8, 31),
+                                       bbox=(97.5, 125, 18, 41))
+    df_station_jja = calc_station_mean_precip(load_station_info(store_path), df_precip_jja)
+"""
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+MISSING_VALUE = -999
+# Above this many stations, select by date only and filter the stations after reading: large "in" queries
+# are not handled efficiently by pytables.
+MAX_STATIONS_IN_QUERY = 31
+
+
+def load_station_info(store_path):
+    return pd.read_hdf(store_path, 'station_info')
+
+
+def stations_in_bbox(df_station_info, bbox):
+    """Station ids in bbox.
+
+    :param df_station_info: station info, with lat/lon columns
+    :param bbox: (lon_min, lon_max, lat_min, lat_max), inclusive
+    :return: array of station ids
+    """
+    lon_min, lon_max, lat_min, lat_max = bbox
+    in_bbox = (df_station_info.lon.between(lon_min, lon_max) &
+               df_station_info.lat.between(lat_min, lat_max))
+    return df_station_info.station_id[in_bbox].values
+
+
+def query_gauge_precip(store_path, start_date, end_date, station_ids=None, bbox=None):
+    """Read gauge precip for a date range, and optionally a subset of stations.
+
+    :param store_path: path to store written by convert_gauge_data.write_station_data_store
+    :param start_date: first date to read (inclusive)
+    :param end_date: last date to read (inclusive)
+    :param station_ids: station ids to read
+    :param bbox: (lon_min, lon_max, lat_min, lat_max) - only read stations in bbox
+    :return: DataFrame of precip, with missing values as NaN
+    """
+    start_date = pd.Timestamp(start_date)
+    end_date = pd.Timestamp(end_date)
+    with pd.HDFStore(store_path, mode='r') as store:
+        if bbox is not None:
+            bbox_station_ids = stations_in_bbox(store['station_info'], bbox)
+            if station_ids is None:
+                station_ids = bbox_station_ids
+            else:
+                station_ids = np.intersect1d(station_ids, bbox_station_ids)
+        if station_ids is not None:
+            station_ids = [int(s) for s in station_ids]
+
+        where = ['datetime >= start_date', 'datetime <= end_date']
+        filter_stations = station_ids is not None and len(station_ids) > MAX_STATIONS_IN_QUERY
+        if station_ids is not None and not filter_stations:
+            where.append('station_id in station_ids')
+
+        dfs = []
+        for year in range(start_date.year, end_date.year + 1):
+            key = f'precip/y{year}'
+            if key not in store:
+                continue
+            df_year = store.select(key, where=where)
+            if filter_stations:
+                df_year = df_year[df_year.station_id.isin(station_ids)]
+            dfs.append(df_year)
+
+    if dfs:
+        df_precip = pd.concat(dfs, ignore_index=True)
+    else:
+        df_precip = pd.DataFrame(columns=['year', 'month', 'day', 'precip', 'station_id', 'datetime'])
+    df_precip['precip'] = df_precip.precip.where(df_precip.precip != MISSING_VALUE)
+    return df_precip
+
+
+def calc_station_mean_precip(df_station_info, df_precip):
+    """Mean precip at each station (ignoring missing values), merged with the station info."""
+    df_station_mean = df_precip.groupby('station_id')[['precip']].mean()
+    return pd.merge(df_station_info, df_station_mean, on='station_id')
@@ -2,7 +2,11 @@
 
 See e.g. https://en.wikipedia.org/wiki/Fourier_series for formulae used."""
 import numpy as np
-import scipy.integrate as integrate
+try:
+    from scipy.integrate import simpson
+except ImportError:
+    # scipy < 1.6.
+    from scipy.integrate import simps as simpson
 from typing import Iterable, List, Tuple
 
 
@@ -90,11 +94,11 @@ def fourier_coeffs(s: np.ndarray, x: np.ndarray, max_n: int = 5) \
     # How? Construct a tuple object as a slice like e.g. (:, None, None) for a 3D array.
     # Ensures that result of np.sin(...) is correctly broadcast along the first dim of s.
     s_slice = tuple([slice(None)] + (s.ndim - 1) * [None])
-    a.append(2 / L * integrate.simps(s, x, axis=0))
+    a.append(2 / L * simpson(s, x, axis=0))
     b.append(0 if s.ndim == 1 else np.zeros(s.shape[1:]))
     for n in range(1, max_n + 1):
-        a.append(2 / L * integrate.simps(s * np.cos(2 * np.pi / L * n * x)[s_slice], x, axis=0))
-        b.append(2 / L * integrate.simps(s * np.sin(2 * np.pi / L * n * x)[s_slice], x, axis=0))
+        a.append(2 / L * simpson(s * np.cos(2 * np.pi / L * n * x)[s_slice], x, axis=0))
+        b.append(2 / L * simpson(s * np.sin(2 * np.pi / L * n * x)[s_slice], x, axis=0))
     return a, b
 
 
@@ -0,0 +1,145 @@
+"""Named netCDF write profiles: chunk shapes, compression level and shuffle matched to how a file is read.
+
+Profiles:
+    map: one chunk per time for the full spatial domain. Best for reading whole maps at one time
+        (e.g. plotting, regridding, extracting a region from global data).
+    timeseries: small spatial tiles holding many times. Best for per-cell analyses
+        (e.g. diurnal cycle, harmonic analysis, time series at a point or basin).
+    balanced: moderate time and spatial chunking. A reasonable compromise for data that is read both
+        ways, e.g. regional data read one day at a time by the AFI low_mem method.
+
+example usage:
+    save_cubes(cubes, 'output.nc', profile='timeseries')
+"""
+import os
+import sys
+import logging
+
+import numpy as np
+import iris
+from iris.fileformats.netcdf import Saver, CF_CONVENTIONS_VERSION
+
+from cosmic.cosmic_errors import CosmicError
+
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
+# Max. uncompressed size of one chunk: larger chunks exceed the default netCDF chunk cache.
+MAX_CHUNK_BYTES = 4 * 1024 * 1024
+
+# time_chunk/spatial_chunk: None means the full length of that dimension.
+WRITE_PROFILES = {
+    'map': {
+        'time_chunk': 1,
+        'spatial_chunk': None,
+        'complevel': 4,
+        'shuffle': True,
+    },
+    'timeseries': {
+        'time_chunk': None,
+        'spatial_chunk': 16,
+        'complevel': 4,
+        'shuffle': True,
+    },
+    'balanced': {
+        'time_chunk': 24,
+        'spatial_chunk': 64,
+        'complevel': 4,
+        'shuffle': True,
+    },
+}
+
+
+def _dim_roles(cube):
+    """Map each dim of cube to 'time', 'spatial' or None."""
+    roles = [None] * cube.ndim
+    for coord in cube.coords(dim_coords=True):
+        dim = cube.coord_dims(coord)[0]
+        axis = iris.util.guess_coord_axis(coord)
+        if axis == 'T':
+            roles[dim] = 'time'
+        elif axis in ['X', 'Y']:
+            roles[dim] = 'spatial'
+    return roles
+
+
+def profile_chunksizes(cube, profile):
+    """Chunk sizes for cube under a given write profile.
+
+    Dims that are not time or spatial (lat/lon or grid_lat/grid_lon) are not chunked. The time chunk is
+    reduced if necessary to keep the chunk below MAX_CHUNK_BYTES.
+
+    :param cube: cube to be saved
+    :param profile: name of profile in WRITE_PROFILES
+    :return: tuple of chunk sizes, or None for scalar cubes
+    """
+    if profile not in WRITE_PROFILES:
+        raise CosmicError(f'Unknown write profile: {profile}, must be one of {list(WRITE_PROFILES)}')
+    if cube.ndim == 0:
+        return None
+    profile_settings = WRITE_PROFILES[profile]
+
+    roles = _dim_roles(cube)
+    chunksizes = list(cube.shape)
+    for dim, role in enumerate(roles):
+        if role == 'spatial' and profile_settings['spatial_chunk']:
+            chunksizes[dim] = min(cube.shape[dim], profile_settings['spatial_chunk'])
+    if 'time' in roles:
+        time_dim = roles.index('time')
+        other_size = int(np.prod([c for d, c in enumerate(chunksizes) if d != time_dim]))
+        max_time_chunk = max(1, MAX_CHUNK_BYTES // (other_size * cube.dtype.itemsize))
+        time_chunk = profile_settings['time_chunk'] or cube.shape[time_dim]
+        chunksizes[time_dim] = min(cube.shape[time_dim], time_chunk, max_time_chunk)
+    return tuple(chunksizes)
+
+
+def _local_keys(cubes):
+    # Attributes that are not common to all cubes (with the same value) are stored on the data variables,
+    # as in iris.save.
+    local_keys = set()
+    attributes = cubes[0].attributes
+    common_keys = set(attributes)
+    for cube in cubes[1:]:
+        keys = set(cube.attributes)
+        local_keys.update(keys.symmetric_difference(common_keys))
+        common_keys.intersection_update(keys)
+        different_value_keys = [k for k in common_keys
+                                if not iris.util._attribute_equal(attributes[k], cube.attributes[k])]
+        common_keys.difference_update(different_value_keys)
+        local_keys.update(different_value_keys)
+    return local_keys
+
+
+def save_cubes(cubes, filename, profile='balanced', fill_value=None, unlimited_dimensions=None):
+    """Save cube(s) to one netCDF4 file, using the chunking/compression of the given write profile.
+
+    Unlike iris.save(..., chunksizes=...), the chunk sizes are worked out separately for each cube so that
+    cubes with different shapes can be saved to the same file.
+
+    :param cubes: cube or iterable of cubes
+    :param filename: output filename
+    :param profile: name of profile in WRITE_PROFILES
+    :param fill_value: fill value to use for all cubes (e.g. np.nan)
+    :param unlimited_dimensions: as for iris.save
+    """
+    if isinstance(cubes, iris.cube.Cube):
+        cubes = iris.cube.CubeList([cubes])
+    if profile not in WRITE_PROFILES:
+        raise CosmicError(f'Unknown write profile: {profile}, must be one of {list(WRITE_PROFILES)}')
+    profile_settings = WRITE_PROFILES[profile]
+    local_keys = _local_keys(cubes)
+
+    logger.debug(f'saving {len(cubes)} cube(s) to {filename} with profile {profile}')
+    with Saver(str(filename), 'NETCDF4') as sman:
+        for cube in cubes:
+            chunksizes = profile_chunksizes(cube, profile)
+            logger.debug(f'  {cube.name()}: chunksizes={chunksizes}')
+            sman.write(cube, local_keys=local_keys,
+                       unlimited_dimensions=unlimited_dimensions,
+                       zlib=True,
+                       complevel=profile_settings['complevel'],
+                       shuffle=profile_settings['shuffle'],
+                       chunksizes=chunksizes,
+                       fill_value=fill_value)
+        sman.update_global_attributes(Conventions=CF_CONVENTIONS_VERSION)
@@ -15,6 +15,8 @@ BSUB_SCRIPT_TPL = """#!/bin/bash
 #BSUB -e processing_output/{script_name}_{config_name}_{config_key}_%J.err
 #BSUB -W {max_runtime}
 #BSUB -M {mem}
+#BSUB -n {ncores}
+#BSUB -R "span[hosts=1]"
 
 python {script_path} {config_path} {config_key}
 """
@@ -33,6 +35,8 @@ def write_bsub_script(bsub_dir, script_path, config_path, config_key, bsub_kwarg
     logger.debug(f'  writing {bsub_script_filepath}')
     if 'mem' not in bsub_kwargs:
         bsub_kwargs['mem'] = 16000
+    if 'ncores' not in bsub_kwargs:
+        bsub_kwargs['ncores'] = 1
 
     bsub_script = BSUB_SCRIPT_TPL.format(script_name=script_name,
                                          script_path=script_path,
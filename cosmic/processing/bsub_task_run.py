@@ -1,13 +1,58 @@
 import sys
+from argparse import ArgumentParser
+from contextlib import nullcontext
 from hashlib import sha1
 from pathlib import Path
 
 from cosmic.util import load_module
+from cosmic.processing.task_manifest import (array_index_from_env, read_array_manifest_entry, num_procs_from_env,
+                                             run_task_pack)
+from cosmic.processing.task_resources import record_task_resources
+from cosmic.processing.task_spec import read_task_spec
+from cosmic.processing.task_status import record_task_status
+from cosmic.processing.task_profile import profile_task
 
 from remake.setup_logging import setup_stdout_logging
 
+# Set before running a pack, so that forked workers can use them.
+_task_ctrl = None
+_task_specs_path = None
+_profile = False
 
-def main(config_filename, task_path_hash_key, config_path_hash):
+
+def _run_task(task_path_hash_key):
+    task = _task_ctrl.task_from_path_hash_key[task_path_hash_key]
+    # Status used by rolling submitter, resources by submitters to request resources (see task_resources).
+    with record_task_status(task_path_hash_key), record_task_resources(task):
+        with profile_task(task) if _profile else nullcontext():
+            _task_ctrl.run_task(task)
+
+
+def _run_task_spec(task_path_hash_key):
+    with record_task_status(task_path_hash_key):
+        spec = read_task_spec(_task_specs_path, task_path_hash_key)
+        # Outputs produced since submission: already run by another job.
+        since = _task_specs_path.stat().st_mtime
+        if spec.is_up_to_date(since):
+            print(f'{spec}: outputs produced since submission, not running')
+            return
+        with record_task_resources(spec), profile_task(spec) if _profile else nullcontext():
+            spec.run()
+
+
+def main(config_filename, task_path_hash_key, config_path_hash, array_manifest=None, task_specs=None,
+         profile=False):
+    """Run one task, or if array_manifest is set, the tasks for this array element.
+
+    :param task_path_hash_key: key of task to run (ignored if array_manifest is set)
+    :param array_manifest: manifest written by submitter: the tasks are looked up using the array index
+    :param task_specs: task specs written by submitter: if set, run tasks from their specs, without loading and
+    finalizing the task control
+    :param profile: record profile of each task (see task_profile)
+    If there is more than one task (a pack), they are run in a process pool sized to the job's allocated cores.
+    """
+    global _task_ctrl, _task_specs_path, _profile
+    _profile = profile
     # Logging to stdout is fine -- it will end up in the output captured by bsub.
     setup_stdout_logging('DEBUG')
 
@@ -16,6 +61,19 @@ def main(config_filename, task_path_hash_key, config_path_hash):
     if config_path_hash != curr_config_path_hash:
         raise Exception(f'config file {config_path} has changed -- cannot run task.')
 
+    if array_manifest:
+        task_path_hash_keys = read_array_manifest_entry(array_manifest, array_index_from_env())
+    else:
+        task_path_hash_keys = [task_path_hash_key]
+
+    if task_specs:
+        _task_specs_path = Path(task_specs)
+        if len(task_path_hash_keys) == 1:
+            _run_task_spec(task_path_hash_keys[0])
+        else:
+            run_task_pack(_run_task_spec, task_path_hash_keys, num_procs_from_env())
+        return
+
     config = load_module(config_filename)
     task_ctrl = config.gen_task_ctrl()
     assert not task_ctrl.finalized, f'task control {task_ctrl} already finalized'
@@ -25,10 +83,22 @@ def main(config_filename, task_path_hash_key, config_path_hash):
     # Can perhaps fix if instead Task is responsible for working out if rerun needed,
     # and removing finalize here.
     task_ctrl.finalize()
-    task = task_ctrl.task_from_path_hash_key[task_path_hash_key]
-    task_ctrl.run_task(task)
+    _task_ctrl = task_ctrl
+    if len(task_path_hash_keys) == 1:
+        _run_task(task_path_hash_keys[0])
+    else:
+        run_task_pack(_run_task, task_path_hash_keys, num_procs_from_env())
 
 
 if __name__ == '__main__':
     print(sys.argv)
-    main(sys.argv[1], sys.argv[2], sys.argv[3])
+    parser = ArgumentParser()
+    parser.add_argument('config_filename')
+    parser.add_argument('task_path_hash_key', help='task to run, or "array" if using --array-manifest')
+    parser.add_argument('config_path_hash')
+    parser.add_argument('--array-manifest', help='run tasks for this array element from manifest')
+    parser.add_argument('--task-specs', help='run tasks from specs, without finalizing task control')
+    parser.add_argument('--profile', action='store_true', help='record profile of each task')
+    args = parser.parse_args()
+    main(args.config_filename, args.task_path_hash_key, args.config_path_hash, args.array_manifest,
+         args.task_specs, args.profile)
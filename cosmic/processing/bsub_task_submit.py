@@ -9,6 +9,12 @@ from pathlib import Path
 
 from cosmic.util import sysrun
 import cosmic.processing.bsub_task_run as bsub_task_run
+from cosmic.processing.task_manifest import calc_task_levels, split_into_groups, write_array_manifest
+from cosmic.processing.task_spec import write_task_specs
+from cosmic.processing.rolling_submit import RollingSubmitter
+from cosmic.processing.task_resources import (TaskResourceHistory, estimate_resources, parse_runtime,
+                                              format_runtime, query_lsf_job_states, cancel_lsf_jobs,
+                                              tasks_to_resubmit, PENDING_STATES, DONE_STATES, lsf_job_ref)
 
 from remake.setup_logging import add_file_logging
 from remake.task_control import load_task_ctrls
@@ -22,7 +28,23 @@ BSUB_SCRIPT_TPL = """#!/bin/bash
 #BSUB -M {mem}
 {dependencies}
 
-python {script_path} {config_path} {task_path_hash_key} {config_path_hash}
+python {script_path} {config_path} {task_path_hash_key} {config_path_hash}{run_options}
+"""
+
+# One array element per entry in the manifest. %I is the array index.
+# Each element gets ncores cores on one host, to run a pack of tasks.
+BSUB_ARRAY_SCRIPT_TPL = """#!/bin/bash
+#BSUB -J {job_name}[1-{num_entries}]
+#BSUB -q {queue}
+#BSUB -n {ncores}
+#BSUB -R "span[hosts=1]"
+#BSUB -o processing_output/{script_name}_{config_name}_{array_name}_%J_%I.out
+#BSUB -e processing_output/{script_name}_{config_name}_{array_name}_%J_%I.err
+#BSUB -W {max_runtime}
+#BSUB -M {mem}
+{dependencies}
+
+python {script_path} {config_path} array {config_path_hash} --array-manifest {manifest_path}{run_options}
 """
 
 
@@ -51,33 +73,75 @@ def _submit_bsub_script(bsub_script_path):
 
 
 class TaskSubmitter:
-    def __init__(self, bsub_dir, config_path, task_ctrl, bsub_kwargs):
+    def __init__(self, bsub_dir, config_path, task_ctrl, bsub_kwargs, resource_history=None, max_mem=None):
         self.bsub_dir = bsub_dir
         self.config_path = config_path
         self.task_ctrl = task_ctrl
         self.bsub_kwargs = bsub_kwargs
+        self.resource_history = resource_history
+        self.max_mem = max_mem
+        # If set, jobs run tasks from specs, without finalizing the task control.
+        self.task_specs_path = None
+        # If set, jobs record a profile of each task.
+        self.profile = False
         self.task_jobid_map = {}
+        # path_hash_key, jobid, array index and mem for each submitted task.
+        self.submitted_jobs = []
         self.config_path_hash = sha1(config_path.read_bytes()).hexdigest()
 
+    def _job_kwargs(self, tasks, ncores=1):
+        """bsub_kwargs for a job that runs tasks, with mem and max_runtime from resource history if used."""
+        if 'mem' not in self.bsub_kwargs:
+            self.bsub_kwargs['mem'] = 16000
+        job_kwargs = dict(self.bsub_kwargs)
+        if self.resource_history:
+            mem, runtime = estimate_resources(tasks, self.resource_history,
+                                              int(self.bsub_kwargs['mem']),
+                                              parse_runtime(self.bsub_kwargs['max_runtime']),
+                                              ncores=ncores, max_mem=self.max_mem)
+            job_kwargs['mem'] = mem
+            job_kwargs['max_runtime'] = format_runtime(runtime, include_seconds=False)
+        return job_kwargs
+
+    def gen_task_specs_path(self):
+        config_name = self.config_path.stem
+        script_name = Path(bsub_task_run.__file__).stem
+        return (self.bsub_dir / f'{script_name}_{config_name}.task_specs.pkl').absolute()
+
+    def write_task_specs(self, tasks):
+        """Write specs for tasks, which jobs then use to run them (see task_spec)."""
+        self.task_specs_path = self.gen_task_specs_path()
+        logger.info(f'writing task specs to {self.task_specs_path}')
+        write_task_specs(self.task_specs_path, self.config_path, tasks)
+
+    def _run_options(self):
+        run_options = f' --task-specs {self.task_specs_path}' if self.task_specs_path else ''
+        if self.profile:
+            run_options += ' --profile'
+        return run_options
+
+    def _dependencies(self, tasks):
+        prev_jobids = []
+        for task in tasks:
+            for prev_task in self.task_ctrl.prev_tasks[task]:
+                # N.B. not all dependencies have to have been run; they could not require rerunning.
+                if prev_task in self.task_jobid_map and self.task_jobid_map[prev_task] not in prev_jobids:
+                    prev_jobids.append(self.task_jobid_map[prev_task])
+        if prev_jobids:
+            # N.B. done(jobid) for an array job waits until all its elements are done.
+            return '#BSUB -w "' + ' && '.join([f'done({jobid})' for jobid in prev_jobids]) + '"'
+        else:
+            return ''
+
     def _write_submit_script(self, task):
         config_name = self.config_path.stem
         script_path = Path(bsub_task_run.__file__)
         script_name = script_path.stem
         bsub_script_filepath = self.bsub_dir / f'{script_name}_{config_name}_{task.path_hash_key()}.bsub'
         logger.debug(f'  writing {bsub_script_filepath}')
-        if 'mem' not in self.bsub_kwargs:
-            self.bsub_kwargs['mem'] = 16000
+        job_kwargs = self._job_kwargs([task])
 
-        prev_jobids = []
-        prev_tasks = self.task_ctrl.prev_tasks[task]
-        for prev_task in prev_tasks:
-            # N.B. not all dependencies have to have been run; they could not require rerunning.
-            if prev_task in self.task_jobid_map:
-                prev_jobids.append(self.task_jobid_map[prev_task])
-        if prev_jobids:
-            dependencies = '#BSUB -w "' + ' && '.join([f'done({jobid})' for jobid in prev_jobids]) + '"'
-        else:
-            dependencies = ''
+        dependencies = self._dependencies([task])
 
         bsub_script = BSUB_SCRIPT_TPL.format(script_name=script_name,
                                              script_path=script_path,
@@ -86,18 +150,114 @@ class TaskSubmitter:
                                              task_path_hash_key=task.path_hash_key(),
                                              dependencies=dependencies,
                                              config_path_hash=self.config_path_hash,
+                                             run_options=self._run_options(),
                                              job_name=task.path_hash_key()[:10],  # Any longer and a leading * is added.
-                                             **self.bsub_kwargs)
+                                             **job_kwargs)
 
         with open(bsub_script_filepath, 'w') as fp:
             fp.write(bsub_script)
-        return bsub_script_filepath
+        return bsub_script_filepath, job_kwargs['mem']
 
     def submit_task(self, task):
-        bsub_script_path = self._write_submit_script(task)
+        bsub_script_path, mem = self._write_submit_script(task)
         output = _submit_bsub_script(bsub_script_path)
         jobid = _parse_jobid(output)
         self.task_jobid_map[task] = jobid
+        self.submitted_jobs.append({'path_hash_key': task.path_hash_key(), 'jobid': jobid, 'index': None, 'mem': mem})
+        return jobid
+
+    def _write_array_submit_script(self, array_name, entries, job_kwargs, dependencies, ncores=1):
+        config_name = self.config_path.stem
+        script_path = Path(bsub_task_run.__file__)
+        script_name = script_path.stem
+        manifest_path = (self.bsub_dir / f'{script_name}_{config_name}_{array_name}.manifest.json').absolute()
+        write_array_manifest(manifest_path, entries)
+        bsub_script_filepath = self.bsub_dir / f'{script_name}_{config_name}_{array_name}.bsub'
+        logger.debug(f'  writing {bsub_script_filepath}')
+
+        bsub_script = BSUB_ARRAY_SCRIPT_TPL.format(script_name=script_name,
+                                                   script_path=script_path,
+                                                   config_name=config_name,
+                                                   config_path=self.config_path,
+                                                   array_name=array_name,
+                                                   num_entries=len(entries),
+                                                   ncores=ncores,
+                                                   manifest_path=manifest_path,
+                                                   dependencies=dependencies,
+                                                   config_path_hash=self.config_path_hash,
+                                                   run_options=self._run_options(),
+                                                   job_name=f'{self.config_path_hash[:4]}{array_name}',
+                                                   **job_kwargs)
+
+        with open(bsub_script_filepath, 'w') as fp:
+            fp.write(bsub_script)
+        return bsub_script_filepath
+
+    def submit_task_arrays(self, tasks, max_array_size=1000, pack_size=1, ncores=1):
+        """Submit tasks as job arrays: one array for each level of the DAG (split if > max_array_size).
+
+        Each array depends on the arrays that contain the tasks its tasks depend on.
+        :param max_array_size: max number of elements (packs) in one array
+        :param pack_size: number of tasks to run in each array element (all from the same level)
+        :param ncores: number of cores for each array element, to run the tasks in a pack at the same time
+        """
+        levels = calc_task_levels(tasks, self.task_ctrl.prev_tasks)
+        for level, level_tasks in enumerate(levels):
+            packs = split_into_groups(level_tasks, pack_size)
+            for chunk, chunk_packs in enumerate(split_into_groups(packs, max_array_size)):
+                array_name = f'L{level:03}C{chunk:03}'
+                chunk_tasks = [task for pack in chunk_packs for task in pack]
+                logger.info(f'array {array_name}: {len(chunk_tasks)} tasks in {len(chunk_packs)} packs')
+                entries = [[task.path_hash_key() for task in pack] for pack in chunk_packs]
+                dependencies = self._dependencies(chunk_tasks)
+                # All elements of an array request the same resources: use the largest.
+                job_kwargs_list = [self._job_kwargs(pack, ncores) for pack in chunk_packs]
+                job_kwargs = dict(job_kwargs_list[0])
+                job_kwargs['mem'] = max([int(kw['mem']) for kw in job_kwargs_list])
+                job_kwargs['max_runtime'] = max([kw['max_runtime'] for kw in job_kwargs_list], key=parse_runtime)
+                bsub_script_path = self._write_array_submit_script(array_name, entries, job_kwargs, dependencies,
+                                                                   ncores)
+                output = _submit_bsub_script(bsub_script_path)
+                jobid = _parse_jobid(output)
+                for index, pack in enumerate(chunk_packs):
+                    for task in pack:
+                        self.task_jobid_map[task] = jobid
+                        self.submitted_jobs.append({'path_hash_key': task.path_hash_key(), 'jobid': jobid,
+                                                    'index': index + 1, 'mem': job_kwargs['mem']})
+
+    def resubmit_oom_tasks(self, prev_submitted_jobs):
+        """Resubmit tasks from a previous submission that were killed for exceeding their memory limit.
+
+        OOM kills are recorded in the resource history, which is then used for the resubmitted tasks, so they get
+        more memory. Pending jobs for tasks that depend on them are cancelled and resubmitted.
+        :param prev_submitted_jobs: submitted_jobs from previous submission
+        :return: resubmitted tasks
+        """
+        if not self.resource_history:
+            self.resource_history = TaskResourceHistory()
+        history = self.resource_history
+        jobs = [(job['jobid'], job['index']) for job in prev_submitted_jobs]
+        job_states = query_lsf_job_states(jobs)
+        resubmit = tasks_to_resubmit(self.task_ctrl, prev_submitted_jobs, job_states, history)
+        resubmit_tasks = [task for task, _ in resubmit]
+
+        to_cancel = [(job['jobid'], job['index']) for task, job in resubmit
+                     if job_states.get((job['jobid'], job['index'])) in PENDING_STATES]
+        if to_cancel:
+            logger.info(f'cancelling {len(to_cancel)} pending jobs')
+            cancel_lsf_jobs(to_cancel)
+        # Keep dependencies on jobs that are still to run. Depend on the array element, not the whole array: an
+        # array with an OOM killed element never finishes successfully.
+        for job in prev_submitted_jobs:
+            task = self.task_ctrl.task_from_path_hash_key[job['path_hash_key']]
+            state = job_states.get((job['jobid'], job['index']))
+            if task not in resubmit_tasks and state != 'OOM' and state not in DONE_STATES:
+                self.task_jobid_map[task] = lsf_job_ref(job['jobid'], job['index'])
+
+        for task in resubmit_tasks:
+            logger.info(f'resubmitting {task}')
+            self.submit_task(task)
+        return resubmit_tasks
 
 
 def main():
@@ -107,6 +267,27 @@ def main():
     parser.add_argument('--max-runtime', '-W', default='04:00')
     parser.add_argument('--mem', '-M', default=16000)
     parser.add_argument('--ntasks', '-N', type=int, default=int(1e9))
+    parser.add_argument('--array', action='store_true',
+                        help='submit one job array for each level of the task DAG')
+    parser.add_argument('--max-array-size', type=int, default=1000)
+    parser.add_argument('--pack-size', type=int, default=1,
+                        help='run this many independent tasks in each job (implies --array)')
+    parser.add_argument('--pack-cores', type=int,
+                        help='cores to request for each pack (default: pack size)')
+    parser.add_argument('--resources-from-history', action='store_true',
+                        help='request mem/runtime for each task from recorded resource use (--mem/--max-runtime '
+                             'are used for tasks with no history)')
+    parser.add_argument('--max-mem', type=int, help='max mem to request when using resource history')
+    parser.add_argument('--task-specs', action='store_true',
+                        help='write task specs, so that jobs run tasks without finalizing the task control')
+    parser.add_argument('--profile', action='store_true',
+                        help='record profile of each task (see cosmic-task-profile-report)')
+    parser.add_argument('--rolling', type=int, metavar='MAX_JOBS',
+                        help='keep running, with at most MAX_JOBS jobs pending or running, submitting tasks as '
+                             'they become ready')
+    parser.add_argument('--poll-interval', type=int, default=60, help='seconds between polls for --rolling')
+    parser.add_argument('--resubmit-oom', action='store_true',
+                        help='resubmit tasks from last submission that were killed for exceeding their mem limit')
     args = parser.parse_args()
 
     bsub_kwargs = {'queue': args.queue,
@@ -125,7 +306,22 @@ def main():
 
     task_ctrl.finalize()
 
-    submitter = TaskSubmitter(bsub_dir, config_path, task_ctrl, bsub_kwargs)
+    resource_history = TaskResourceHistory() if args.resources_from_history else None
+    submitter = TaskSubmitter(bsub_dir, config_path, task_ctrl, bsub_kwargs, resource_history, args.max_mem)
+    submitter.profile = args.profile
+    submitted_jobs_path = Path('processing_output/submitted_jobs.json')
+
+    if args.resubmit_oom:
+        if args.task_specs:
+            # Resubmitted tasks were all in the last submission: use its specs.
+            submitter.task_specs_path = submitter.gen_task_specs_path()
+        prev_submitted_jobs = json.loads(submitted_jobs_path.read_text())
+        resubmitted_tasks = submitter.resubmit_oom_tasks(prev_submitted_jobs)
+        logger.info(f'resubmitted {len(resubmitted_tasks)} tasks')
+        resubmitted_keys = [job['path_hash_key'] for job in submitter.submitted_jobs]
+        submitted_jobs = [job for job in prev_submitted_jobs if job['path_hash_key'] not in resubmitted_keys]
+        submitted_jobs_path.write_text(json.dumps(submitted_jobs + submitter.submitted_jobs))
+        return
 
     tasks_to_submit = []
     for task in task_ctrl.sorted_tasks:
@@ -134,10 +330,27 @@ def main():
             if len(tasks_to_submit) >= args.ntasks:
                 break
 
-    for i, task in enumerate(tasks_to_submit):
-        logger.info(f'task {i + 1}/{len(tasks_to_submit)}: {task}')
-        submitter.submit_task(task)
+    if args.task_specs:
+        submitter.write_task_specs(tasks_to_submit)
+
+    if args.rolling:
+        def submit_ready_task(task):
+            # Only ready tasks are submitted, so no dependencies are needed.
+            submitter.task_jobid_map.clear()
+            return submitter.submit_task(task)
+
+        rolling_submitter = RollingSubmitter(tasks_to_submit, task_ctrl.prev_tasks, submit_ready_task,
+                                             query_lsf_job_states, args.rolling)
+        rolling_submitter.run(args.poll_interval)
+    elif args.array or args.pack_size > 1:
+        ncores = args.pack_cores or args.pack_size
+        submitter.submit_task_arrays(tasks_to_submit, args.max_array_size, args.pack_size, ncores)
+    else:
+        for i, task in enumerate(tasks_to_submit):
+            logger.info(f'task {i + 1}/{len(tasks_to_submit)}: {task}')
+            submitter.submit_task(task)
 
     Path('processing_output/submitted_tasks.json').write_text(json.dumps([(t.path_hash_key(), repr(t))
                                                                          for t in tasks_to_submit]))
+    submitted_jobs_path.write_text(json.dumps(submitter.submitted_jobs))
 
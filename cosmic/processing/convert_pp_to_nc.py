@@ -6,6 +6,7 @@ from timeit import default_timer as timer
 
 import iris
 
+from cosmic.nc_write_profiles import save_cubes
 from cosmic.util import load_module
 
 
@@ -41,7 +42,7 @@ def gen_nc_filepath(diagtype, filepath, remap_month=False):
     return new_filepath
 
 
-def convert_pp_to_nc(pp_filepath, nc_filepath, attrs={}):
+def convert_pp_to_nc(pp_filepath, nc_filepath, attrs={}, write_profile='map'):
     done_filename = (nc_filepath.parent / (nc_filepath.name + '.done'))
 
     if done_filename.exists():
@@ -58,7 +59,8 @@ def convert_pp_to_nc(pp_filepath, nc_filepath, attrs={}):
         for cube in pp:
             cube.attributes.update(attrs)
 
-    iris.save(pp, str(nc_filepath), zlib=True)
+    # Global fields are extracted to regions: whole maps are read at each time.
+    save_cubes(pp, nc_filepath, profile=write_profile)
     end = timer()
     logger.info(f'  converted in: {end - start:.02f}s')
 
@@ -68,7 +70,8 @@ def convert_pp_to_nc(pp_filepath, nc_filepath, attrs={}):
 def main(config, pp_filepath):
     logger.info(pp_filepath)
     nc_filepath = gen_nc_filepath(config.DIAGTYPE, pp_filepath)
-    convert_pp_to_nc(pp_filepath, nc_filepath, config.IRIS_CUBE_ATTRS)
+    write_profile = getattr(config, 'NC_WRITE_PROFILE', 'map')
+    convert_pp_to_nc(pp_filepath, nc_filepath, config.IRIS_CUBE_ATTRS, write_profile)
     if config.DELETE_PP:
         logger.info(f'Deleting {pp_filepath}')
         pp_filepath.unlink()
@@ -0,0 +1,177 @@
+"""Convert a month of UM pp files directly to regional precip netCDF files.
+
+Fuses convert_pp_to_nc and extract_region: each pp file is read once, keeping only the requested stash items,
+and the regions are extracted and rain and snow fluxes summed as each file is read. The regional monthly file
+is then written directly. pp files are converted in a pool of worker processes. Global netCDF intermediates
+are only written if keep_global_nc is set.
+
+Output filenames are the same as extract_region.UM_extract_region_precip, so later stages are unchanged.
+"""
+import os
+import sys
+import logging
+from multiprocessing import Pool
+from timeit import default_timer as timer
+
+import iris
+import iris.cube
+
+from cosmic.nc_write_profiles import save_cubes
+from cosmic.processing.convert_pp_to_nc import gen_nc_filepath
+from cosmic.processing.extract_region import UM_gen_region_precip_filepath
+from cosmic.processing.task_manifest import num_procs_from_env
+from cosmic.regions import extract_region
+from cosmic.util import load_module
+
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
+# (rainfall, snowfall) stashcodes, and the names iris gives them.
+RAIN_SNOW_STASHCODES = {
+    'stratiform': (4203, 4204),
+    'total': (5214, 5215),
+}
+TOTAL_PPT_STASHCODE = 5216
+
+
+def stash_str(stashcode):
+    """e.g. 4203 -> 'm01s04i203'."""
+    return f'm01s{stashcode // 1000:02}i{stashcode % 1000:03}'
+
+
+def _precip_stashcodes(stratiform, combine_rain_snow):
+    if combine_rain_snow:
+        return RAIN_SNOW_STASHCODES['stratiform' if stratiform else 'total']
+    return (TOTAL_PPT_STASHCODE, )
+
+
+def _precip_names(stratiform, combine_rain_snow):
+    if combine_rain_snow:
+        rainfall_flux_name = 'rainfall_flux'
+        snowfall_flux_name = 'snowfall_flux'
+        if stratiform:
+            rainfall_flux_name = 'stratiform_' + rainfall_flux_name
+            snowfall_flux_name = 'stratiform_' + snowfall_flux_name
+        return rainfall_flux_name, snowfall_flux_name
+    return ('precipitation_flux', )
+
+
+def pp_to_region_precip(pp_filepath, regions, stratiform=False, combine_rain_snow=True,
+                        global_nc_filepath=None, attrs={}):
+    """Read one pp file, returning the total precip for each region.
+
+    :param pp_filepath: pp file to read
+    :param regions: regions to extract, e.g. ['asia', 'europe']
+    :param stratiform: use stratiform (large-scale) rain/snow
+    :param combine_rain_snow: sum rainfall and snowfall flux, otherwise use precipitation_flux
+    :param global_nc_filepath: if set, also write the (stash filtered) global data to this file
+    :param attrs: attributes to add to cubes
+    :return: dict of region to precipitation_flux cube, with realised data
+    """
+    start = timer()
+    stash_strs = [stash_str(s) for s in _precip_stashcodes(stratiform, combine_rain_snow)]
+    stash_constraint = iris.AttributeConstraint(STASH=lambda stash: str(stash) in stash_strs)
+    cubes = iris.load(str(pp_filepath), stash_constraint)
+    for cube in cubes:
+        cube.attributes.update(attrs)
+
+    if global_nc_filepath:
+        # Realise so that the pp file is only read once, for the global file and the regions.
+        for cube in cubes:
+            cube.data
+        save_cubes(cubes, global_nc_filepath, profile='map')
+        (global_nc_filepath.parent / (global_nc_filepath.name + '.done')).touch()
+
+    region_precip = {}
+    for region in regions:
+        region_cubes = [extract_region(cubes.extract_cube(name), region)
+                        for name in _precip_names(stratiform, combine_rain_snow)]
+        if combine_rain_snow:
+            # The sum is neither stash item. Differing STASH attributes also stop iris 3 adding the cubes.
+            for cube in region_cubes:
+                cube.attributes.pop('STASH', None)
+            region_total_precip = region_cubes[0] + region_cubes[1]
+            region_total_precip.rename('precipitation_flux')
+        else:
+            region_total_precip = region_cubes[0]
+        # Realise here, in the worker: only the region is returned to the parent process.
+        region_total_precip.data
+        region_precip[region] = region_total_precip
+    logger.info(f'  {pp_filepath.name} read in {timer() - start:.02f}s')
+    return region_precip
+
+
+def _pp_to_region_precip_worker(args):
+    return pp_to_region_precip(*args)
+
+
+def convert_pp_to_region_nc(runid, stream, year, month, pp_filepaths, output_dir, regions=('asia', ),
+                            stratiform=False, combine_rain_snow=True, attrs={}, keep_global_nc=False,
+                            diagtype='precip', num_procs=None, write_profile='balanced'):
+    """Convert a month of pp files to one regional precip netCDF file for each region.
+
+    :param pp_filepaths: all pp files for the month
+    :param output_dir: dir to write regional (and global) files to
+    :param keep_global_nc: also write a global netCDF file for each pp file
+    :param num_procs: number of pp files to convert at once (default: number of cores allocated to job)
+    :return: dict of region to output filepath
+    """
+    output_filepaths = {r: UM_gen_region_precip_filepath(runid, stream, year, month, r, output_dir)
+                        for r in regions}
+    regions_to_do = [r for r in regions
+                     if not (output_filepaths[r].parent / (output_filepaths[r].name + '.done')).exists()]
+    for region in set(regions) - set(regions_to_do):
+        logger.info(f'Skipping: {output_filepaths[region].name}.done exists')
+    if not regions_to_do:
+        return output_filepaths
+
+    start = timer()
+    worker_args = []
+    for pp_filepath in sorted(pp_filepaths):
+        global_nc_filepath = gen_nc_filepath(diagtype, pp_filepath) if keep_global_nc else None
+        if global_nc_filepath:
+            global_nc_filepath = output_dir / global_nc_filepath.name
+        worker_args.append((pp_filepath, regions_to_do, stratiform, combine_rain_snow,
+                            global_nc_filepath, attrs))
+
+    region_cubes = {r: iris.cube.CubeList() for r in regions_to_do}
+    with Pool(num_procs or num_procs_from_env()) as pool:
+        # imap keeps the files in time order.
+        for region_precip in pool.imap(_pp_to_region_precip_worker, worker_args):
+            for region, cube in region_precip.items():
+                region_cubes[region].append(cube)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for region in regions_to_do:
+        output_filepath = output_filepaths[region]
+        logger.info(f'Writing {output_filepath}')
+        save_cubes(region_cubes[region].concatenate_cube(), output_filepath, profile=write_profile)
+        (output_filepath.parent / (output_filepath.name + '.done')).touch()
+    logger.info(f'Converted {len(worker_args)} pp files in {timer() - start:.02f}s')
+    return output_filepaths
+
+
+def main(config, pp_dirpath):
+    logger.info(pp_dirpath)
+    year = int(pp_dirpath.stem[-6:-2])
+    month = int(pp_dirpath.stem[-2:])
+    pp_filepaths = sorted(pp_dirpath.glob('*.pp'))
+    convert_pp_to_region_nc(config.RUNID, config.STREAM, year, month, pp_filepaths, pp_dirpath,
+                            regions=config.REGIONS,
+                            stratiform=config.STRATIFORM,
+                            combine_rain_snow=getattr(config, 'COMBINE_RAIN_SNOW', True),
+                            attrs=config.IRIS_CUBE_ATTRS,
+                            keep_global_nc=getattr(config, 'KEEP_GLOBAL_NC', False),
+                            diagtype=getattr(config, 'DIAGTYPE', 'precip'),
+                            write_profile=getattr(config, 'NC_WRITE_PROFILE', 'balanced'))
+    if config.DELETE_PP:
+        for pp_filepath in pp_filepaths:
+            logger.info(f'Deleting {pp_filepath}')
+            pp_filepath.unlink()
+
+
+if __name__ == '__main__':
+    config = load_module(sys.argv[1])
+    config_key = sys.argv[2]
+    main(config, config.SCRIPT_ARGS[config_key])
@@ -5,9 +5,15 @@ import logging
 from pathlib import Path
 
 import iris
-from iris.experimental import equalise_cubes
-
-from cosmic.config import CONSTRAINT_ASIA, CONSTRAINT_EU
+try:
+    from iris.util import equalise_attributes
+except ImportError:
+    # iris < 3.
+    from iris.experimental.equalise_cubes import equalise_attributes
+
+from cosmic.nc_write_profiles import save_cubes
+from cosmic.regions import load_region
+from cosmic.time_selection import select_time
 from cosmic.util import load_module
 
 logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
@@ -21,7 +27,8 @@ def UM_gen_region_precip_filepath(runid, stream, year, month, region, output_dir
 
 
 def UM_extract_region_precip(runid, stream, year, month, nc_dirpath,
-                             region='asia', stratiform=False, combine_rain_snow=True):
+                             region='asia', stratiform=False, combine_rain_snow=True,
+                             write_profile='balanced'):
     output_filepath = UM_gen_region_precip_filepath(runid, stream, year, month, region, nc_dirpath)
     done_filename = (output_filepath.parent / (output_filepath.name + '.done'))
 
@@ -32,10 +39,7 @@ def UM_extract_region_precip(runid, stream, year, month, nc_dirpath,
                         f'{runid[2:]}{stream[0]}.{stream[1:]}{year}{month:02}??.precip.nc')
 
     # N.B. loading 10 files per month.
-    if region == 'asia':
-        region_precip_cubes = iris.load(str(nc_filename_glob), CONSTRAINT_ASIA)
-    elif region == 'europe':
-        region_precip_cubes = iris.load(str(nc_filename_glob), CONSTRAINT_EU)
+    region_precip_cubes = load_region(nc_filename_glob, region)
 
     if combine_rain_snow:
         rainfall_flux_name = 'rainfall_flux'
@@ -54,10 +58,7 @@ def UM_extract_region_precip(runid, stream, year, month, nc_dirpath,
         region_total_precip = (region_precip_cubes.extract(iris.Constraint(name='precipitation_flux'))
                                .concatenate_cube())
 
-    if region == 'europe':
-        iris.save(region_total_precip.intersection(longitude=(-22, 37)), str(output_filepath))
-    else:
-        iris.save(region_total_precip, str(output_filepath))
+    save_cubes(region_total_precip, output_filepath, profile=write_profile)
     done_filename.touch()
 
 
@@ -67,7 +68,7 @@ def HadGEM_gen_asia_precip_filepath(model, expt, variant, year, season, output_d
 
 
 def HadGEM3_extract_asia_precip(model, nc_dirpath, output_dir, year, season='JJA',
-                                expt='highresSST-present', variant='r1i1p1f1'):
+                                expt='highresSST-present', variant='r1i1p1f1', write_profile='balanced'):
     output_filepath = HadGEM_gen_asia_precip_filepath(model, expt, variant, year, season, output_dir)
     done_filename = (output_filepath.parent / (output_filepath.name + '.done'))
 
@@ -80,23 +81,17 @@ def HadGEM3_extract_asia_precip(model, nc_dirpath, output_dir, year, season='JJA
     # pr_E1hr_HadGEM3-GC31-LM_highresSST-present_r1i1p1f1_gn_201401010030-201412302330.nc
     nc_filename_glob = (nc_dirpath / f'pr_E1hr_{model}_{expt}_{variant}_gn_{year}????????-{year}????????.nc')
 
-    if season == 'JJA':
-        constraint_season = iris.Constraint(time=lambda cell: 6 <= cell.point.month <= 8)
-    elif season == 'SON':
-        constraint_season = iris.Constraint(time=lambda cell: 9 <= cell.point.month <= 11)
-    elif season == 'DJF':
-        constraint_season = iris.Constraint(time=lambda cell: ((cell.point.month == 12) or
-                                                               (cell.point.month == 1) or
-                                                               (cell.point.month == 2)))
-    elif season == 'MAM':
-        constraint_season = iris.Constraint(time=lambda cell: 3 <= cell.point.month <= 5)
-
-    asia_precip_season_cubes = iris.load(str(nc_filename_glob), CONSTRAINT_ASIA & constraint_season)
-    equalise_cubes.equalise_attributes(asia_precip_season_cubes)
+    # N.B. HadGEM3 uses a 360_day calendar: handled by select_time.
+    asia_precip_season_cubes = iris.cube.CubeList()
+    for asia_precip_cube in load_region(nc_filename_glob, 'asia'):
+        asia_precip_season_cube = select_time(asia_precip_cube, season=season)
+        if asia_precip_season_cube is not None:
+            asia_precip_season_cubes.append(asia_precip_season_cube)
+    equalise_attributes(asia_precip_season_cubes)
     asia_precip_season_cube = asia_precip_season_cubes.concatenate_cube()
 
     output_filepath.parent.mkdir(parents=True, exist_ok=True)
-    iris.save(asia_precip_season_cube, str(output_filepath))
+    save_cubes(asia_precip_season_cube, output_filepath, profile=write_profile)
     done_filename.touch()
 
 
@@ -105,8 +100,9 @@ def main(config, region, nc_dirpath):
     year = int(nc_dirpath.stem[-6:-2])
     month = int(nc_dirpath.stem[-2:])
     combine_rain_snow = getattr(config, 'COMBINE_RAIN_SNOW', True)
+    write_profile = getattr(config, 'NC_WRITE_PROFILE', 'balanced')
     UM_extract_region_precip(config.RUNID, config.STREAM, year, month, nc_dirpath,
-                             region, config.STRATIFORM, combine_rain_snow)
+                             region, config.STRATIFORM, combine_rain_snow, write_profile)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,141 @@
+"""Run a DAG of tasks on the local machine, running each task as soon as the tasks it depends on are done.
+
+Generic over tasks: a task can be any hashable object, and is run by calling run_func(task). Each task is run in
+its own forked process, so run_func does not need to be picklable and can use any state set up in the parent
+(e.g. a finalized remake task control), and all memory used by a task is freed when it finishes. Up to num_procs
+tasks run at once. Ready tasks are started in the order they are given, so passing tasks in topological order
+gives the same order as a serial run when num_procs is 1.
+
+If a task fails, the tasks that depend on it (directly or indirectly) are not run, but all other tasks are.
+
+example usage:
+    executor = LocalDagExecutor(task_ctrl.sorted_tasks, task_ctrl.prev_tasks, task_ctrl.run_task, num_procs=8)
+    executor.run()
+"""
+import os
+import sys
+import logging
+import multiprocessing
+import resource
+from collections import deque
+from multiprocessing.connection import wait
+from timeit import default_timer as timer
+
+from cosmic.cosmic_errors import CosmicError
+
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _run_in_child(run_func, task, mem_limit_mb):
+    if mem_limit_mb:
+        mem_limit = int(mem_limit_mb * 1024 ** 2)
+        resource.setrlimit(resource.RLIMIT_AS, (mem_limit, mem_limit))
+    try:
+        run_func(task)
+    except Exception:
+        logger.exception(f'task {task} failed')
+        # Skip atexit handlers and flushing of buffers inherited from the parent.
+        sys.stdout.flush()
+        os._exit(1)
+    sys.stdout.flush()
+    os._exit(0)
+
+
+class LocalDagExecutor:
+    """Run tasks in parallel, respecting dependencies.
+
+    :param tasks: tasks to run, ideally in topological order (e.g. task_ctrl.sorted_tasks)
+    :param prev_tasks: mapping of task to the tasks it depends on (e.g. task_ctrl.prev_tasks) -- dependencies
+    that are not in tasks are assumed to be done
+    :param run_func: function that runs a task
+    :param num_procs: max number of tasks to run at once (default: number of cores)
+    :param mem_limit_mb: if set, limit on the address space (virtual memory) of each task, in MB
+    """
+
+    def __init__(self, tasks, prev_tasks, run_func, num_procs=None, mem_limit_mb=None):
+        self.tasks = list(tasks)
+        self.prev_tasks = prev_tasks
+        self.run_func = run_func
+        self.num_procs = num_procs or os.cpu_count()
+        self.mem_limit_mb = mem_limit_mb
+
+        self.completed_tasks = []
+        self.failed_tasks = []
+        self.skipped_tasks = []
+        self.task_times = {}
+
+    def run(self):
+        """Run all tasks.
+
+        :return: completed tasks, in the order they completed
+        :raises CosmicError: if any task failed
+        """
+        task_set = set(self.tasks)
+        remaining_deps = {}
+        next_tasks = {task: [] for task in self.tasks}
+        for task in self.tasks:
+            remaining_deps[task] = {prev_task for prev_task in self.prev_tasks.get(task, [])
+                                    if prev_task in task_set}
+            for prev_task in remaining_deps[task]:
+                next_tasks[prev_task].append(task)
+        task_order = {task: i for i, task in enumerate(self.tasks)}
+
+        ready = deque(task for task in self.tasks if not remaining_deps[task])
+        running = {}
+        ctx = multiprocessing.get_context('fork')
+        start = timer()
+        logger.info(f'running {len(self.tasks)} tasks on {self.num_procs} procs')
+        try:
+            while ready or running:
+                while ready and len(running) < self.num_procs:
+                    task = ready.popleft()
+                    logger.debug(f'starting {task}')
+                    # Flush so that buffered output is not duplicated in the child.
+                    sys.stdout.flush()
+                    proc = ctx.Process(target=_run_in_child, args=(self.run_func, task, self.mem_limit_mb))
+                    proc.start()
+                    running[proc.sentinel] = (proc, task, timer())
+
+                for sentinel in wait(list(running)):
+                    proc, task, task_start = running.pop(sentinel)
+                    proc.join()
+                    self.task_times[task] = timer() - task_start
+                    if proc.exitcode == 0:
+                        self.completed_tasks.append(task)
+                        logger.info(f'completed {len(self.completed_tasks)}/{len(self.tasks)}: {task} '
+                                    f'in {self.task_times[task]:.02f}s')
+                        newly_ready = []
+                        for next_task in next_tasks[task]:
+                            remaining_deps[next_task].remove(task)
+                            if not remaining_deps[next_task]:
+                                newly_ready.append(next_task)
+                        ready.extend(sorted(newly_ready, key=task_order.get))
+                    else:
+                        if proc.exitcode < 0:
+                            logger.error(f'task {task} killed by signal {-proc.exitcode}')
+                        else:
+                            logger.error(f'task {task} failed with exit code {proc.exitcode}')
+                        self.failed_tasks.append(task)
+                        self._skip_descendants(task, next_tasks)
+        finally:
+            for proc, task, _ in running.values():
+                logger.warning(f'terminating {task}')
+                proc.terminate()
+                proc.join()
+
+        logger.info(f'completed {len(self.completed_tasks)} tasks in {timer() - start:.02f}s')
+        if self.failed_tasks:
+            raise CosmicError(f'{len(self.failed_tasks)} tasks failed: {self.failed_tasks}, '
+                              f'{len(self.skipped_tasks)} tasks not run')
+        return self.completed_tasks
+
+    def _skip_descendants(self, task, next_tasks):
+        to_visit = list(next_tasks[task])
+        while to_visit:
+            next_task = to_visit.pop()
+            if next_task not in self.skipped_tasks:
+                logger.warning(f'not running {next_task}: depends on failed task {task}')
+                self.skipped_tasks.append(next_task)
+                to_visit.extend(next_tasks[next_task])
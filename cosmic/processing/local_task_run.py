@@ -0,0 +1,62 @@
+"""Run the tasks of a remake task control on the local machine, in parallel.
+
+Loads the task control in the same way as bsub_task_submit, then runs each task that needs running as soon as
+the tasks it depends on are done, using a LocalDagExecutor. Each task is run with task_ctrl.run_task, as for a
+serial run, so the output is identical.
+"""
+import os
+import sys
+import json
+import logging
+from argparse import ArgumentParser
+from pathlib import Path
+
+from cosmic.processing.local_dag_executor import LocalDagExecutor
+from cosmic.processing.task_manifest import num_procs_from_env
+from cosmic.processing.task_profile import profile_task
+
+from remake.setup_logging import add_file_logging
+from remake.task_control import load_task_ctrls
+
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--config-filename', '-C')
+    parser.add_argument('--num-procs', '-n', type=int, help='max tasks to run at once (default: number of cores)')
+    parser.add_argument('--mem-limit', '-M', type=float, help='memory limit for each task in MB')
+    parser.add_argument('--ntasks', '-N', type=int, default=int(1e9))
+    parser.add_argument('--profile', action='store_true',
+                        help='record profile of each task (see cosmic-task-profile-report)')
+    args = parser.parse_args()
+
+    output_dir = Path('processing_output')
+    output_dir.mkdir(exist_ok=True)
+    add_file_logging(output_dir / 'local_task_run.log')
+
+    config_path = Path(args.config_filename).absolute()
+    task_ctrl = load_task_ctrls(config_path)[0]
+    task_ctrl.finalize()
+
+    tasks_to_run = []
+    for task in task_ctrl.sorted_tasks:
+        if task in task_ctrl.pending_tasks or task in task_ctrl.remaining_tasks:
+            tasks_to_run.append(task)
+            if len(tasks_to_run) >= args.ntasks:
+                break
+
+    Path('processing_output/local_run_tasks.json').write_text(json.dumps([(t.path_hash_key(), repr(t))
+                                                                         for t in tasks_to_run]))
+
+    def profile_run_task(task):
+        with profile_task(task):
+            task_ctrl.run_task(task)
+
+    run_func = profile_run_task if args.profile else task_ctrl.run_task
+    executor = LocalDagExecutor(tasks_to_run, task_ctrl.prev_tasks, run_func,
+                                num_procs=args.num_procs or num_procs_from_env(),
+                                mem_limit_mb=args.mem_limit)
+    executor.run()
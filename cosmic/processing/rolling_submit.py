@@ -0,0 +1,165 @@
+"""Rolling submission: keep at most max_jobs jobs pending or running, submitting tasks as they become ready.
+
+Instead of submitting every task at once with scheduler dependencies, only tasks whose dependencies are done are
+submitted, so jobs never need dependencies and never wait in the queue on other jobs. Finished tasks are found
+from the task status files written by bsub_task_run (see task_status); the scheduler is only queried for jobs that
+have no status file, to find jobs that died without writing one (e.g. killed for exceeding their time or memory
+limit).
+
+Progress is saved to a JSON state file after each poll, so the daemon can be stopped and restarted: submitted jobs
+are picked up again, and done tasks are not resubmitted.
+
+example usage:
+    rolling_submitter = RollingSubmitter(tasks, task_ctrl.prev_tasks, submit_task, query_lsf_job_states,
+                                         max_jobs=100, state_path='processing_output/rolling_submit_state.json')
+    rolling_submitter.run()
+"""
+import os
+import sys
+import json
+import logging
+import time
+from pathlib import Path
+
+from cosmic.cosmic_errors import CosmicError
+from cosmic.processing.task_status import read_task_status, clear_task_status
+from cosmic.processing.task_resources import PENDING_STATES, DONE_STATES
+
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_PATH = 'processing_output/rolling_submit_state.json'
+# Scheduler states (LSF and SLURM) of jobs that have not finished.
+ACTIVE_STATES = PENDING_STATES + ['RUN', 'RUNNING', 'USUSP', 'SSUSP', 'SUSPENDED', 'COMPLETING', 'CONFIGURING']
+
+
+class RollingSubmitter:
+    """Submit tasks as they become ready, keeping at most max_jobs jobs pending or running.
+
+    :param tasks: tasks to run, in topological order (e.g. from task_ctrl.sorted_tasks)
+    :param prev_tasks: mapping of task to the tasks it depends on -- dependencies that are not in tasks are
+    assumed to be done
+    :param submit_task: function that submits a task as a job with no dependencies and returns its jobid
+    :param query_job_states: function that returns the states of a list of (jobid, index) (see task_resources)
+    :param max_jobs: max number of jobs pending or running at once
+    :param state_path: JSON file to save progress to, and restart from
+    :param task_status_dir: dir of task status files (default: see task_status)
+    """
+
+    def __init__(self, tasks, prev_tasks, submit_task, query_job_states, max_jobs,
+                 state_path=DEFAULT_STATE_PATH, task_status_dir=None):
+        self.tasks = list(tasks)
+        self.prev_tasks = prev_tasks
+        self.submit_task = submit_task
+        self.query_job_states = query_job_states
+        self.max_jobs = max_jobs
+        self.state_path = Path(state_path)
+        self.task_status_dir = task_status_dir
+
+        self.task_from_key = {task.path_hash_key(): task for task in self.tasks}
+        # path_hash_key to jobid of tasks that have been submitted but have not finished.
+        self.submitted = {}
+        self.done = set()
+        self.failed = set()
+        if self.state_path.exists():
+            self._load_state()
+
+    def _load_state(self):
+        state = json.loads(self.state_path.read_text())
+        self.submitted = {k: jobid for k, jobid in state['submitted'].items() if k in self.task_from_key}
+        self.done = {k for k in state['done'] if k in self.task_from_key}
+        self.failed = {k for k in state['failed'] if k in self.task_from_key}
+        logger.info(f'restarting from {self.state_path}: {len(self.submitted)} submitted, {len(self.done)} done, '
+                    f'{len(self.failed)} failed')
+
+    def save_state(self):
+        state = {'submitted': self.submitted, 'done': sorted(self.done), 'failed': sorted(self.failed)}
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so that the state file is never partially written if the daemon is killed.
+        tmp_path = self.state_path.parent / (self.state_path.name + '.tmp')
+        tmp_path.write_text(json.dumps(state))
+        tmp_path.replace(self.state_path)
+
+    def _finish(self, key, status):
+        del self.submitted[key]
+        if status == 'done':
+            self.done.add(key)
+        else:
+            logger.error(f'task {key} failed: {self.task_from_key[key]}')
+            self.failed.add(key)
+
+    def update(self):
+        """Find submitted tasks that have finished, from status files or from the scheduler."""
+        unknown = []
+        for key in list(self.submitted):
+            status = read_task_status(key, self.task_status_dir)
+            if status:
+                self._finish(key, status)
+            else:
+                unknown.append(key)
+        if not unknown:
+            return
+
+        job_states = self.query_job_states([(self.submitted[key], None) for key in unknown])
+        for key in unknown:
+            state = job_states.get((self.submitted[key], None))
+            # Not yet known to the scheduler's accounting, or still running.
+            if state is None or state in ACTIVE_STATES:
+                continue
+            # Check status file again: the job may have finished since it was checked.
+            status = read_task_status(key, self.task_status_dir)
+            if not status:
+                status = 'done' if state in DONE_STATES else 'failed'
+                logger.warning(f'task {key}: job {self.submitted[key]} finished ({state}) without status file')
+            self._finish(key, status)
+
+    def ready_tasks(self):
+        """Tasks that have not been submitted, all of whose dependencies are done."""
+        ready = []
+        for task in self.tasks:
+            key = task.path_hash_key()
+            if key in self.submitted or key in self.done or key in self.failed:
+                continue
+            if all(prev_task.path_hash_key() in self.done for prev_task in self.prev_tasks.get(task, [])
+                   if prev_task.path_hash_key() in self.task_from_key):
+                ready.append(task)
+        return ready
+
+    def submit_ready(self):
+        num_to_submit = self.max_jobs - len(self.submitted)
+        for task in self.ready_tasks()[:max(num_to_submit, 0)]:
+            key = task.path_hash_key()
+            clear_task_status(key, self.task_status_dir)
+            jobid = self.submit_task(task)
+            logger.info(f'submitted {key} as job {jobid}: {task}')
+            self.submitted[key] = jobid
+            # Save after each submission, so that a restart does not resubmit.
+            self.save_state()
+
+    @property
+    def finished(self):
+        return not self.submitted and not self.ready_tasks()
+
+    def step(self):
+        """One poll: update task statuses and submit ready tasks."""
+        self.update()
+        self.submit_ready()
+        self.save_state()
+
+    def run(self, poll_interval=60):
+        """Poll until all tasks are done, or no more can be run because tasks failed.
+
+        :raises CosmicError: if any task failed
+        """
+        while True:
+            self.step()
+            if self.finished:
+                break
+            logger.debug(f'{len(self.submitted)} jobs, {len(self.done)}/{len(self.tasks)} done')
+            time.sleep(poll_interval)
+
+        not_run = len(self.tasks) - len(self.done) - len(self.failed)
+        logger.info(f'{len(self.done)}/{len(self.tasks)} tasks done, {len(self.failed)} failed, {not_run} not run')
+        if self.failed:
+            raise CosmicError(f'{len(self.failed)} tasks failed: {sorted(self.failed)}')
@@ -0,0 +1,125 @@
+"""Task manifests: map batch array indices to remake tasks.
+
+Tasks are grouped by their level in the task DAG: a task's level is one more than the highest level of the
+tasks it depends on. All tasks at one level can run at the same time once the previous levels are done, so
+each level can be submitted as a job array, with one dependency on each array in earlier levels.
+
+The manifest for an array is a JSON file with one entry per array element (array indices start at 1). Each
+entry is a list of task path_hash_keys, run by bsub_task_run. An entry with more than one task is a pack: the
+tasks are independent (they come from the same level), and are run in a local process pool inside one
+multi-core job, saving a job slot, Python startup and scheduler latency for each short task.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import traceback
+from pathlib import Path
+
+from cosmic.cosmic_errors import CosmicError
+
+# Env vars that hold the (1-based) index of the array element for LSF and SLURM.
+ARRAY_INDEX_ENV_VARS = ['LSB_JOBINDEX', 'SLURM_ARRAY_TASK_ID']
+# Env vars that hold the number of cores allocated to a job for LSF and SLURM.
+NUM_PROCS_ENV_VARS = ['LSB_DJOB_NUMPROC', 'SLURM_CPUS_PER_TASK']
+
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def calc_task_levels(tasks, prev_tasks):
+    """Group tasks by level in the DAG, only considering dependencies between tasks.
+
+    :param tasks: tasks in topological order (e.g. task_ctrl.sorted_tasks)
+    :param prev_tasks: mapping of task to the tasks it depends on (e.g. task_ctrl.prev_tasks)
+    :return: list of lists of tasks, one for each level
+    """
+    task_level = {}
+    for task in tasks:
+        levels = [task_level[prev_task] + 1 for prev_task in prev_tasks.get(task, []) if prev_task in task_level]
+        task_level[task] = max(levels, default=0)
+
+    levels = [[] for _ in range(max(task_level.values(), default=-1) + 1)]
+    for task in tasks:
+        levels[task_level[task]].append(task)
+    return levels
+
+
+def split_into_groups(tasks, group_size):
+    """Split tasks into consecutive groups with at most group_size tasks."""
+    return [tasks[i:i + group_size] for i in range(0, len(tasks), group_size)]
+
+
+def write_array_manifest(manifest_path, entries):
+    """Write manifest for an array.
+
+    :param manifest_path: path to write to
+    :param entries: one list of task path_hash_keys for each array element
+    """
+    manifest = {'num_entries': len(entries), 'entries': entries}
+    Path(manifest_path).write_text(json.dumps(manifest))
+
+
+def read_array_manifest_entry(manifest_path, array_index):
+    """Task path_hash_keys for an (1-based) array index."""
+    entries = json.loads(Path(manifest_path).read_text())['entries']
+    if not 1 <= array_index <= len(entries):
+        raise CosmicError(f'array index {array_index} out of range for {manifest_path}')
+    return entries[array_index - 1]
+
+
+def array_index_from_env():
+    """Index of the current array element, from the LSF or SLURM env var."""
+    for env_var in ARRAY_INDEX_ENV_VARS:
+        if os.getenv(env_var):
+            return int(os.environ[env_var])
+    raise CosmicError(f'Not running in a job array: none of {ARRAY_INDEX_ENV_VARS} set')
+
+
+def num_procs_from_env():
+    """Number of cores allocated to this job, from the LSF or SLURM env var (or all cores if not set)."""
+    for env_var in NUM_PROCS_ENV_VARS:
+        if os.getenv(env_var):
+            return int(os.environ[env_var])
+    return os.cpu_count()
+
+
+def _run_pack_item(args):
+    run_func, key = args
+    try:
+        run_func(key)
+        return key, None
+    except Exception:
+        return key, traceback.format_exc()
+
+
+def run_task_pack(run_func, keys, num_procs):
+    """Run run_func(key) for each key in a pack of independent tasks, num_procs at a time.
+
+    Every task is run, even if some fail. Each task is run in a newly forked worker, so run_func can use
+    state (e.g. a finalized task control) set up by the parent before calling this, and memory is freed
+    after each task.
+    :param run_func: module level function that runs the task for a key
+    :param keys: task keys
+    :param num_procs: max number of tasks to run at once
+    :raises CosmicError: if any task failed
+    """
+    num_procs = max(1, min(num_procs, len(keys)))
+    items = [(run_func, key) for key in keys]
+    logger.info(f'running pack of {len(keys)} tasks on {num_procs} procs')
+    if num_procs == 1:
+        results = [_run_pack_item(item) for item in items]
+    else:
+        with multiprocessing.get_context('fork').Pool(num_procs, maxtasksperchild=1) as pool:
+            results = list(pool.imap_unordered(_run_pack_item, items))
+
+    failed_keys = []
+    for key, error in results:
+        if error:
+            logger.error(f'task {key} failed')
+            logger.error(error)
+            failed_keys.append(key)
+    if failed_keys:
+        raise CosmicError(f'{len(failed_keys)}/{len(keys)} tasks failed: {failed_keys}')
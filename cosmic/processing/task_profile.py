@@ -0,0 +1,213 @@
+"""Opt-in per-task profiling, and a report of where the time goes in a pipeline.
+
+profile_task wraps running a task, and appends one record to the profile database (a JSON lines file, so that
+many jobs can append to it at once): wall and CPU time, peak RSS, input and output sizes, and bytes read and
+written (from /proc/self/io). Used by bsub_task_run --profile (see the submitters' --profile) and
+cosmic-run-local --profile.
+
+The report ranks task functions by total cost, and finds the critical path through the DAG: the chain of tasks,
+linked by one task's outputs being another's inputs, with the longest total wall time. This is the minimum time
+the pipeline could take with unlimited parallelism.
+
+example usage:
+    cosmic-task-profile-report processing_output/task_profiles.jsonl --sort cpu_time
+"""
+import os
+import sys
+import json
+import logging
+import resource
+import socket
+import time
+from argparse import ArgumentParser
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from timeit import default_timer as timer
+
+from cosmic.processing.task_resources import peak_rss_mb, task_func_name
+
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
+# Relative to the dir jobs are submitted from (and run in), same as the job output.
+DEFAULT_PROFILE_PATH = 'processing_output/task_profiles.jsonl'
+COST_KEYS = ['wall_time', 'cpu_time', 'peak_rss_mb', 'input_bytes', 'output_bytes', 'read_bytes', 'write_bytes']
+
+
+def profile_path():
+    return Path(os.getenv('COSMIC_TASK_PROFILE', DEFAULT_PROFILE_PATH))
+
+
+def _paths(paths):
+    return [Path(p) for p in (paths.values() if isinstance(paths, dict) else paths)]
+
+
+def _total_size(paths):
+    return sum(p.stat().st_size for p in paths if p.exists())
+
+
+def _cpu_time():
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (self_usage.ru_utime + self_usage.ru_stime +
+            children_usage.ru_utime + children_usage.ru_stime)
+
+
+def _io_bytes():
+    """Bytes read from and written to storage by this process, or (None, None) if not available."""
+    try:
+        io = dict(line.split(': ') for line in Path('/proc/self/io').read_text().strip().split('\n'))
+        return int(io['read_bytes']), int(io['write_bytes'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+@contextmanager
+def profile_task(task, path=None):
+    """Profile running task, and append the record to the profile database if it runs without error.
+
+    :param task: remake Task or TaskSpec (needs func, inputs, outputs and path_hash_key)
+    :param path: profile database (default: $COSMIC_TASK_PROFILE or DEFAULT_PROFILE_PATH)
+    """
+    path = Path(path) if path else profile_path()
+    start_time = time.time()
+    start = timer()
+    start_cpu = _cpu_time()
+    start_read, start_write = _io_bytes()
+    yield
+    wall_time = timer() - start
+    end_read, end_write = _io_bytes()
+    inputs = _paths(task.inputs)
+    outputs = _paths(task.outputs)
+    record = {
+        'func': task_func_name(task),
+        'path_hash_key': task.path_hash_key(),
+        'host': socket.gethostname(),
+        'start': start_time,
+        'wall_time': wall_time,
+        'cpu_time': _cpu_time() - start_cpu,
+        'peak_rss_mb': peak_rss_mb(),
+        'input_bytes': _total_size(inputs),
+        'output_bytes': _total_size(outputs),
+        'read_bytes': end_read - start_read if start_read is not None else None,
+        'write_bytes': end_write - start_write if start_write is not None else None,
+        'inputs': [str(p) for p in inputs],
+        'outputs': [str(p) for p in outputs],
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # One short write in append mode, so that records from concurrent jobs are not interleaved.
+    with open(path, 'a') as fp:
+        fp.write(json.dumps(record) + '\n')
+
+
+def load_profiles(path=None):
+    """Latest profile record for each task."""
+    path = Path(path) if path else profile_path()
+    profiles = {}
+    for line in path.read_text().split('\n'):
+        if line.strip():
+            record = json.loads(line)
+            profiles[record['path_hash_key']] = record
+    return profiles
+
+
+def func_costs(profiles):
+    """Count and total (max for peak_rss_mb) of each cost, for each function."""
+    costs = defaultdict(lambda: defaultdict(float))
+    for record in profiles.values():
+        func_cost = costs[record['func']]
+        func_cost['count'] += 1
+        for key in COST_KEYS:
+            value = record[key] or 0
+            if key == 'peak_rss_mb':
+                func_cost[key] = max(func_cost[key], value)
+            else:
+                func_cost[key] += value
+    return {func: dict(cost) for func, cost in costs.items()}
+
+
+def critical_path(profiles):
+    """Chain of tasks with the longest total wall time, where each task uses an output of the previous one.
+
+    :return: list of records on the critical path, total wall time
+    """
+    producer = {}
+    for key, record in profiles.items():
+        for output in record['outputs']:
+            producer[output] = key
+    prev_keys = {key: {producer[i] for i in record['inputs'] if i in producer and producer[i] != key}
+                 for key, record in profiles.items()}
+
+    if not profiles:
+        return [], 0
+
+    # Longest path ending at each task, visiting tasks in topological order.
+    next_keys = defaultdict(list)
+    num_prev = {key: len(prev) for key, prev in prev_keys.items()}
+    for key, prev in prev_keys.items():
+        for prev_key in prev:
+            next_keys[prev_key].append(key)
+    to_visit = [key for key, n in num_prev.items() if n == 0]
+    path_time = {}
+    path_prev = {}
+    while to_visit:
+        key = to_visit.pop()
+        best_prev = max(prev_keys[key], key=path_time.get, default=None)
+        path_prev[key] = best_prev
+        path_time[key] = (path_time[best_prev] if best_prev else 0) + profiles[key]['wall_time']
+        for next_key in next_keys[key]:
+            num_prev[next_key] -= 1
+            if not num_prev[next_key]:
+                to_visit.append(next_key)
+
+    end_key = max(path_time, key=path_time.get)
+    path = []
+    key = end_key
+    while key is not None:
+        path.append(profiles[key])
+        key = path_prev[key]
+    return path[::-1], path_time[end_key]
+
+
+def _fmt_bytes(num_bytes):
+    return f'{num_bytes / 1e9:.2f}GB'
+
+
+def format_report(profiles, sort='wall_time', top=20):
+    lines = [f'{len(profiles)} tasks profiled', '',
+             f'Functions by total {sort}:',
+             f'{"function":<60} {"count":>6} {"wall (s)":>10} {"cpu (s)":>10} {"max RSS (MB)":>12} '
+             f'{"read":>9} {"written":>9}']
+    costs = func_costs(profiles)
+    for func, cost in sorted(costs.items(), key=lambda item: -item[1][sort])[:top]:
+        lines.append(f'{func:<60} {int(cost["count"]):>6} {cost["wall_time"]:>10.1f} {cost["cpu_time"]:>10.1f} '
+                     f'{cost["peak_rss_mb"]:>12.0f} {_fmt_bytes(cost["read_bytes"]):>9} '
+                     f'{_fmt_bytes(cost["write_bytes"]):>9}')
+
+    path, path_time = critical_path(profiles)
+    total_wall_time = sum(r['wall_time'] for r in profiles.values())
+    lines += ['', f'Critical path: {len(path)} tasks, {path_time:.1f}s '
+                  f'(total wall time of all tasks: {total_wall_time:.1f}s)']
+    for record in path:
+        lines.append(f'  {record["wall_time"]:>10.1f}s {record["func"]} {record["path_hash_key"][:10]}')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Report on task profiles')
+    parser.add_argument('profile_path', nargs='?', default=None)
+    parser.add_argument('--sort', default='wall_time', choices=COST_KEYS + ['count'])
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--json', action='store_true', help='output function costs and critical path as JSON')
+    args = parser.parse_args(argv)
+
+    profiles = load_profiles(args.profile_path)
+    if args.json:
+        path, path_time = critical_path(profiles)
+        print(json.dumps({'func_costs': func_costs(profiles),
+                          'critical_path': [r['path_hash_key'] for r in path],
+                          'critical_path_time': path_time}))
+    else:
+        print(format_report(profiles, args.sort, args.top))
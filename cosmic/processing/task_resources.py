@@ -0,0 +1,298 @@
+"""Record the resources used by each task, and estimate the resources to request for tasks from this history.
+
+bsub_task_run appends one record for each task it runs to a JSON lines history file: the task's function, the
+total size of its inputs, its peak RSS and wall time. The submitters use the history to request memory and
+runtime for each task: the largest recorded use for the same function, from the runs with the closest input
+sizes (scaled up if this task has larger inputs), plus a margin. Tasks with no history use the default
+resources given to the submitter.
+
+When a job is killed for exceeding its memory limit (LSF TERM_MEMLIMIT, SLURM OUT_OF_MEMORY), an OOM record is
+added with the memory that was requested. Estimates for that function are then at least OOM_MEM_FACTOR times
+this. The submitters' --resubmit-oom option finds OOM killed jobs from the last submission, and resubmits them
+with more memory (see tasks_to_resubmit and TaskSubmitter.resubmit_oom_tasks).
+"""
+import os
+import sys
+import json
+import logging
+import math
+import resource
+from contextlib import contextmanager
+from pathlib import Path
+from timeit import default_timer as timer
+
+from cosmic.util import sysrun
+
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
+# Relative to the dir jobs are submitted from (and run in), same as the job output.
+DEFAULT_HISTORY_PATH = 'processing_output/task_resources.jsonl'
+OOM_MEM_FACTOR = 2
+# Number of runs with the closest input sizes to use for estimates.
+NUM_NEAREST_RUNS = 5
+MIN_MEM_MB = 1000
+MIN_RUNTIME_S = 10 * 60
+
+
+def history_path():
+    return Path(os.getenv('COSMIC_TASK_RESOURCES', DEFAULT_HISTORY_PATH))
+
+
+def task_func_name(task):
+    return f'{task.func.__module__}.{task.func.__name__}'
+
+
+def task_input_size(task):
+    """Total size of task's inputs in bytes, or None if any are missing (e.g. not yet produced)."""
+    inputs = task.inputs.values() if isinstance(task.inputs, dict) else task.inputs
+    size = 0
+    for path in inputs:
+        path = Path(path)
+        if not path.exists():
+            return None
+        size += path.stat().st_size
+    return size
+
+
+def peak_rss_mb():
+    """Peak RSS of this process plus that of its largest child process, in MB (ru_maxrss is in kB on Linux)."""
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss +
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+
+
+class TaskResourceHistory:
+    """History of resources used by tasks, stored as one JSON record per line.
+
+    :param path: history file (default: $COSMIC_TASK_RESOURCES or DEFAULT_HISTORY_PATH)
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else history_path()
+        self._records = None
+
+    def _append(self, record):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # One short write in append mode, so that records from concurrent jobs are not interleaved.
+        with open(self.path, 'a') as fp:
+            fp.write(json.dumps(record) + '\n')
+        if self._records is not None:
+            self._records.append(record)
+
+    def record(self, task, rss_mb, wall_time):
+        self._append({'func': task_func_name(task),
+                      'input_size': task_input_size(task),
+                      'path_hash_key': task.path_hash_key(),
+                      'peak_rss_mb': rss_mb,
+                      'wall_time': wall_time})
+
+    def record_oom(self, task, mem_mb):
+        logger.warning(f'{task} killed for exceeding {mem_mb} MB')
+        self._append({'func': task_func_name(task),
+                      'input_size': task_input_size(task),
+                      'path_hash_key': task.path_hash_key(),
+                      'oom_mem_mb': mem_mb})
+
+    @property
+    def records(self):
+        if self._records is None:
+            self._records = []
+            if self.path.exists():
+                for line in self.path.read_text().split('\n'):
+                    if line.strip():
+                        self._records.append(json.loads(line))
+        return self._records
+
+    def _nearest_runs(self, func, input_size):
+        runs = [r for r in self.records if r['func'] == func and 'peak_rss_mb' in r]
+        if input_size is None:
+            return runs
+        runs = [r for r in runs if r['input_size'] is not None]
+
+        def size_distance(r):
+            return abs(math.log((r['input_size'] + 1) / (input_size + 1)))
+        return sorted(runs, key=size_distance)[:NUM_NEAREST_RUNS]
+
+    def estimate(self, task, mem_margin=0.2, runtime_margin=0.5):
+        """Estimate memory and runtime to request for task.
+
+        :param mem_margin: fraction of estimated memory to add
+        :param runtime_margin: fraction of estimated runtime to add
+        :return: (mem in MB, runtime in s), or None if there is no history for task's function
+        """
+        func = task_func_name(task)
+        input_size = task_input_size(task)
+        runs = self._nearest_runs(func, input_size)
+        ooms = [r for r in self.records if r['func'] == func and 'oom_mem_mb' in r]
+        if not runs and not ooms:
+            return None
+
+        def scale(r):
+            # Scale up (never down) for larger inputs.
+            if input_size is None or not r['input_size']:
+                return 1
+            return max(1, input_size / r['input_size'])
+
+        mem = max([r['peak_rss_mb'] * scale(r) for r in runs], default=0) * (1 + mem_margin)
+        runtime = max([r['wall_time'] * scale(r) for r in runs], default=0) * (1 + runtime_margin)
+        # Same task, or same function with similar input size.
+        oom_mems = [r['oom_mem_mb'] for r in ooms
+                    if r['path_hash_key'] == task.path_hash_key()
+                    or input_size is None or r['input_size'] is None
+                    or 0.5 <= (r['input_size'] + 1) / (input_size + 1) <= 2]
+        if oom_mems:
+            mem = max(mem, max(oom_mems) * OOM_MEM_FACTOR)
+        if not runs:
+            runtime = None
+        else:
+            runtime = max(runtime, MIN_RUNTIME_S)
+        return max(math.ceil(mem), MIN_MEM_MB), runtime
+
+
+@contextmanager
+def record_task_resources(task, history=None):
+    """Record the peak RSS and wall time of task, if it runs without error.
+
+    Peak RSS is for the whole process, so should be used in a process that runs one task.
+    """
+    history = history or TaskResourceHistory()
+    start = timer()
+    yield
+    wall_time = timer() - start
+    rss = peak_rss_mb()
+    logger.info(f'{task}: peak RSS {rss:.0f} MB, wall time {wall_time:.1f}s')
+    history.record(task, rss, wall_time)
+
+
+def estimate_resources(tasks, history, default_mem, default_runtime, ncores=1, mem_margin=0.2,
+                       runtime_margin=0.5, max_mem=None):
+    """Resources to request for a job that runs tasks (ncores at a time).
+
+    :param default_mem: memory (MB) to use if any task has no history
+    :param default_runtime: runtime (s) to use if any task has no runtime history
+    :param max_mem: if set, cap on memory (MB)
+    :return: mem in MB, runtime in s
+    """
+    estimates = [history.estimate(task, mem_margin, runtime_margin) for task in tasks]
+    if any(e is None for e in estimates):
+        mem = default_mem
+    else:
+        mem = max(e[0] for e in estimates) * min(ncores, len(tasks))
+    if any(e is None or e[1] is None for e in estimates):
+        runtime = default_runtime
+    else:
+        runtime = max(e[1] for e in estimates) * math.ceil(len(tasks) / ncores)
+    if max_mem:
+        mem = min(mem, max_mem)
+    return mem, runtime
+
+
+def parse_runtime(runtime):
+    """Runtime in s from HH:MM or HH:MM:SS (the formats used by the submitters)."""
+    parts = [int(p) for p in str(runtime).split(':')]
+    if len(parts) == 2:
+        parts.append(0)
+    seconds = 0
+    for part in parts:
+        seconds = seconds * 60 + part
+    return seconds
+
+
+def format_runtime(seconds, include_seconds=False):
+    """Runtime as HH:MM (LSF -W) or HH:MM:SS (SLURM --time), rounded up to the minute."""
+    minutes = math.ceil(seconds / 60)
+    hours, minutes = divmod(minutes, 60)
+    if include_seconds:
+        return f'{hours:02}:{minutes:02}:00'
+    return f'{hours:02}:{minutes:02}'
+
+
+# Scheduler job states that mean the job was killed for exceeding its memory limit.
+LSF_OOM_EXIT_REASON = 'TERM_MEMLIMIT'
+SLURM_OOM_STATE = 'OUT_OF_MEMORY'
+
+
+PENDING_STATES = ['PEND', 'PSUSP', 'PENDING']
+# Scheduler states of jobs that finished successfully.
+DONE_STATES = ['DONE', 'COMPLETED']
+
+
+def query_lsf_job_states(jobs):
+    """States of LSF jobs.
+
+    :param jobs: list of (jobid, array index or None)
+    :return: dict of (jobid, index) to state: 'OOM', or the LSF state (PEND, RUN, DONE, EXIT...)
+    """
+    jobids = sorted({jobid for jobid, _ in jobs})
+    output = sysrun(f'bjobs -a -noheader -o "jobid jobindex stat exit_reason delimiter=\'|\'" '
+                    f'{" ".join(jobids)}').stdout
+    states = {}
+    for line in output.strip().split('\n'):
+        if not line.strip():
+            continue
+        jobid, index, stat, exit_reason = line.split('|', 3)
+        index = int(index) if index.strip() not in ['', '0', '-'] else None
+        states[(jobid, index)] = 'OOM' if LSF_OOM_EXIT_REASON in exit_reason else stat
+    return states
+
+
+def query_slurm_job_states(jobs):
+    """States of SLURM jobs, as for query_lsf_job_states, with SLURM states (PENDING, RUNNING, COMPLETED...)."""
+    jobids = sorted({jobid for jobid, _ in jobs})
+    output = sysrun(f'sacct -n -P -o JobID,State -j {",".join(jobids)}').stdout
+    states = {}
+    for line in output.strip().split('\n'):
+        if not line.strip():
+            continue
+        job, state = line.split('|')
+        # Job steps (e.g. 1000_2.batch) can be OOM killed when the job itself is just FAILED.
+        job, _, step = job.partition('.')
+        jobid, _, index = job.partition('_')
+        key = (jobid, int(index) if index else None)
+        state = 'OOM' if state.startswith(SLURM_OOM_STATE) else state.split()[0]
+        if not step or state == 'OOM':
+            states[key] = state
+    return states
+
+
+def lsf_job_ref(jobid, index):
+    """LSF reference to a job, or to one element of a job array (e.g. 1000[2])."""
+    return f'{jobid}[{index}]' if index else jobid
+
+
+def slurm_job_ref(jobid, index):
+    """SLURM reference to a job, or to one element of a job array (e.g. 1000_2)."""
+    return f'{jobid}_{index}' if index else jobid
+
+
+def cancel_lsf_jobs(jobs):
+    sysrun('bkill ' + ' '.join([f'"{lsf_job_ref(jobid, index)}"' for jobid, index in jobs]))
+
+
+def cancel_slurm_jobs(jobs):
+    sysrun('scancel ' + ' '.join([slurm_job_ref(jobid, index) for jobid, index in jobs]))
+
+
+def tasks_to_resubmit(task_ctrl, submitted_jobs, job_states, history):
+    """Find OOM killed tasks, record them in history, and find the tasks that need resubmitting.
+
+    :param submitted_jobs: list of dicts with path_hash_key, jobid, index, mem for each submitted task
+    :param job_states: from query_lsf_job_states/query_slurm_job_states
+    :return: OOM killed tasks and their submitted descendants (in submission order), and their jobs
+    """
+    task_jobs = {}
+    for job in submitted_jobs:
+        task = task_ctrl.task_from_path_hash_key[job['path_hash_key']]
+        task_jobs[task] = job
+
+    resubmit = set()
+    for task, job in task_jobs.items():
+        if job_states.get((job['jobid'], job['index'])) == 'OOM':
+            history.record_oom(task, job['mem'])
+            resubmit.add(task)
+    # Descendants will never run: their dependencies cannot be satisfied.
+    for task in task_jobs:
+        if any(prev_task in resubmit for prev_task in task_ctrl.prev_tasks[task]):
+            resubmit.add(task)
+    return [(task, job) for task, job in task_jobs.items() if task in resubmit]
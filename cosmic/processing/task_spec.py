@@ -0,0 +1,135 @@
+"""Task specs: everything needed to run a remake task without loading and finalizing its task control.
+
+The submitter writes the specs for all submitted tasks to one pickle file, keyed by path_hash_key. A batch job
+then reads the spec for its task, and calls the task's function directly. Only the task's own inputs and outputs
+are checked: the inputs must exist, and the task is skipped if its outputs are newer than its inputs and the
+specs file (i.e. another job has already produced them since submission). No other task's metadata is read, so
+there is no contention between jobs and no race with jobs that are writing metadata.
+
+N.B. remake's metadata for the outputs is not written when running a task from its spec; remake brings it up to
+date from the files the next time the task control is finalized.
+
+example usage:
+    write_task_specs(specs_path, config_path, tasks)
+    spec = read_task_spec(specs_path, task_path_hash_key)
+    spec.run()
+"""
+import os
+import sys
+import logging
+import importlib
+import pickle
+from pathlib import Path
+
+from cosmic.cosmic_errors import CosmicError
+from cosmic.util import load_module
+
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _paths(paths):
+    if isinstance(paths, dict):
+        return {k: Path(v) for k, v in paths.items()}
+    return [Path(p) for p in paths]
+
+
+def _path_values(paths):
+    return list(paths.values()) if isinstance(paths, dict) else list(paths)
+
+
+class TaskSpec:
+    """Function, inputs, outputs and args of a task.
+
+    Has the same attributes as a remake Task that are used by e.g. task_resources (func, inputs, path_hash_key).
+    The function is stored by module and qualified name, and looked up when first used: functions defined in
+    the config file are loaded from config_path.
+    """
+
+    def __init__(self, path_hash_key, config_path, func_module, func_name, inputs, outputs,
+                 func_args=(), func_kwargs=None):
+        self._path_hash_key = path_hash_key
+        self.config_path = Path(config_path)
+        self.func_module = func_module
+        self.func_name = func_name
+        self.inputs = _paths(inputs)
+        self.outputs = _paths(outputs)
+        self.func_args = tuple(func_args)
+        self.func_kwargs = func_kwargs or {}
+        self._func = None
+
+    @classmethod
+    def from_task(cls, task, config_path):
+        return cls(task.path_hash_key(), config_path, task.func.__module__, task.func.__qualname__,
+                   task.inputs, task.outputs, task.func_args, task.func_kwargs)
+
+    def __repr__(self):
+        return f'TaskSpec({self.func_module}.{self.func_name}, {self._path_hash_key})'
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_func'] = None
+        return state
+
+    def path_hash_key(self):
+        return self._path_hash_key
+
+    @property
+    def func(self):
+        if self._func is None:
+            if self.func_module in ['__main__', self.config_path.stem]:
+                module = load_module(self.config_path)
+            else:
+                module = importlib.import_module(self.func_module)
+            func = module
+            for name in self.func_name.split('.'):
+                func = getattr(func, name)
+            self._func = func
+        return self._func
+
+    def is_up_to_date(self, since=0):
+        """True if all outputs exist, and are newer than all inputs and since (a timestamp)."""
+        outputs = _path_values(self.outputs)
+        if not all(p.exists() for p in outputs):
+            return False
+        latest = max([p.stat().st_mtime for p in _path_values(self.inputs)] + [since])
+        return min(p.stat().st_mtime for p in outputs) >= latest
+
+    def run(self, since=None):
+        """Run task, unless since is set and its outputs have been produced since then.
+
+        :param since: timestamp, e.g. of submission
+        :raises CosmicError: if any input is missing
+        :return: True if the task was run
+        """
+        missing = [p for p in _path_values(self.inputs) if not p.exists()]
+        if missing:
+            raise CosmicError(f'{self}: missing inputs: {missing}')
+        if since is not None and self.is_up_to_date(since):
+            logger.info(f'{self}: outputs up to date, not running')
+            return False
+        for output in _path_values(self.outputs):
+            output.parent.mkdir(parents=True, exist_ok=True)
+        logger.info(f'running {self}')
+        self.func(self.inputs, self.outputs, *self.func_args, **self.func_kwargs)
+        return True
+
+
+def write_task_specs(specs_path, config_path, tasks):
+    """Write specs for tasks to specs_path."""
+    specs_path = Path(specs_path)
+    specs = {task.path_hash_key(): TaskSpec.from_task(task, config_path) for task in tasks}
+    # Write then rename, so that running jobs never read a partially written file.
+    tmp_path = specs_path.parent / (specs_path.name + '.tmp')
+    with open(tmp_path, 'wb') as fp:
+        pickle.dump(specs, fp)
+    tmp_path.replace(specs_path)
+
+
+def read_task_spec(specs_path, task_path_hash_key):
+    with open(specs_path, 'rb') as fp:
+        specs = pickle.load(fp)
+    if task_path_hash_key not in specs:
+        raise CosmicError(f'No spec for task {task_path_hash_key} in {specs_path}')
+    return specs[task_path_hash_key]
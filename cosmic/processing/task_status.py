@@ -0,0 +1,54 @@
+"""Task status files: written by bsub_task_run when each task finishes, read by e.g. the rolling submitter.
+
+One empty file per task in the status dir: {path_hash_key}.done or {path_hash_key}.failed. Checking for a file is
+much cheaper than querying the scheduler or finalizing the task control.
+"""
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+# Relative to the dir jobs are submitted from (and run in), same as the job output.
+DEFAULT_STATUS_DIR = 'processing_output/task_status'
+STATUSES = ['done', 'failed']
+
+
+def status_dir():
+    return Path(os.getenv('COSMIC_TASK_STATUS_DIR', DEFAULT_STATUS_DIR))
+
+
+def write_task_status(task_path_hash_key, status, task_status_dir=None):
+    """Record that task has finished with status ('done' or 'failed'), replacing any previous status."""
+    assert status in STATUSES, f'unknown status {status}'
+    task_status_dir = Path(task_status_dir or status_dir())
+    task_status_dir.mkdir(parents=True, exist_ok=True)
+    for prev_status in STATUSES:
+        if prev_status != status:
+            (task_status_dir / f'{task_path_hash_key}.{prev_status}').unlink(missing_ok=True)
+    (task_status_dir / f'{task_path_hash_key}.{status}').touch()
+
+
+def read_task_status(task_path_hash_key, task_status_dir=None):
+    """Status of task: 'done', 'failed', or None if it has not finished."""
+    task_status_dir = Path(task_status_dir or status_dir())
+    for status in STATUSES:
+        if (task_status_dir / f'{task_path_hash_key}.{status}').exists():
+            return status
+    return None
+
+
+def clear_task_status(task_path_hash_key, task_status_dir=None):
+    task_status_dir = Path(task_status_dir or status_dir())
+    for status in STATUSES:
+        (task_status_dir / f'{task_path_hash_key}.{status}').unlink(missing_ok=True)
+
+
+@contextmanager
+def record_task_status(task_path_hash_key, task_status_dir=None):
+    """Write 'done' status if the task runs without error, otherwise 'failed'."""
+    clear_task_status(task_path_hash_key, task_status_dir)
+    try:
+        yield
+    except BaseException:
+        write_task_status(task_path_hash_key, 'failed', task_status_dir)
+        raise
+    write_task_status(task_path_hash_key, 'done', task_status_dir)
@@ -0,0 +1,271 @@
+"""Status service for remake task status files: an in-memory index, updated as files change.
+
+The status dir is scanned once. After that, only the files that change are re-read: watchdog is used to watch for
+changes if it is installed (use polling=True on shared filesystems, where inotify does not see writes from other
+nodes), otherwise the dir is rescanned but only files with a new mtime are read.
+
+Reads remake's status files (.remake/metadata_v3/task_status/<key>.status, one "<time>;<STATUS>" line appended
+for each change of status) and cosmic's task status files (<key>.done, <key>.failed, see task_status).
+
+Reports counts of tasks by status, throughput (tasks completed per minute), mean runtime for each task function
+and an ETA for completion. Task functions are looked up from the task resource history (see task_resources).
+
+example usage:
+    cosmic-task-status .remake/metadata_v3/task_status --total 1000
+    cosmic-task-status .remake/metadata_v3/task_status --watch --json
+"""
+import os
+import sys
+import json
+import logging
+import datetime as dt
+import threading
+import time
+from argparse import ArgumentParser
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from cosmic.processing.task_resources import TaskResourceHistory
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    from watchdog.observers.polling import PollingObserver
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+    PollingObserver = None
+
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATUS_DIR = '.remake/metadata_v3/task_status'
+STATUS_SUFFIXES = {'.done': 'COMPLETE', '.failed': 'ERROR'}
+FINISHED_STATUSES = ['COMPLETE', 'ERROR']
+
+
+def _parse_time(time_str):
+    try:
+        return dt.datetime.fromisoformat(time_str.strip()).timestamp()
+    except ValueError:
+        return None
+
+
+def parse_status_file(path):
+    """Status, start and end time (timestamps, or None) of task from its status file."""
+    if path.suffix in STATUS_SUFFIXES:
+        return STATUS_SUFFIXES[path.suffix], None, path.stat().st_mtime
+
+    status, start, end = None, None, None
+    for line in path.read_text().split('\n'):
+        if ';' not in line:
+            continue
+        time_str, status = line.rsplit(';', 1)
+        status = status.strip()
+        if status == 'RUNNING':
+            start, end = _parse_time(time_str), None
+        elif status in FINISHED_STATUSES:
+            end = _parse_time(time_str)
+    return status, start, end
+
+
+class TaskStatusIndex:
+    """In-memory index of task statuses.
+
+    :param task_funcs: mapping of task key to task function name, for runtimes by function
+    :param total_tasks: total number of tasks, for the ETA
+    """
+
+    def __init__(self, task_funcs=None, total_tasks=None):
+        self.task_funcs = task_funcs or {}
+        self.total_tasks = total_tasks
+        # key to (status, start, end).
+        self.tasks = {}
+        self.mtimes = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(path):
+        return path.stem
+
+    def update(self, path):
+        path = Path(path)
+        if path.suffix not in ['.status', *STATUS_SUFFIXES]:
+            return
+        try:
+            mtime = path.stat().st_mtime
+            task_status = parse_status_file(path)
+        except FileNotFoundError:
+            self.remove(path)
+            return
+        with self.lock:
+            self.mtimes[path] = mtime
+            self.tasks[self._key(path)] = task_status
+
+    def remove(self, path):
+        path = Path(path)
+        with self.lock:
+            self.mtimes.pop(path, None)
+            self.tasks.pop(self._key(path), None)
+
+    def scan(self, status_dir):
+        """Read files in status_dir that are new or have changed since the last scan."""
+        seen = set()
+        with os.scandir(status_dir) as it:
+            for entry in it:
+                path = Path(entry.path)
+                seen.add(path)
+                if self.mtimes.get(path) != entry.stat().st_mtime:
+                    self.update(path)
+        for path in set(self.mtimes) - seen:
+            self.remove(path)
+
+    def summary(self, now=None, window=600):
+        """Summary of task statuses.
+
+        :param now: current time (timestamp)
+        :param window: throughput is calculated from tasks completed in the last window seconds
+        :return: dict of counts, tasks_per_minute, mean_runtimes (by function), eta (seconds, or None)
+        """
+        now = now or time.time()
+        with self.lock:
+            tasks = dict(self.tasks)
+        counts = Counter(status for status, _, _ in tasks.values())
+
+        end_times = [end for status, _, end in tasks.values() if status == 'COMPLETE' and end]
+        recent = [end for end in end_times if end > now - window]
+        tasks_per_minute = 0
+        if recent:
+            # Use time since the first completion if that is shorter than the window.
+            duration = min(window, now - min(end_times))
+            tasks_per_minute = len(recent) / max(duration, 1) * 60
+
+        runtimes = defaultdict(list)
+        for key, (status, start, end) in tasks.items():
+            if status == 'COMPLETE' and start and end:
+                runtimes[self.task_funcs.get(key, 'unknown')].append(end - start)
+        mean_runtimes = {func: sum(r) / len(r) for func, r in sorted(runtimes.items())}
+
+        eta = None
+        if self.total_tasks is not None and tasks_per_minute:
+            remaining = self.total_tasks - counts['COMPLETE']
+            eta = max(remaining, 0) / tasks_per_minute * 60
+        return {
+            'time': dt.datetime.fromtimestamp(now).isoformat(timespec='seconds'),
+            'counts': dict(counts),
+            'total_tasks': self.total_tasks,
+            'tasks_per_minute': tasks_per_minute,
+            'mean_runtimes': mean_runtimes,
+            'eta': eta,
+        }
+
+
+def format_summary(summary):
+    lines = [f'Time    : {summary["time"]}']
+    for status in ['COMPLETE', 'RUNNING', 'ERROR']:
+        lines.append(f'{status.capitalize():<8}: {summary["counts"].get(status, 0)}'
+                     + (f'/{summary["total_tasks"]}' if status == 'COMPLETE' and summary['total_tasks'] else ''))
+    for status, count in summary['counts'].items():
+        if status not in ['COMPLETE', 'RUNNING', 'ERROR']:
+            lines.append(f'{status.capitalize():<8}: {count}')
+    lines.append(f'Rate    : {summary["tasks_per_minute"]:.1f} tasks/min')
+    if summary['eta'] is not None:
+        lines.append(f'ETA     : {dt.timedelta(seconds=int(summary["eta"]))}')
+    for func, runtime in summary['mean_runtimes'].items():
+        lines.append(f'  {func}: {runtime:.1f}s mean runtime')
+    return '\n'.join(lines)
+
+
+class _StatusEventHandler(FileSystemEventHandler):
+    def __init__(self, index):
+        super().__init__()
+        self.index = index
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.index.update(event.src_path)
+
+    on_modified = on_created
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self.index.remove(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.index.remove(event.src_path)
+            self.index.update(event.dest_path)
+
+
+class TaskStatusService:
+    """Keep a TaskStatusIndex up to date with a status dir.
+
+    :param status_dir: dir of status files
+    :param index: TaskStatusIndex
+    :param polling: use watchdog's polling observer (needed on shared filesystems)
+    """
+
+    def __init__(self, status_dir, index, polling=False):
+        self.status_dir = Path(status_dir)
+        self.index = index
+        self.observer = None
+        if Observer is not None:
+            self.observer = PollingObserver() if polling else Observer()
+            self.observer.schedule(_StatusEventHandler(index), str(self.status_dir))
+
+    def start(self):
+        self.index.scan(self.status_dir)
+        if self.observer:
+            self.observer.start()
+        else:
+            logger.debug('watchdog not installed: rescanning for changed files')
+
+    def refresh(self):
+        """Update index. Only needed if watchdog is not installed."""
+        if not self.observer:
+            self.index.scan(self.status_dir)
+
+    def stop(self):
+        if self.observer:
+            self.observer.stop()
+            self.observer.join()
+
+
+def task_funcs_from_history(history_path=None):
+    history = TaskResourceHistory(history_path)
+    return {r['path_hash_key']: r['func'] for r in history.records}
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='Report status of remake tasks')
+    parser.add_argument('status_dir', nargs='?', default=DEFAULT_STATUS_DIR)
+    parser.add_argument('--total', type=int, help='total number of tasks, for ETA')
+    parser.add_argument('--resource-history', help='task resource history, for task functions')
+    parser.add_argument('--json', action='store_true', help='output JSON')
+    parser.add_argument('--watch', action='store_true', help='keep running, reporting every --interval seconds')
+    parser.add_argument('--interval', type=float, default=10)
+    parser.add_argument('--polling', action='store_true',
+                        help='poll for changes (for shared filesystems, where inotify does not work)')
+    args = parser.parse_args(argv)
+
+    index = TaskStatusIndex(task_funcs_from_history(args.resource_history), args.total)
+    service = TaskStatusService(args.status_dir, index, args.polling)
+    service.start()
+
+    def report():
+        summary = index.summary()
+        print(json.dumps(summary) if args.json else format_summary(summary), flush=True)
+        return summary
+
+    try:
+        summary = report()
+        while args.watch:
+            time.sleep(args.interval)
+            service.refresh()
+            summary = report()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+    return summary
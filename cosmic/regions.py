@@ -0,0 +1,158 @@
+"""Registry of lat/lon regions, with index based subsetting of regular grids.
+
+Each region is resolved to integer index slices for a given grid, once, and the slices are cached by a
+fingerprint of the grid. Subsetting a (lazily loaded) cube then only reads the hyperslab for the region from
+disk, instead of evaluating a constraint for every coord cell and copying the result.
+Regions that cross the grid's longitude seam (e.g. europe on a 0-360 grid) are supported: the result has
+monotonic longitudes from lon_bounds[0] to lon_bounds[1].
+
+example usage:
+    asia_cube = load_region_cube(filename, 'asia')
+    china_cube = extract_region(cube, 'china')
+    lat_slice, lon_slice = get_region('asia').index_slices(lat, lon)
+"""
+from collections import namedtuple
+
+import iris
+import iris.cube
+import numpy as np
+
+from cosmic.cosmic_errors import CosmicError
+from cosmic.util import grid_fingerprint
+
+RegionIndex = namedtuple('RegionIndex', ['lat_slice', 'lon_slices', 'lon_offsets'])
+
+
+class Region:
+    """Lat/lon box.
+
+    :param name: name of region
+    :param lat_bounds: (lat_min, lat_max)
+    :param lon_bounds: (lon_min, lon_max) - can cross the grid's lon seam, e.g. (-22, 37) on a 0-360 grid
+
+    Bounds are exclusive, as for the constraints in cosmic.config.
+    """
+
+    def __init__(self, name, lat_bounds, lon_bounds):
+        self.name = name
+        self.lat_bounds = lat_bounds
+        self.lon_bounds = lon_bounds
+        self._index_cache = {}
+
+    def __repr__(self):
+        return f'Region({self.name}, {self.lat_bounds}, {self.lon_bounds})'
+
+    @staticmethod
+    def _in_bounds(values, lower, upper):
+        return (values > lower) & (values < upper)
+
+    def index(self, lat, lon):
+        """Index slices of region for the grid given by lat, lon (both 1D, monotonic).
+
+        :return: RegionIndex: lat_slice; lon_slices, one for each contiguous run of lons in order of increasing
+        lon (two if the region crosses the lon seam); lon_offsets, multiple of 360 to add to each run's lons
+        """
+        key = grid_fingerprint(lat, lon)
+        if key not in self._index_cache:
+            self._index_cache[key] = self._calc_index(np.asarray(lat), np.asarray(lon))
+        return self._index_cache[key]
+
+    def index_slices(self, lat, lon):
+        """Index slices of region for grid, for regions that do not cross the lon seam.
+
+        :return: lat_slice, lon_slice
+        """
+        region_index = self.index(lat, lon)
+        if len(region_index.lon_slices) != 1:
+            raise CosmicError(f'{self} crosses the longitude seam of grid: use index')
+        return region_index.lat_slice, region_index.lon_slices[0]
+
+    def _calc_index(self, lat, lon):
+        lat_index = np.where(self._in_bounds(lat, *self.lat_bounds))[0]
+        lon_min, lon_max = self.lon_bounds
+        # Lons relative to lon_min, in [0, 360): independent of the grid's lon range.
+        rel_lon = (lon - lon_min) % 360
+        lon_index = np.where(self._in_bounds(rel_lon, 0, lon_max - lon_min))[0]
+        if not len(lat_index) or not len(lon_index):
+            raise CosmicError(f'{self} does not intersect grid')
+
+        # Order by increasing lon from lon_min, then split into contiguous runs.
+        lon_index = lon_index[np.argsort(rel_lon[lon_index], kind='stable')]
+        breaks = np.where(np.diff(lon_index) != 1)[0] + 1
+        lon_runs = np.split(lon_index, breaks)
+        lon_slices = [slice(run[0], run[-1] + 1) for run in lon_runs]
+        lon_offsets = [lon_min + rel_lon[run[0]] - lon[run[0]] for run in lon_runs]
+        # Rounded to nearest multiple of 360.
+        lon_offsets = [360 * np.round(offset / 360) for offset in lon_offsets]
+        return RegionIndex(slice(lat_index[0], lat_index[-1] + 1), lon_slices, lon_offsets)
+
+
+REGIONS = {
+    'asia': Region('asia', (0.9, 56.1), (56.9, 151.1)),
+    'china': Region('china', (18, 41), (97.5, 125)),
+    # Based on Malcolm Roberts' request and expanded by 2deg.
+    'europe': Region('europe', (28, 67), (-22, 37)),
+}
+
+
+def get_region(region):
+    """Region from name (or Region)."""
+    if isinstance(region, Region):
+        return region
+    if region not in REGIONS:
+        raise CosmicError(f'Unknown region: {region}, must be one of {list(REGIONS)}')
+    return REGIONS[region]
+
+
+def extract_region(cube, region):
+    """Subset cube to region using index slices.
+
+    Lazy data stays lazy, so only the region's hyperslab is read when the data is realised.
+    :param cube: cube with 1D latitude and longitude dim coords
+    :param region: region name or Region
+    :return: subset cube
+    """
+    region = get_region(region)
+    lat = cube.coord('latitude')
+    lon = cube.coord('longitude')
+    lat_dim = cube.coord_dims(lat)[0]
+    lon_dim = cube.coord_dims(lon)[0]
+    region_index = region.index(lat.points, lon.points)
+
+    pieces = iris.cube.CubeList()
+    for lon_slice, lon_offset in zip(region_index.lon_slices, region_index.lon_offsets):
+        keys = [slice(None)] * cube.ndim
+        keys[lat_dim] = region_index.lat_slice
+        keys[lon_dim] = lon_slice
+        piece = cube[tuple(keys)]
+        if lon_offset:
+            piece_lon = piece.coord('longitude')
+            piece_lon.points = piece_lon.points + lon_offset
+            if piece_lon.has_bounds():
+                piece_lon.bounds = piece_lon.bounds + lon_offset
+        pieces.append(piece)
+    if len(pieces) == 1:
+        return pieces[0]
+    for piece in pieces:
+        piece.coord('longitude').circular = False
+    return pieces.concatenate_cube()
+
+
+def load_region(filenames, region, constraint=None):
+    """Load cubes from filenames, subset to region.
+
+    :param filenames: filename, glob or list of filenames
+    :param region: region name or Region
+    :param constraint: any other constraint to apply on load
+    :return: CubeList
+    """
+    if isinstance(filenames, (list, tuple)):
+        filenames = [str(f) for f in filenames]
+    else:
+        filenames = str(filenames)
+    return iris.cube.CubeList([extract_region(cube, region) for cube in iris.load(filenames, constraint)])
+
+
+def load_region_cube(filename, region, constraint=None):
+    """Load one cube from filename, subset to region."""
+    return extract_region(iris.load_cube(str(filename), constraint), region)
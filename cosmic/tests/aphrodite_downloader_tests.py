@@ -0,0 +1,140 @@
+import base64
+import gzip
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from cosmic.datasets.aphrodite import StreamingAphroditeDownloader, GZ_FILE_TPL, FILE_TPL
+
+USERNAME = 'user'
+PASSWORD = 'secret'
+YEARS = [1998, 1999, 2000, 2001]
+
+
+class FakeAphroditeServer(ThreadingHTTPServer):
+    """Serves gzipped files with basic auth and Range support.
+
+    Drops the connection part way through the first response for each path in drop_paths.
+    """
+    def __init__(self, files, drop_paths=()):
+        super().__init__(('127.0.0.1', 0), FakeAphroditeHandler)
+        self.files = files
+        self.drop_paths = set(drop_paths)
+        self.client_ports = set()
+        self.range_requests = []
+
+
+class FakeAphroditeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.client_ports.add(self.client_address[1])
+        expected_auth = 'Basic ' + base64.b64encode(f'{USERNAME}:{PASSWORD}'.encode()).decode()
+        if self.headers.get('Authorization') != expected_auth:
+            self.send_response(401)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        content = server.files.get(self.path.rsplit('/', 1)[1])
+        if content is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        start = 0
+        if 'Range' in self.headers:
+            start = int(self.headers['Range'].split('=')[1].split('-')[0])
+            server.range_requests.append((self.path, start))
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(content) - 1}/{len(content)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(content) - start))
+        self.end_headers()
+
+        if self.path in server.drop_paths:
+            server.drop_paths.remove(self.path)
+            self.wfile.write(content[start:start + len(content) // 3])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(content[start:])
+
+
+@pytest.fixture
+def raw_data():
+    rng = np.random.default_rng(0)
+    # Compressible, but not trivially so.
+    return {year: rng.integers(0, 10, 200_000, dtype=np.uint8).tobytes() for year in YEARS}
+
+
+def _serve(server):
+    thread = threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05})
+    thread.start()
+    return thread
+
+
+def _gz_files(raw_data):
+    return {GZ_FILE_TPL.format(year=year): gzip.compress(data) for year, data in raw_data.items()}
+
+
+def test_concurrent_download_reuses_connections(tmp_path, raw_data):
+    server = FakeAphroditeServer(_gz_files(raw_data))
+    thread = _serve(server)
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}/product/'
+        downloader = StreamingAphroditeDownloader(tmp_path, USERNAME, PASSWORD, num_workers=2, url=url,
+                                                  chunk_size=4096)
+        failed = downloader.download_years(YEARS)
+    finally:
+        server.shutdown()
+        thread.join()
+
+    assert not failed
+    # One connection per worker.
+    assert len(server.client_ports) <= 2
+    for year, data in raw_data.items():
+        assert (tmp_path / FILE_TPL.format(year=year)).read_bytes() == data
+    assert not list(tmp_path.glob('*.gz')) and not list(tmp_path.glob('*.part'))
+
+
+def test_resume_after_dropped_connection(tmp_path, raw_data):
+    drop_path = '/product/' + GZ_FILE_TPL.format(year=1999)
+    server = FakeAphroditeServer(_gz_files(raw_data), drop_paths=[drop_path])
+    thread = _serve(server)
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}/product/'
+        downloader = StreamingAphroditeDownloader(tmp_path, USERNAME, PASSWORD, num_workers=2, url=url,
+                                                  chunk_size=4096)
+        failed = downloader.download_years(YEARS)
+    finally:
+        server.shutdown()
+        thread.join()
+
+    assert not failed
+    assert len(server.range_requests) == 1
+    path, start = server.range_requests[0]
+    assert path == drop_path and start > 0
+    assert (tmp_path / FILE_TPL.format(year=1999)).read_bytes() == raw_data[1999]
+
+
+def test_bad_credentials(tmp_path, raw_data):
+    server = FakeAphroditeServer(_gz_files(raw_data))
+    thread = _serve(server)
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}/product/'
+        downloader = StreamingAphroditeDownloader(tmp_path, USERNAME, 'wrong', num_workers=2, url=url)
+        failed = downloader.download_years([1998])
+    finally:
+        server.shutdown()
+        thread.join()
+
+    assert failed == [1998]
+    assert not (tmp_path / FILE_TPL.format(year=1998)).exists()
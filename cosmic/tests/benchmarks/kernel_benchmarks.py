@@ -0,0 +1,156 @@
+"""Benchmarks of the hot kernels on synthetic data with the shapes of the real data (see synthetic_data).
+
+Tracks time (pytest-benchmark) and peak memory (tracemalloc, measured in a separate untimed run, and saved in
+the benchmark's extra_info). Peak memory is checked against a budget for each kernel, relative to the size of
+its input data, so that memory regressions fail straight away.
+
+example usage:
+    # Save a baseline, then compare against it, failing if any kernel is >10% slower.
+    pytest cosmic/tests/benchmarks/kernel_benchmarks.py --benchmark-autosave
+    pytest cosmic/tests/benchmarks/kernel_benchmarks.py --benchmark-compare --benchmark-compare-fail=mean:10%
+    # Real shapes (N1280 Asia, a full season).
+    COSMIC_BENCH_SCALE=1 COSMIC_BENCH_DAYS=92 pytest cosmic/tests/benchmarks/kernel_benchmarks.py
+"""
+import io
+import tracemalloc
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from cosmic.fourier_series import fourier_coeffs
+from cosmic.util import CalcLatLonDistanceMask, calc_uniform_lat_lon_grad, predominant_pixel_2d, regrid
+from cosmic.WP2.diurnal_cycle_analysis import calc_diurnal_cycle_phase_amp_harmonic
+from cosmic.WP2.seasonal_precip_analysis import calc_precip_amount_freq_intensity
+from cosmic.datasets.cmorph.cmorph_convert import _load_raw_0p25deg_3hrly, _load_raw_8km_30min, NLAT_8KM, NLON_8KM
+from cosmic.tests.benchmarks import synthetic_data as sd
+
+MB = 1e6
+
+
+def run_benchmark(benchmark, func, *args, mem_budget=None, **kwargs):
+    """Time func, and record its peak memory in benchmark.extra_info['peak_mem_mb'].
+
+    :param mem_budget: max allowed peak memory in bytes
+    :return: result of func
+    """
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        _, peak_mem = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    benchmark.extra_info['peak_mem_mb'] = peak_mem / MB
+    benchmark.extra_info['scale'] = sd.SCALE
+    result = benchmark.pedantic(func, args, kwargs, rounds=sd.ROUNDS, iterations=1)
+    if mem_budget is not None:
+        assert peak_mem <= mem_budget, f'peak memory {peak_mem / MB:.1f}MB > budget {mem_budget / MB:.1f}MB'
+    return result
+
+
+@pytest.fixture(scope='module')
+def n1280_asia_lat_lon():
+    return sd.n1280_asia_lat_lon(sd.SCALE)
+
+
+@pytest.mark.parametrize('calc_method', ['low_mem', 'reshape'])
+@pytest.mark.parametrize('num_per_day', [24, 48])
+def test_precip_amount_freq_intensity(benchmark, n1280_asia_lat_lon, calc_method, num_per_day):
+    season_cube = sd.precip_cube(*n1280_asia_lat_lon, sd.NUM_DAYS, num_per_day)
+    # Both methods calc the season mean and std (float64) from all of the data first.
+    mem_budget = {'low_mem': 2, 'reshape': 3.5}[calc_method] * season_cube.data.nbytes
+    analysis_cubes = run_benchmark(benchmark, calc_precip_amount_freq_intensity, 'jja', season_cube, 0.1,
+                                   num_per_day=num_per_day, calc_method=calc_method, mem_budget=mem_budget)
+    assert analysis_cubes[2].shape == (num_per_day, *season_cube.shape[1:])
+
+
+def test_fourier_coeffs(benchmark, n1280_asia_lat_lon):
+    dc_cube = sd.diurnal_cycle_cube(*n1280_asia_lat_lon, 24)
+    x = np.linspace(0, 23, 24)
+    a, b = run_benchmark(benchmark, fourier_coeffs, dc_cube.data, x, max_n=5,
+                         mem_budget=15 * dc_cube.data.nbytes)
+    assert a[1].shape == dc_cube.shape[1:]
+
+
+def test_diurnal_cycle_phase_amp_harmonic(benchmark, n1280_asia_lat_lon):
+    dc_cube = sd.diurnal_cycle_cube(*n1280_asia_lat_lon, 24)
+    phase, mag = run_benchmark(benchmark, calc_diurnal_cycle_phase_amp_harmonic, dc_cube,
+                               mem_budget=15 * dc_cube.data.nbytes)
+    assert phase.shape == dc_cube.shape[1:]
+
+
+def test_lat_lon_distance_mask(benchmark, n1280_asia_lat_lon, tmp_path):
+    Lon, Lat = np.meshgrid(n1280_asia_lat_lon[1], n1280_asia_lat_lon[0])
+    mask_size = Lat.shape[0] * Lat.size
+
+    def calc_distance_mask(cache_key):
+        cache_key.unlink(missing_ok=True)
+        return CalcLatLonDistanceMask(Lat, Lon, cache_key=cache_key)
+
+    dist_mask = run_benchmark(benchmark, calc_distance_mask, tmp_path / 'cache_mask.npy',
+                              mem_budget=1.5 * mask_size + 10 * Lat.nbytes)
+    assert dist_mask.cache_mask.shape == (Lat.shape[0], *Lat.shape)
+
+
+def test_lat_lon_distance_close_to_mask(benchmark, n1280_asia_lat_lon, tmp_path):
+    Lon, Lat = np.meshgrid(n1280_asia_lat_lon[1], n1280_asia_lat_lon[0])
+    dist_mask = CalcLatLonDistanceMask(Lat, Lon, cache_key=tmp_path / 'cache_mask.npy')
+    # Sparse mask, like the mask of precip above a high threshold.
+    mask = sd.field_cube(*n1280_asia_lat_lon)
+    mask.data = np.random.default_rng(0).random(Lat.shape) > 0.999
+    mask.data[0, :10] = True
+    close_to_mask = run_benchmark(benchmark, dist_mask.calc_close_to_mask, mask, mem_budget=4 * Lat.size)
+    assert close_to_mask.data.sum() >= mask.data.sum()
+
+
+def test_uniform_lat_lon_grad(benchmark):
+    # Needs global lons: lon is circular.
+    orog = sd.field_cube(*sd.n1280_lat_lon(sd.SCALE))
+    dfdx, dfdy = run_benchmark(benchmark, calc_uniform_lat_lon_grad, orog, mem_budget=10 * orog.data.nbytes)
+    assert dfdx.shape == (orog.shape[0] - 2, orog.shape[1])
+
+
+def test_predominant_pixel_2d(benchmark, n1280_asia_lat_lon):
+    # E.g. land cover classes, coarse grained onto N1280.
+    grain_size = [4, 4]
+    shape = [len(n1280_asia_lat_lon[0]) * grain_size[0], len(n1280_asia_lat_lon[1]) * grain_size[1]]
+    arr = np.random.default_rng(0).integers(0, 10, shape)
+    coarse_arr = run_benchmark(benchmark, predominant_pixel_2d, arr, grain_size, mem_budget=arr.nbytes)
+    assert coarse_arr.shape == tuple(len(v) for v in n1280_asia_lat_lon)
+
+
+def test_regrid_cmorph_8km_to_n1280(benchmark, n1280_asia_lat_lon):
+    # One day of CMORPH 8km-30min data.
+    cmorph_cube = sd.precip_cube(*sd.cmorph_8km_asia_lat_lon(sd.SCALE), 1, 48, units='mm hr-1')
+    target_cube = sd.field_cube(*n1280_asia_lat_lon)
+    n1280_cube = run_benchmark(benchmark, regrid, cmorph_cube, target_cube,
+                               mem_budget=8 * cmorph_cube.data.nbytes)
+    assert n1280_cube.shape == (48, *target_cube.shape)
+
+
+@pytest.fixture(scope='module')
+def raw_cmorph_0p25deg(tmp_path_factory):
+    path = tmp_path_factory.mktemp('cmorph') / 'CMORPH_V1.0_ADJ_0.25deg-3HLY_20060601.bz2'
+    return sd.write_raw_cmorph(path, sd.CMORPH_0P25DEG_SHAPE, 8)
+
+
+@pytest.fixture(scope='module')
+def raw_cmorph_8km(tmp_path_factory):
+    path = tmp_path_factory.mktemp('cmorph') / 'CMORPH_V1.0_ADJ_8km-30min_2006060100.bz2'
+    return sd.write_raw_cmorph(path, (2, NLAT_8KM, NLON_8KM), 2)
+
+
+def test_load_raw_cmorph_0p25deg_3hrly(benchmark, raw_cmorph_0p25deg):
+    # Real shape, independent of scale.
+    data_size = np.prod(sd.CMORPH_0P25DEG_SHAPE) * 4
+    data = run_benchmark(benchmark, _load_raw_0p25deg_3hrly, raw_cmorph_0p25deg, mem_budget=1.5 * data_size)
+    assert np.isnan(data[0, 0, 0])
+
+
+def test_load_raw_cmorph_8km_30min(benchmark, raw_cmorph_8km):
+    data_size = 2 * NLAT_8KM * NLON_8KM * 4
+    raw_data = raw_cmorph_8km.read_bytes()
+    data = run_benchmark(benchmark, lambda: _load_raw_8km_30min(io.BytesIO(raw_data)),
+                         mem_budget=1.5 * data_size)
+    assert data.shape == (2, NLAT_8KM, NLON_8KM)
@@ -0,0 +1,308 @@
+"""End-to-end throughput benchmark of the CMORPH vs UM basin-scale pipeline, on synthetic inputs.
+
+Generates synthetic inputs at a chosen scale (fraction of a month of data):
+- a raw CMORPH 8km-30min tar file
+- UM-like N1280 Asia hourly precip
+- HydroBASINS-like basin polygons
+
+Then runs the chain of tasks from the task controls (ctrl/cmorph/cmorph_remake.py,
+ctrl/WP2_analysis/basin_scale/seasonal_precip_analysis.py and basin_weighted_analysis.py), calling the same
+functions on the synthetic paths:
+    raw CMORPH tar -> Asia netCDF -> N1280 -> AFI -> basin weighting -> phase/magnitude RMSEs
+Tasks are run as TaskSpecs by the LocalDagExecutor (as for cosmic-run-local), each profiled with profile_task.
+Reports throughput (GB/s of input read and output written) and peak memory for each stage.
+
+Needs basmati and geopandas (for the basin weights).
+
+example usage:
+    python -m cosmic.tests.benchmarks.pipeline_benchmark /scratch/pipeline_bench --scale 0.1 --num-procs 4
+"""
+import os
+import sys
+import json
+import logging
+from argparse import ArgumentParser
+from collections import defaultdict
+from pathlib import Path
+
+import iris
+import numpy as np
+import pandas as pd
+import pytest
+
+from cosmic.datasets.cmorph.cmorph_convert import convert_cmorph_8km_30min_to_asia_netcdf4_month
+from cosmic.fourier_series import FourierSeries
+from cosmic.processing.local_dag_executor import LocalDagExecutor
+from cosmic.processing.task_manifest import num_procs_from_env
+from cosmic.processing.task_profile import profile_task, load_profiles
+from cosmic.processing.task_spec import TaskSpec
+from cosmic.regions import get_region, load_region_cube
+from cosmic.util import filepath_regrid, rmse_mask_out_nan, circular_rmse_mask_out_nan, vrmse
+from cosmic.WP2.seasonal_precip_analysis import calc_precip_amount_freq_intensity
+from cosmic.tests.benchmarks import synthetic_data as sd
+
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
+YEAR, MONTH, DAYS_IN_MONTH = 2006, 6, 30
+PRECIP_THRESH = 0.1
+PRECIP_MODES = ['amount', 'freq', 'intensity']
+STAGES = ['convert_raw_cmorph', 'regrid_to_n1280', 'calc_afi', 'gen_weights', 'basin_phase_mag',
+          'phase_mag_rmses']
+
+
+# Stage functions: called as remake task functions, func(inputs, outputs, *args).
+def convert_raw_cmorph(inputs, outputs, year, month, num_days):
+    # As cmorph_remake.convert_extract_year_month.
+    convert_cmorph_8km_30min_to_asia_netcdf4_month(inputs[0], outputs[0], year, month, num_days=num_days)
+
+
+def regrid_to_n1280(inputs, outputs):
+    # As cmorph_remake.regrid_asia.
+    coarse_cube = filepath_regrid(inputs['cmorph'], inputs['target'])
+    iris.save(coarse_cube, str(outputs[0]), zlib=True)
+
+
+def calc_afi(inputs, outputs, num_per_day, convert_kgpm2ps1_to_mmphr):
+    # As seasonal_precip_analysis.gen_seasonal_precip_analysis.
+    season_cube = iris.load_cube(str(inputs[0]))
+    analysis_cubes = calc_precip_amount_freq_intensity('jja', season_cube, PRECIP_THRESH,
+                                                       num_per_day=num_per_day,
+                                                       convert_kgpm2ps1_to_mmphr=convert_kgpm2ps1_to_mmphr,
+                                                       calc_method='low_mem')
+    iris.save(analysis_cubes, str(outputs[0]))
+
+
+def gen_weights(inputs, outputs):
+    # As basin_weighted_analysis.gen_weights_cube.
+    import geopandas as gpd
+    from basmati.utils import build_weights_cube_from_cube
+
+    cube = load_region_cube(inputs['dataset'], 'asia')
+    hb = gpd.read_file(str(inputs['basins']))
+    weights_cube = build_weights_cube_from_cube(hb.geometry, cube, 'weights')
+    iris.save(weights_cube, str(outputs[0]))
+
+
+def basin_phase_mag(inputs, outputs, cube_name):
+    # As basin_weighted_analysis.native_weighted_basin_diurnal_cycle_analysis.
+    diurnal_cycle_cube = iris.load_cube(str(inputs['diurnal_cycle']), cube_name)
+    weights = iris.load_cube(str(inputs['weights']))
+
+    lon = diurnal_cycle_cube.coord('longitude').points
+    lat = diurnal_cycle_cube.coord('latitude').points
+    lons = lon[None, :] * np.ones((weights.shape[1], weights.shape[2]))
+    area_weight = np.cos(lat / 180 * np.pi)[:, None] * np.ones((weights.shape[1], weights.shape[2]))
+    step_length = 24 / diurnal_cycle_cube.shape[0]
+    fs = FourierSeries(np.linspace(0, 24 - step_length, diurnal_cycle_cube.shape[0]))
+
+    phase_mag = np.zeros((weights.shape[0], 2))
+    for i in range(weights.shape[0]):
+        basin_weight = weights[i].data
+        basin_domain = basin_weight != 0
+        if basin_domain.sum() == 0:
+            continue
+        domain_weight = area_weight[basin_domain] * basin_weight[basin_domain]
+        dc_basin = np.array([(domain_weight * diurnal_cycle_cube.data[t_index][basin_domain]).sum() /
+                             domain_weight.sum()
+                             for t_index in range(diurnal_cycle_cube.shape[0])])
+        t_offset = lons[basin_domain].mean() / 180 * 12
+        fs.fit(dc_basin, 1)
+        phases, amp = fs.component_phase_amp(1)
+        phase_mag[i] = (phases[0] + t_offset + step_length / 2) % 24, amp
+
+    pd.DataFrame(phase_mag, columns=['phase', 'magnitude']).to_csv(outputs[0], index=False)
+
+
+def _x1x2(phase_mag):
+    return np.stack([phase_mag.magnitude * np.cos(phase_mag.phase * np.pi / 12),
+                     phase_mag.magnitude * np.sin(phase_mag.phase * np.pi / 12)], axis=1)
+
+
+def phase_mag_rmses(inputs, outputs):
+    # As basin_weighted_analysis.gen_phase_mag_rmses (not area weighted).
+    rmses = {}
+    for mode in PRECIP_MODES:
+        obs_phase_mag = pd.read_csv(inputs[f'cmorph_{mode}'])
+        phase_mag = pd.read_csv(inputs[f'um_{mode}'])
+        rmses[mode] = {
+            'phase': circular_rmse_mask_out_nan(obs_phase_mag.phase.values, phase_mag.phase.values),
+            'magnitude': rmse_mask_out_nan(obs_phase_mag.magnitude.values, phase_mag.magnitude.values),
+            'vrmse': vrmse(_x1x2(obs_phase_mag), _x1x2(phase_mag)),
+        }
+    Path(outputs[0]).write_text(json.dumps(rmses, indent=2))
+
+
+# Input generation functions: also run as tasks, so that no dask threads are started in the executor's process
+# before it forks.
+def gen_raw_cmorph(inputs, outputs, year, month, num_days):
+    sd.write_raw_cmorph_8km_30min_tar(outputs[0], year, month, num_days)
+
+
+def gen_um_precip(inputs, outputs, num_days):
+    sd.write_um_precip_month(outputs[0], *sd.n1280_asia_lat_lon(), num_days)
+
+
+def gen_basins(inputs, outputs, basin_size):
+    asia = get_region('asia')
+    sd.write_basins(outputs[0], *sd.gen_basin_polygons(asia.lat_bounds, asia.lon_bounds, basin_size))
+
+
+def _spec(func, inputs, outputs, *func_args):
+    key = f'{func.__name__}_{Path(_values(outputs)[0]).stem}'
+    return TaskSpec(key, __file__, __name__, func.__name__, inputs, outputs, func_args)
+
+
+def gen_input_specs(input_dir, num_days, basin_size):
+    """Task specs to generate synthetic inputs that do not exist yet.
+
+    :return: dict of input paths, task specs
+    """
+    paths = {
+        'raw_cmorph': input_dir / f'CMORPH_V1.0_ADJ_8km-30min_{YEAR}{MONTH:02}.tar',
+        'um': input_dir / f'ak543a.p9{YEAR}{MONTH:02}.asia_precip.nc',
+        'basins': input_dir / f'hb_synthetic_{basin_size:g}deg.shp',
+    }
+    specs = [
+        _spec(gen_raw_cmorph, [], [paths['raw_cmorph']], YEAR, MONTH, num_days),
+        _spec(gen_um_precip, [], [paths['um']], num_days),
+        _spec(gen_basins, [], [paths['basins']], basin_size),
+    ]
+    return paths, [spec for spec in specs if not spec.is_up_to_date()]
+
+
+def gen_task_specs(input_paths, output_dir, num_days):
+    """Task specs for pipeline, in topological order."""
+    spec = _spec
+    daterange = f'{YEAR}{MONTH:02}'
+    cmorph_asia = output_dir / f'cmorph_ppt_{daterange}.asia.nc'
+    cmorph_n1280 = output_dir / f'cmorph_ppt_{daterange}.asia.N1280.nc'
+    afi = {dataset: output_dir / f'{dataset}.{daterange}.jja.asia_precip_afi.ppt_thresh_0p1.nc'
+           for dataset in ['cmorph', 'um']}
+    weights = output_dir / 'weights_N1280_synthetic.nc'
+    phase_mag = {(dataset, mode): output_dir / f'{dataset}.synthetic.{mode}.area_weighted.phase_mag.csv'
+                 for dataset in ['cmorph', 'um'] for mode in PRECIP_MODES}
+
+    specs = [
+        spec(convert_raw_cmorph, [input_paths['raw_cmorph']], [cmorph_asia], YEAR, MONTH, num_days),
+        spec(regrid_to_n1280, {'cmorph': cmorph_asia, 'target': input_paths['um']}, [cmorph_n1280]),
+        spec(calc_afi, [cmorph_n1280], [afi['cmorph']], 48, False),
+        spec(calc_afi, [input_paths['um']], [afi['um']], 24, True),
+        spec(gen_weights, {'dataset': input_paths['um'], 'basins': input_paths['basins']}, [weights]),
+    ]
+    for (dataset, mode), path in phase_mag.items():
+        specs.append(spec(basin_phase_mag, {'diurnal_cycle': afi[dataset], 'weights': weights}, [path],
+                          f'{mode}_of_precip_jja'))
+    specs.append(spec(phase_mag_rmses, {f'{dataset}_{mode}': path for (dataset, mode), path in phase_mag.items()},
+                      [output_dir / 'phase_mag_rmses.json']))
+    return specs
+
+
+def _values(paths):
+    return list(paths.values()) if isinstance(paths, dict) else list(paths)
+
+
+def prev_tasks_from_files(specs):
+    """Mapping of task to the tasks that produce its inputs."""
+    producer = {path: spec for spec in specs for path in _values(spec.outputs)}
+    return {spec: [producer[path] for path in _values(spec.inputs) if path in producer] for spec in specs}
+
+
+def stage_summary(profiles):
+    """Totals for each stage from task profiles.
+
+    :return: dict of stage to dict of tasks, wall_time, input_gb, output_gb, input_gbps, output_gbps, peak_rss_mb
+    """
+    stages = defaultdict(lambda: defaultdict(float))
+    for record in profiles.values():
+        stage = stages[record['func'].split('.')[-1]]
+        stage['tasks'] += 1
+        stage['wall_time'] += record['wall_time']
+        stage['input_gb'] += record['input_bytes'] / 1e9
+        stage['output_gb'] += record['output_bytes'] / 1e9
+        stage['peak_rss_mb'] = max(stage['peak_rss_mb'], record['peak_rss_mb'])
+    summary = {}
+    for name in sorted(stages, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES)):
+        stage = dict(stages[name])
+        stage['input_gbps'] = stage['input_gb'] / stage['wall_time']
+        stage['output_gbps'] = stage['output_gb'] / stage['wall_time']
+        summary[name] = stage
+    return summary
+
+
+def format_stage_summary(summary):
+    lines = [f'{"stage":<20} {"tasks":>5} {"wall (s)":>9} {"in (GB)":>8} {"out (GB)":>8} {"in GB/s":>8} '
+             f'{"out GB/s":>8} {"peak RSS (MB)":>13}']
+    for name, stage in summary.items():
+        lines.append(f'{name:<20} {int(stage["tasks"]):>5} {stage["wall_time"]:>9.1f} {stage["input_gb"]:>8.3f} '
+                     f'{stage["output_gb"]:>8.3f} {stage["input_gbps"]:>8.3f} {stage["output_gbps"]:>8.3f} '
+                     f'{stage["peak_rss_mb"]:>13.0f}')
+    return '\n'.join(lines)
+
+
+def run_pipeline_benchmark(output_dir, scale=1 / DAYS_IN_MONTH, basin_size=5, num_procs=None):
+    """Generate inputs, run pipeline and summarize each stage.
+
+    :param output_dir: dir for inputs, outputs and task profiles
+    :param scale: fraction of a month of data (at least one day is used)
+    :param basin_size: size of basins in degrees
+    :param num_procs: max tasks to run at once
+    :return: stage summary (see stage_summary)
+    """
+    output_dir = Path(output_dir).absolute()
+    num_days = max(1, round(scale * DAYS_IN_MONTH))
+    # Inputs are kept, and reused by runs at the same scale.
+    input_paths, input_specs = gen_input_specs(output_dir / f'inputs_{num_days}days', num_days, basin_size)
+    specs = gen_task_specs(input_paths, output_dir / 'outputs', num_days)
+    for spec in specs:
+        for path in _values(spec.outputs):
+            path.unlink(missing_ok=True)
+    profile_path = output_dir / 'task_profiles.jsonl'
+    profile_path.unlink(missing_ok=True)
+
+    def run_spec(spec):
+        if spec in input_specs:
+            spec.run()
+        else:
+            with profile_task(spec, profile_path):
+                spec.run()
+
+    logger.info(f'running pipeline for {num_days} days in {output_dir}')
+    all_specs = input_specs + specs
+    executor = LocalDagExecutor(all_specs, prev_tasks_from_files(all_specs), run_spec,
+                                num_procs=num_procs or num_procs_from_env())
+    try:
+        executor.run()
+    finally:
+        if profile_path.exists():
+            print(format_stage_summary(stage_summary(load_profiles(profile_path))))
+    return stage_summary(load_profiles(profile_path))
+
+
+def test_pipeline_benchmark(tmp_path):
+    pytest.importorskip('basmati')
+    pytest.importorskip('geopandas')
+    summary = run_pipeline_benchmark(tmp_path, basin_size=10)
+    assert list(summary) == STAGES
+    rmses = json.loads((tmp_path / 'outputs' / 'phase_mag_rmses.json').read_text())
+    assert set(rmses) == set(PRECIP_MODES)
+
+
+def main(argv=None):
+    parser = ArgumentParser(description='End-to-end pipeline throughput benchmark on synthetic inputs')
+    parser.add_argument('output_dir')
+    parser.add_argument('--scale', type=float, default=1 / DAYS_IN_MONTH,
+                        help='fraction of a month of data (default: one day)')
+    parser.add_argument('--basin-size', type=float, default=5, help='size of basins in degrees')
+    parser.add_argument('--num-procs', '-n', type=int, help='max tasks to run at once (default: number of cores)')
+    parser.add_argument('--json', action='store_true', help='output stage summary as JSON')
+    args = parser.parse_args(argv)
+    summary = run_pipeline_benchmark(args.output_dir, args.scale, args.basin_size, args.num_procs)
+    if args.json:
+        print(json.dumps(summary))
+    return summary
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""Synthetic data with the shapes of the real data, for benchmarks.
+
+Grids are the real grids (N1280, CMORPH 8km and 0.25deg), subsampled by a scale factor so that benchmarks can be
+run quickly: scale=1 gives the real shapes (e.g. N1280 Asia is 588 x 669), scale=0.25 uses every 4th lat/lon.
+Precip has a diurnal cycle, and is zero most of the time, like the real data.
+
+The scale, number of days and number of rounds for the benchmarks are taken from the environment:
+COSMIC_BENCH_SCALE, COSMIC_BENCH_DAYS and COSMIC_BENCH_ROUNDS.
+"""
+import bz2
+import datetime as dt
+import io
+import os
+import tarfile
+
+import iris
+import iris.coord_systems
+import iris.coords
+import iris.cube
+import iris.fileformats.pp
+import numpy as np
+
+from cosmic.nc_write_profiles import save_cubes
+from cosmic.regions import get_region
+
+# N1280: 2560 x 1920 grid points. Spacings are exact in binary, so coords are exactly uniform.
+N1280_DLAT = 180 / 1920
+N1280_DLON = 360 / 2560
+CMORPH_0P25DEG_SHAPE = (8, 480, 1440)
+CMORPH_8KM_30MIN_SHAPE = (2, 1649, 4948)
+
+SCALE = float(os.getenv('COSMIC_BENCH_SCALE', '0.25'))
+NUM_DAYS = int(os.getenv('COSMIC_BENCH_DAYS', '10'))
+ROUNDS = int(os.getenv('COSMIC_BENCH_ROUNDS', '3'))
+
+
+def _step(scale):
+    return max(1, round(1 / scale))
+
+
+def n1280_lat_lon(scale=1):
+    """Global N1280 lat/lon, with every 1/scale-th point."""
+    lat = np.arange(1920) * N1280_DLAT - 90 + N1280_DLAT / 2
+    lon = np.arange(2560) * N1280_DLON + N1280_DLON / 2
+    step = _step(scale)
+    return lat[::step], lon[::step]
+
+
+def region_lat_lon(lat, lon, region='asia'):
+    lat_slice, lon_slice = get_region(region).index_slices(lat, lon)
+    return lat[lat_slice], lon[lon_slice]
+
+
+def n1280_asia_lat_lon(scale=1):
+    # Region subset of the full resolution grid, then subsampled, so that the shape is the real shape at scale=1.
+    lat, lon = region_lat_lon(*n1280_lat_lon())
+    step = _step(scale)
+    return lat[::step], lon[::step]
+
+
+def cmorph_8km_asia_lat_lon(scale=1):
+    # Same grid as cmorph_convert._gen_8km_lat_lon.
+    lat = np.linspace(-59.963614, -59.963614 + 0.072771377 * 1648, 1649)
+    lon = np.linspace(0.036378335, 0.036378335 + 0.072756669 * 4947, 4948)
+    lat, lon = region_lat_lon(lat, lon)
+    step = _step(scale)
+    return lat[::step], lon[::step]
+
+
+def gen_precip(shape, num_per_day, seed=0, rain_frac=0.1):
+    """Precip (mm hr-1, float32) with a diurnal cycle peaking in the afternoon (local time ignored).
+
+    :param shape: (time, lat, lon), time must be a multiple of num_per_day
+    :param rain_frac: fraction of the time that it rains, on average
+    """
+    rng = np.random.default_rng(seed)
+    hours = np.arange(shape[0]) % num_per_day * 24 / num_per_day
+    # Probability of rain over the day varies from 0.5 to 1.5 times rain_frac.
+    rain_prob = rain_frac * (1 + 0.5 * np.cos(2 * np.pi * (hours - 15) / 24))
+    precip = np.zeros(shape, dtype=np.float32)
+    for i in range(shape[0]):
+        rain = rng.random(shape[1:], dtype=np.float32) < rain_prob[i]
+        precip[i][rain] = rng.gamma(0.5, 4, size=rain.sum())
+    return precip
+
+
+def time_coord(num_times, num_per_day, start=dt.datetime(2006, 6, 1)):
+    step_hours = 24 / num_per_day
+    epoch_hours = (start - dt.datetime(1970, 1, 1)).total_seconds() / 3600
+    times = epoch_hours + step_hours / 2 + np.arange(num_times) * step_hours
+    return iris.coords.DimCoord(times, standard_name='time', units='hours since 1970-01-01 00:00:00')
+
+
+def lat_lon_coords(lat, lon):
+    lat_coord = iris.coords.DimCoord(lat, standard_name='latitude', units='degrees')
+    lon_coord = iris.coords.DimCoord(lon, standard_name='longitude', units='degrees')
+    return lat_coord, lon_coord
+
+
+def precip_cube(lat, lon, num_days, num_per_day, units='kg m-2 s-1', seed=0):
+    """Precip cube, in units of kg m-2 s-1 (as UM output) or mm hr-1 (as CMORPH)."""
+    data = gen_precip((num_days * num_per_day, len(lat), len(lon)), num_per_day, seed)
+    if units == 'kg m-2 s-1':
+        data /= 3600
+    lat_coord, lon_coord = lat_lon_coords(lat, lon)
+    return iris.cube.Cube(data, long_name='precipitation_flux', units=units,
+                          dim_coords_and_dims=[(time_coord(len(data), num_per_day), 0),
+                                               (lat_coord, 1), (lon_coord, 2)])
+
+
+def diurnal_cycle_cube(lat, lon, num_per_day, seed=0):
+    """Mean diurnal cycle of precip (mm hr-1): one day of num_per_day times."""
+    cube = precip_cube(lat, lon, 10, num_per_day, units='mm hr-1', seed=seed)
+    data = cube.data.reshape(10, num_per_day, len(lat), len(lon)).mean(axis=0)
+    return iris.cube.Cube(data, long_name='diurnal_cycle_of_precip', units='mm hr-1',
+                          dim_coords_and_dims=[(cube[:num_per_day].coord('time'), 0),
+                                               (cube.coord('latitude'), 1), (cube.coord('longitude'), 2)])
+
+
+def field_cube(lat, lon, seed=0):
+    """Smooth 2D field (e.g. orography), in m."""
+    rng = np.random.default_rng(seed)
+    Lat, Lon = np.meshgrid(np.deg2rad(lat), np.deg2rad(lon), indexing='ij')
+    data = 1000 * np.cos(Lat) ** 2 * (1 + np.sin(3 * Lon) * np.cos(5 * Lat)) + rng.random(Lat.shape)
+    lat_coord, lon_coord = lat_lon_coords(lat, lon)
+    return iris.cube.Cube(data, long_name='surface_altitude', units='m',
+                          dim_coords_and_dims=[(lat_coord, 0), (lon_coord, 1)])
+
+
+def write_raw_cmorph(path, shape, num_per_day, seed=0):
+    """Write a raw CMORPH file: bz2 compressed, little-endian float32, -999 for missing values.
+
+    :param shape: shape of data in file
+    :param num_per_day: time steps per day, for the diurnal cycle of the precip
+    """
+    data = gen_precip(shape, num_per_day, seed)
+    # Missing data in a band at the southern edge.
+    data[:, :shape[1] // 20] = -999
+    path.write_bytes(bz2.compress(data.astype('<f4').tobytes(), compresslevel=1))
+    return path
+
+
+def write_raw_cmorph_8km_30min_tar(path, year, month, num_days, num_distinct=2):
+    """Write a raw CMORPH 8km-30min tar file, with one member for each hour of the first num_days of the month.
+
+    Only num_distinct hourly files are generated, and reused for all hours, as compressing each one is slow.
+    """
+    blobs = []
+    for seed in range(num_distinct):
+        blob_path = path.parent / f'.raw_cmorph_{seed}.bz2'
+        blobs.append(write_raw_cmorph(blob_path, CMORPH_8KM_30MIN_SHAPE, 2, seed).read_bytes())
+        blob_path.unlink()
+
+    with tarfile.open(path, 'w') as tar:
+        for hour in range(num_days * 24):
+            time = dt.datetime(year, month, 1) + dt.timedelta(hours=hour)
+            blob = blobs[hour % num_distinct]
+            tarinfo = tarfile.TarInfo(f'{year}{month:02}/CMORPH_V1.0_ADJ_8km-30min_{time:%Y%m%d%H}.bz2')
+            tarinfo.size = len(blob)
+            tar.addfile(tarinfo, io.BytesIO(blob))
+    return path
+
+
+def write_um_precip_month(path, lat, lon, num_days, seed=0):
+    """Write UM-like hourly precip (kg m-2 s-1) for Asia, as produced by convert_pp_to_region_nc."""
+    cube = precip_cube(lat, lon, num_days, 24, seed=seed)
+    cube.rename('precipitation_flux')
+    coord_system = iris.coord_systems.GeogCS(iris.fileformats.pp.EARTH_RADIUS)
+    for latlon in ['latitude', 'longitude']:
+        cube.coord(latlon).coord_system = coord_system
+    save_cubes(cube, path, profile='balanced')
+    return path
+
+
+def gen_basin_polygons(lat_bounds, lon_bounds, size, seed=0):
+    """HydroBASINS-like polygons: a grid of cells of roughly size x size degrees, with jittered corners.
+
+    :return: list of shapely polygons, area of each (km2)
+    """
+    from shapely.geometry import Polygon
+
+    rng = np.random.default_rng(seed)
+    lat = np.arange(lat_bounds[0] + size / 2, lat_bounds[1] - size / 2, size)
+    lon = np.arange(lon_bounds[0] + size / 2, lon_bounds[1] - size / 2, size)
+    Lon, Lat = np.meshgrid(lon, lat)
+    # Shared corners, so that polygons tile the region without gaps or overlaps.
+    Lon += rng.uniform(-size / 4, size / 4, Lon.shape)
+    Lat += rng.uniform(-size / 4, size / 4, Lat.shape)
+    polygons = []
+    areas = []
+    for i in range(Lat.shape[0] - 1):
+        for j in range(Lat.shape[1] - 1):
+            corners = [(Lon[i, j], Lat[i, j]), (Lon[i, j + 1], Lat[i, j + 1]),
+                       (Lon[i + 1, j + 1], Lat[i + 1, j + 1]), (Lon[i + 1, j], Lat[i + 1, j])]
+            polygon = Polygon(corners)
+            polygons.append(polygon)
+            # Approx. area: 1 deg2 at the equator is 111km x 111km.
+            areas.append(polygon.area * 111 ** 2 * np.cos(np.deg2rad(polygon.centroid.y)))
+    return polygons, areas
+
+
+def write_basins(path, polygons, areas):
+    """Write basins to a shapefile, with HydroBASINS columns HYBAS_ID and SUB_AREA (km2)."""
+    import geopandas as gpd
+
+    gdf = gpd.GeoDataFrame({'HYBAS_ID': np.arange(1, len(polygons) + 1), 'SUB_AREA': areas},
+                           geometry=polygons, crs='EPSG:4326')
+    gdf.to_file(str(path))
+    return path
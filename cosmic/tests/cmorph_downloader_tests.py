@@ -0,0 +1,94 @@
+import datetime as dt
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pyftpdlib')
+from pyftpdlib.authorizers import DummyAuthorizer
+from pyftpdlib.handlers import FTPHandler
+from pyftpdlib.servers import ThreadedFTPServer
+
+from cosmic.datasets.cmorph.cmorph_downloader import PooledCmorphDownloader, ftp_filepath_0p25deg_3hrly
+
+
+@pytest.fixture
+def ftp_server(tmp_path):
+    """Local FTP server serving fake CMORPH 0.25deg-3hrly files for Jan 2000."""
+    ftp_root = tmp_path / 'ftp_root'
+    rng = np.random.default_rng(0)
+    contents = {}
+    for day in range(1, 6):
+        ftp_filepath = ftp_filepath_0p25deg_3hrly(2000, 1, day)
+        server_filepath = ftp_root / ftp_filepath[1:]
+        server_filepath.parent.mkdir(parents=True, exist_ok=True)
+        content = rng.bytes(100_000 + day)
+        server_filepath.write_bytes(content)
+        contents[server_filepath.name] = content
+
+    authorizer = DummyAuthorizer()
+    authorizer.add_anonymous(str(ftp_root))
+    handler = type('CmorphTestFTPHandler', (FTPHandler,), {'authorizer': authorizer})
+    server = ThreadedFTPServer(('127.0.0.1', 0), handler)
+    port = server.socket.getsockname()[1]
+    thread = threading.Thread(target=server.serve_forever, kwargs={'timeout': 0.1})
+    thread.start()
+    yield port, contents
+    server.close_all()
+    thread.join()
+
+
+def _downloader(download_dir, port):
+    return PooledCmorphDownloader(download_dir, num_sessions=3, host='127.0.0.1', port=port, timeout=10)
+
+
+def test_pooled_download(tmp_path, ftp_server):
+    port, contents = ftp_server
+    download_dir = tmp_path / 'download'
+    with _downloader(download_dir, port) as dl:
+        failed = dl.download_range_0p25deg_3hrly(dt.datetime(2000, 1, 1), dt.datetime(2000, 1, 6))
+        assert dl._num_open_sessions <= 3
+
+    assert not failed
+    assert sorted(p.name for p in download_dir.iterdir()) == sorted(contents)
+    for name, content in contents.items():
+        assert (download_dir / name).read_bytes() == content
+
+
+def test_resume_partial_download(tmp_path, ftp_server):
+    port, contents = ftp_server
+    download_dir = tmp_path / 'download'
+    download_dir.mkdir()
+    name = 'CMORPH_V1.0_ADJ_0.25deg-3HLY_20000101.bz2'
+    # Partial file with a different prefix: only the remainder should be fetched.
+    (download_dir / (name + '.part')).write_bytes(b'x' * 1000)
+
+    with _downloader(download_dir, port) as dl:
+        failed = dl.download_range_0p25deg_3hrly(dt.datetime(2000, 1, 1), dt.datetime(2000, 1, 2))
+
+    assert not failed
+    assert not (download_dir / (name + '.part')).exists()
+    assert (download_dir / name).read_bytes() == b'x' * 1000 + contents[name][1000:]
+
+
+def test_redownload_wrong_size(tmp_path, ftp_server):
+    port, contents = ftp_server
+    download_dir = tmp_path / 'download'
+    download_dir.mkdir()
+    name = 'CMORPH_V1.0_ADJ_0.25deg-3HLY_20000102.bz2'
+    (download_dir / name).write_bytes(b'truncated')
+
+    with _downloader(download_dir, port) as dl:
+        failed = dl.download_range_0p25deg_3hrly(dt.datetime(2000, 1, 2), dt.datetime(2000, 1, 3))
+
+    assert not failed
+    assert (download_dir / name).read_bytes() == contents[name]
+
+
+def test_missing_file_reported(tmp_path, ftp_server):
+    port, contents = ftp_server
+    with _downloader(tmp_path / 'download', port) as dl:
+        dl.max_retries = 1
+        failed = dl.download_range_0p25deg_3hrly(dt.datetime(2000, 1, 5), dt.datetime(2000, 1, 7))
+
+    assert failed == [ftp_filepath_0p25deg_3hrly(2000, 1, 6)]
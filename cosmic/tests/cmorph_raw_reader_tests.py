@@ -0,0 +1,65 @@
+import bz2
+import io
+import tarfile
+
+import numpy as np
+
+from cosmic.datasets.cmorph.cmorph_raw_reader import CmorphRawCache, memmap_dask_array, _build_cube
+
+SHAPE = (2, 30, 40)
+
+
+def _gen_raw(seed):
+    data = np.random.default_rng(seed).random(SHAPE, dtype=np.float32)
+    data[:, :3] = -999
+    return bz2.compress(data.astype('<f4').tobytes())
+
+
+def _decode(raw):
+    data = np.frombuffer(bz2.decompress(raw), dtype='<f4').reshape(SHAPE)
+    return np.where(data == -999, np.nan, data)
+
+
+def test_cache_files(tmp_path):
+    raws = [_gen_raw(seed) for seed in range(3)]
+    filenames = []
+    for i, raw in enumerate(raws):
+        filename = tmp_path / f'CMORPH_V1.0_ADJ_0.25deg-3HLY_2000010{i + 1}.bz2'
+        filename.write_bytes(raw)
+        filenames.append(filename)
+
+    cache = CmorphRawCache(tmp_path / 'cache')
+    cache_paths = cache.cache_files(reversed(filenames))
+    assert [p.name for p in cache_paths] == [f.stem + '.f4' for f in filenames]
+    # Cached files are reused.
+    mtimes = [p.stat().st_mtime_ns for p in cache_paths]
+    assert [p.stat().st_mtime_ns for p in cache.cache_files(filenames)] == mtimes
+
+    data = memmap_dask_array(cache_paths, SHAPE)
+    assert data.shape == (6, *SHAPE[1:])
+    expected = np.concatenate([_decode(raw) for raw in raws])
+    np.testing.assert_array_equal(data[:, 2:10, 5:25].compute(), expected[:, 2:10, 5:25])
+
+
+def test_cache_tar_cube_subset(tmp_path):
+    raws = [_gen_raw(seed) for seed in range(2)]
+    tar_filename = tmp_path / 'CMORPH_V1.0_ADJ_8km-30min_200001.tar'
+    with tarfile.open(tar_filename, 'w') as tar:
+        for hour, raw in enumerate(raws):
+            tarinfo = tarfile.TarInfo(f'200001/CMORPH_V1.0_ADJ_8km-30min_20000101{hour:02}.bz2')
+            tarinfo.size = len(raw)
+            tar.addfile(tarinfo, io.BytesIO(raw))
+
+    cache_paths = CmorphRawCache(tmp_path / 'cache').cache_tar(tar_filename)
+    assert len(cache_paths) == 2
+    times = np.arange(4) * 0.5 + 262980.25
+    lat = np.linspace(-10, 10, SHAPE[1])
+    lon = np.linspace(100, 120, SHAPE[2])
+    cube = _build_cube(memmap_dask_array(cache_paths, SHAPE), times, lat, lon)
+    assert cube.has_lazy_data()
+
+    subset = cube[1:3, 2:12, 10:30]
+    assert subset.has_lazy_data()
+    expected = np.concatenate([_decode(raw) for raw in raws])[1:3, 2:12, 10:30]
+    np.testing.assert_array_equal(subset.data, expected)
+    np.testing.assert_array_equal(subset.coord('latitude').points, lat[2:12])
@@ -0,0 +1,80 @@
+import iris
+import iris.coord_systems
+import iris.coords
+import iris.cube
+import iris.fileformats.pp
+import numpy as np
+
+from cosmic.processing.bsub_submit import write_bsub_script
+from cosmic.processing.convert_pp_to_region_nc import pp_to_region_precip, convert_pp_to_region_nc
+
+# Stratiform rain, stratiform snow and total precip, with a different value for each.
+STASH_VALUES = {(1, 4, 203): 1.0, (1, 4, 204): 2.0, (1, 5, 216): 10.0}
+
+
+def _write_pp(path, start_hour, num_times=2):
+    """Global 1deg pp file with hourly fields for each of STASH_VALUES, value + time index."""
+    coord_system = iris.coord_systems.GeogCS(iris.fileformats.pp.EARTH_RADIUS)
+    lat = np.arange(-89.5, 90, 1)
+    lon = np.arange(0.5, 360, 1)
+    cubes = iris.cube.CubeList()
+    for stash, value in STASH_VALUES.items():
+        for i in range(num_times):
+            lat_coord = iris.coords.DimCoord(lat, standard_name='latitude', units='degrees',
+                                             coord_system=coord_system)
+            lon_coord = iris.coords.DimCoord(lon, standard_name='longitude', units='degrees',
+                                             coord_system=coord_system)
+            cube = iris.cube.Cube(np.full((len(lat), len(lon)), value + start_hour + i, dtype=np.float32),
+                                  units='kg m-2 s-1', dim_coords_and_dims=[(lat_coord, 0), (lon_coord, 1)])
+            cube.attributes['STASH'] = iris.fileformats.pp.STASH(*stash)
+            cube.add_aux_coord(iris.coords.DimCoord([start_hour + i], standard_name='time',
+                                                    units='hours since 2006-06-01'))
+            cubes.append(cube)
+    iris.save(cubes, str(path))
+    return path
+
+
+def test_pp_to_region_precip(tmp_path):
+    pp_filepath = _write_pp(tmp_path / 'ak543a.pa2006060100.pp', 0)
+    region_precip = pp_to_region_precip(pp_filepath, ['asia', 'china'], stratiform=True)
+    asia_cube = region_precip['asia']
+    assert asia_cube.name() == 'precipitation_flux'
+    # Rain + snow only: total precip (5216) filtered out.
+    np.testing.assert_array_equal(asia_cube.data[0], 3)
+    np.testing.assert_array_equal(asia_cube.data[1], 5)
+    lat = asia_cube.coord('latitude').points
+    lon = asia_cube.coord('longitude').points
+    assert (lat.min(), lat.max()) == (1.5, 55.5)
+    assert (lon.min(), lon.max()) == (57.5, 150.5)
+    assert region_precip['china'].shape == (2, 23, 27)
+
+    region_precip = pp_to_region_precip(pp_filepath, ['asia'], combine_rain_snow=False)
+    np.testing.assert_array_equal(region_precip['asia'].data[0], 10)
+
+
+def test_convert_pp_to_region_nc(tmp_path):
+    pp_filepaths = [_write_pp(tmp_path / f'ak543a.pa20060601{hour:02}.pp', hour) for hour in [0, 2]]
+    output_dir = tmp_path / 'output'
+    output_filepaths = convert_pp_to_region_nc('u-ak543', 'ap9', 2006, 6, pp_filepaths, output_dir,
+                                               stratiform=True, num_procs=2)
+    output_filepath = output_filepaths['asia']
+    assert output_filepath.name == 'ak543a.p9200606.asia_precip.nc'
+    assert (output_dir / (output_filepath.name + '.done')).exists()
+    cube = iris.load_cube(str(output_filepath))
+    assert cube.shape[0] == 4
+    np.testing.assert_array_equal(cube.data[:, 0, 0], [3, 5, 7, 9])
+
+    # Done: not converted again.
+    mtime = output_filepath.stat().st_mtime_ns
+    convert_pp_to_region_nc('u-ak543', 'ap9', 2006, 6, pp_filepaths, output_dir, stratiform=True)
+    assert output_filepath.stat().st_mtime_ns == mtime
+
+
+def test_write_bsub_script_ncores(tmp_path):
+    kwargs = {'job_name': 'conv_asia', 'queue': 'par-single', 'max_runtime': '04:00', 'mem': 64000, 'ncores': 4}
+    script = write_bsub_script(tmp_path, tmp_path / 'script.py', tmp_path / 'config.py', 'key', kwargs).read_text()
+    # All cores on one host, for a process pool.
+    assert '#BSUB -n 4\n#BSUB -R "span[hosts=1]"' in script
+    kwargs = {'job_name': 'conv', 'queue': 'short-serial', 'max_runtime': '04:00'}
+    assert '#BSUB -n 1\n' in write_bsub_script(tmp_path, tmp_path / 'script.py', tmp_path / 'config.py', 'key',
+                                                kwargs).read_text()
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from cosmic.util import CressmanGridder
+
+
+def _stations(num_stations=300, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(98, 124, num_stations)
+    y = rng.uniform(18, 41, num_stations)
+    z = rng.exponential(5, (num_stations, 10))
+    return x, y, z
+
+
+def _brute_force_cressman(x, y, z, gx, gy, search_radius, minimum_neighbors):
+    # Same algorithm as metpy.interpolate.inverse_distance_to_points with kind='cressman'.
+    griddata = np.full(gx.size, np.nan)
+    r_sq = search_radius**2
+    for i, (px, py) in enumerate(zip(gx.ravel(), gy.ravel())):
+        sq_dist = (x - px)**2 + (y - py)**2
+        close = sq_dist <= r_sq
+        if close.sum() >= minimum_neighbors:
+            weights = (r_sq - sq_dist[close]) / (r_sq + sq_dist[close])
+            griddata[i] = (weights * z[close]).sum() / weights.sum()
+    return griddata.reshape(gx.shape)
+
+
+def test_cressman_matches_brute_force(tmp_path):
+    x, y, z = _stations()
+    gridder = CressmanGridder(x, y, hres=0.5, search_radius=1.5, minimum_neighbors=2,
+                              cache_key=tmp_path / 'cache.npz')
+    expected = _brute_force_cressman(x, y, z[:, 0], gridder.gx, gridder.gy, 1.5, 2)
+    np.testing.assert_allclose(gridder.grid(z[:, 0]), expected)
+
+    # Gridding many fields at once gives the same as one at a time.
+    griddata = gridder.grid(z)
+    assert griddata.shape == (10,) + gridder.gx.shape
+    for i in range(10):
+        np.testing.assert_allclose(griddata[i], gridder.grid(z[:, i]))
+
+
+def test_cressman_cache(tmp_path):
+    x, y, z = _stations()
+    cache_key = tmp_path / 'cache.npz'
+    griddata1 = CressmanGridder(x, y, hres=0.5, search_radius=1.5, cache_key=cache_key).grid(z)
+    assert cache_key.exists()
+    griddata2 = CressmanGridder(x, y, hres=0.5, search_radius=1.5, cache_key=cache_key).grid(z)
+    np.testing.assert_array_equal(griddata1, griddata2)
+
+
+def test_cressman_missing_values(tmp_path):
+    x, y, z = _stations()
+    z[::7, 3] = np.nan
+    gridder = CressmanGridder(x, y, hres=0.5, search_radius=1.5, cache_key=tmp_path / 'cache.npz')
+    valid = ~np.isnan(z[:, 3])
+    expected = _brute_force_cressman(x[valid], y[valid], z[valid, 3], gridder.gx, gridder.gy, 1.5, 1)
+    np.testing.assert_allclose(gridder.grid(z)[3], expected)
+
+
+def test_cressman_matches_metpy(tmp_path):
+    interpolate = pytest.importorskip('metpy.interpolate')
+    x, y, z = _stations()
+    gx, gy, expected = interpolate.interpolate_to_grid(x, y, z[:, 0], interp_type='cressman',
+                                                       minimum_neighbors=1, hres=0.25, search_radius=0.48)
+    gridder = CressmanGridder(x, y, hres=0.25, search_radius=0.48, cache_key=tmp_path / 'cache.npz')
+    np.testing.assert_allclose(gridder.gx, gx)
+    np.testing.assert_allclose(gridder.gy, gy)
+    np.testing.assert_allclose(gridder.grid(z[:, 0]), expected)
@@ -0,0 +1,34 @@
+import iris
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('basmati')
+
+from cosmic.WP2 import extract_china_jja_2009_mean_precip
+
+
+def test_extract_gauge_dataset(tmp_path, monkeypatch):
+    # Stations more than a search radius (0.48deg) apart, so each grid cell near one only sees that one.
+    df_precip_station_jja = pd.DataFrame({'lat': [25.0, 30.0, 35.0], 'lon': [105.0, 110.0, 115.0],
+                                          'precip': [1.0, 2.0, 3.0]})
+
+    def load_jja_gauge_data(datadir):
+        return None, None, None, df_precip_station_jja
+
+    monkeypatch.setattr(extract_china_jja_2009_mean_precip, 'load_jja_gauge_data', load_jja_gauge_data)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'data').mkdir()
+    extract_china_jja_2009_mean_precip.extract_dataset(tmp_path, 'gauge_china_2419', '200906-200908')
+
+    cube = iris.load_cube(str(tmp_path / 'data/gauge_china_2419_china_amount.200906-200908.nc'))
+    lat = cube.coord('latitude').points
+    lon = cube.coord('longitude').points
+    assert 18 <= lat.min() and lat.max() <= 41
+    assert 97.5 <= lon.min() and lon.max() <= 125
+    for _, station in df_precip_station_jja.iterrows():
+        i = np.argmin(np.abs(lat - station.lat))
+        j = np.argmin(np.abs(lon - station.lon))
+        assert cube.data[i, j] == pytest.approx(station.precip)
+    # Far from any station.
+    assert np.isnan(cube.data[np.argmin(np.abs(lat - 20)), np.argmin(np.abs(lon - 120))])
@@ -0,0 +1,79 @@
+import datetime as dt
+
+import cf_units
+import iris
+import iris.coords
+import iris.cube
+import numpy as np
+import pandas as pd
+import pytest
+
+from cosmic.WP2.gauge_collocation import StationGridCollocator, collocate_files
+
+LAT = np.arange(18, 42, 0.5)
+LON = np.arange(98, 126, 0.5)
+
+
+def _make_cube(start, num_hours, field):
+    units = cf_units.Unit('hours since 1970-01-01 00:00:00', calendar='gregorian')
+    times = units.date2num(start) + np.arange(num_hours) + 0.5
+    time_coord = iris.coords.DimCoord(times, standard_name='time', units=units)
+    lat_coord = iris.coords.DimCoord(LAT, standard_name='latitude', units='degrees')
+    lon_coord = iris.coords.DimCoord(LON, standard_name='longitude', units='degrees')
+    data = np.stack([field(times[i], *np.meshgrid(LAT, LON, indexing='ij')) for i in range(num_hours)])
+    return iris.cube.Cube(data.astype(np.float32), long_name='precipitation', units='mm hr-1',
+                          dim_coords_and_dims=[(time_coord, 0), (lat_coord, 1), (lon_coord, 2)])
+
+
+@pytest.fixture
+def df_station_info():
+    return pd.DataFrame({
+        'station_id': np.array([50001, 50002, 50003, 50004], dtype=np.int32),
+        'lat': [20.1, 30.3, 40.0, 50.0],
+        'lon': [100.2, 110.9, 125.5, 110.0],
+    })
+
+
+def test_bilinear_linear_field(tmp_path, df_station_info):
+    cube = _make_cube(dt.datetime(2009, 6, 1), 5, lambda t, lat, lon: 0.1 * lat + 0.01 * lon)
+    collocator = StationGridCollocator.from_cube(df_station_info, cube, method='bilinear', cache_dir=tmp_path)
+    station_data = collocator.extract(cube, time_block=2)
+
+    expected = 0.1 * df_station_info.lat.values + 0.01 * df_station_info.lon.values
+    np.testing.assert_allclose(station_data[:, :3], np.tile(expected[:3], (5, 1)), rtol=1e-5)
+    # Outside grid.
+    assert np.isnan(station_data[:, 3]).all()
+
+
+def test_nearest(tmp_path, df_station_info):
+    cube = _make_cube(dt.datetime(2009, 6, 1), 3, lambda t, lat, lon: lat * 1000 + lon)
+    collocator = StationGridCollocator.from_cube(df_station_info, cube, cache_dir=tmp_path)
+    station_data = collocator.extract(cube)
+    np.testing.assert_allclose(station_data[0, :3], [20 * 1000 + 100, 30.5 * 1000 + 111, 40 * 1000 + 125.5])
+
+    # Loaded from cache.
+    assert len(list(tmp_path.glob('.cache_collocation.*.npz'))) == 1
+    collocator2 = StationGridCollocator.from_cube(df_station_info, cube, cache_dir=tmp_path)
+    np.testing.assert_array_equal(collocator.lat_idx, collocator2.lat_idx)
+
+
+def test_collocate_files_daily(tmp_path, df_station_info):
+    # Two files, with one day split across them: hourly rate is the hour of the day.
+    def field(t, lat, lon):
+        return np.full(lat.shape, np.floor(t) % 24)
+    cube1 = _make_cube(dt.datetime(2009, 6, 1), 36, field)
+    cube2 = _make_cube(dt.datetime(2009, 6, 2, 12), 36, field)
+    filenames = [tmp_path / 'precip1.nc', tmp_path / 'precip2.nc']
+    iris.save(cube1, str(filenames[0]))
+    iris.save(cube2, str(filenames[1]))
+
+    collocator = StationGridCollocator.from_cube(df_station_info, cube1, cache_dir=tmp_path)
+    df_daily = collocate_files(collocator, filenames, time_block=10)
+
+    assert list(df_daily.columns) == ['station_id', 'datetime', 'precip', 'num_samples']
+    df_station = df_daily[df_daily.station_id == 50001]
+    assert list(df_station.datetime) == [pd.Timestamp(2009, 6, d) for d in [1, 2, 3]]
+    assert (df_station.num_samples == 24).all()
+    # Mean of 0..23 * 24.
+    np.testing.assert_allclose(df_station.precip, 11.5 * 24)
+    assert df_daily[df_daily.station_id == 50004].precip.isna().all()
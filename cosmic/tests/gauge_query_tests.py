@@ -0,0 +1,75 @@
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('tables')
+
+from cosmic.datasets.gauge_china2419.convert_gauge_data import write_station_data_store, PRECIP_DTYPES
+from cosmic.datasets.gauge_china2419.query_gauge_data import (query_gauge_precip, calc_station_mean_precip,
+                                                               load_station_info)
+
+STATION_IDS = np.arange(50001, 50051)
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    rng = np.random.default_rng(0)
+    df_station_info = pd.DataFrame({
+        'station_id': STATION_IDS,
+        'lat': np.linspace(18, 41, len(STATION_IDS)),
+        'lon': np.linspace(98, 124, len(STATION_IDS)),
+    })
+    dates = pd.date_range('2007-01-01', '2010-12-31')
+    df_precip = pd.DataFrame({
+        'year': np.tile(dates.year, len(STATION_IDS)),
+        'month': np.tile(dates.month, len(STATION_IDS)),
+        'day': np.tile(dates.day, len(STATION_IDS)),
+        'precip': rng.exponential(3, len(dates) * len(STATION_IDS)).round(1),
+        'station_id': np.repeat(STATION_IDS, len(dates)),
+    }).astype(PRECIP_DTYPES)
+    df_precip['datetime'] = np.tile(dates.values, len(STATION_IDS))
+    df_precip.loc[::13, 'precip'] = -999
+
+    path = tmp_path / 'store.hdf'
+    write_station_data_store(path, df_station_info, df_precip)
+    return path, df_station_info, df_precip
+
+
+def test_query_date_range(store_path):
+    path, df_station_info, df_precip = store_path
+    start, end = dt.datetime(2008, 12, 1), dt.datetime(2009, 2, 28)
+    df = query_gauge_precip(path, start, end)
+
+    expected = df_precip[(df_precip.datetime >= start) & (df_precip.datetime <= end)]
+    assert len(df) == len(expected)
+    assert df.datetime.min() == start and df.datetime.max() == end
+    # Missing values replaced.
+    assert (df.precip == -999).sum() == 0
+    assert df.precip.isna().sum() == (expected.precip == -999).sum()
+
+
+@pytest.mark.parametrize('station_ids', [STATION_IDS[:3], STATION_IDS[::2]])
+def test_query_stations(store_path, station_ids):
+    path, df_station_info, df_precip = store_path
+    df = query_gauge_precip(path, dt.datetime(2009, 6, 1), dt.datetime(2009, 8, 31), station_ids=station_ids)
+    assert sorted(df.station_id.unique()) == sorted(station_ids)
+    assert len(df) == 92 * len(station_ids)
+
+
+def test_query_bbox_station_mean(store_path):
+    path, df_station_info, df_precip = store_path
+    bbox = (100, 110, 18, 41)
+    df = query_gauge_precip(path, dt.datetime(2009, 6, 1), dt.datetime(2009, 8, 31), bbox=bbox)
+    in_bbox = df_station_info[df_station_info.lon.between(100, 110)].station_id
+    assert sorted(df.station_id.unique()) == sorted(in_bbox)
+
+    df_station_mean = calc_station_mean_precip(load_station_info(path), df)
+    station_id = in_bbox.iloc[0]
+    station_precip = df_precip[(df_precip.station_id == station_id) &
+                               (df_precip.datetime >= dt.datetime(2009, 6, 1)) &
+                               (df_precip.datetime <= dt.datetime(2009, 8, 31))].precip
+    expected_mean = station_precip[station_precip != -999].mean()
+    actual_mean = df_station_mean[df_station_mean.station_id == station_id].precip.iloc[0]
+    assert np.isclose(actual_mean, expected_mean)
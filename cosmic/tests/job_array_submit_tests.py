@@ -0,0 +1,184 @@
+import os
+import re
+from collections import defaultdict
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip('remake')
+
+from cosmic.processing import bsub_task_submit, slurm_remake_run
+from cosmic.processing.task_manifest import read_array_manifest_entry
+from cosmic.processing.task_resources import TaskResourceHistory
+from cosmic.processing.task_spec import read_task_spec
+
+FAKE_BIN_DIR = Path(__file__).parent / 'fake_bin'
+
+
+def fake_func(inputs, outputs):
+    pass
+
+
+def fake_plot_func(inputs, outputs):
+    pass
+
+
+class FakeTask:
+    def __init__(self, key):
+        self.key = key
+        self.func = fake_func
+        self.inputs = []
+        self.outputs = []
+        self.func_args = ()
+        self.func_kwargs = {}
+
+    def path_hash_key(self):
+        return self.key
+
+
+class FakeTaskCtrl:
+    """Diamond DAG: t0 -> (t1, ..., t5) -> t6."""
+    def __init__(self):
+        self.sorted_tasks = [FakeTask(f't{i}') for i in range(7)]
+        self.prev_tasks = defaultdict(list)
+        for task in self.sorted_tasks[1:6]:
+            self.prev_tasks[task] = [self.sorted_tasks[0]]
+        self.prev_tasks[self.sorted_tasks[6]] = self.sorted_tasks[1:6]
+
+
+@pytest.fixture
+def fake_sched(tmp_path, monkeypatch):
+    sched_dir = tmp_path / 'sched'
+    monkeypatch.setenv('PATH', f'{FAKE_BIN_DIR}{os.pathsep}{os.environ["PATH"]}')
+    monkeypatch.setenv('FAKE_SCHED_DIR', str(sched_dir))
+    config_path = tmp_path / 'config.py'
+    config_path.write_text('# config\n')
+    scripts_dir = tmp_path / 'scripts'
+    scripts_dir.mkdir()
+    return sched_dir, config_path, scripts_dir
+
+
+@pytest.mark.parametrize('submit_module, ext', [(bsub_task_submit, 'bsub'), (slurm_remake_run, 'sbatch')])
+def test_submit_task_arrays(fake_sched, submit_module, ext):
+    sched_dir, config_path, scripts_dir = fake_sched
+    task_ctrl = FakeTaskCtrl()
+    kwargs = {'queue': 'short-serial', 'max_runtime': '04:00', 'mem': 1000}
+    submitter = submit_module.TaskSubmitter(scripts_dir, config_path, task_ctrl, kwargs)
+    submitter.submit_task_arrays(task_ctrl.sorted_tasks, max_array_size=3)
+
+    # Levels: [t0], [t1-t3], [t4-t5], [t6].
+    scripts = [(sched_dir / f'{jobid}.{ext}').read_text() for jobid in range(1000, 1004)]
+    assert not (sched_dir / f'1004.{ext}').exists()
+    if ext == 'bsub':
+        assert [re.search(r'#BSUB -J \w+\[1-(\d+)\]', s).group(1) for s in scripts] == ['1', '3', '2', '1']
+        assert '-w' not in scripts[0]
+        assert '#BSUB -w "done(1000)"' in scripts[1]
+        assert '#BSUB -w "done(1000)"' in scripts[2]
+        assert '#BSUB -w "done(1001) && done(1002)"' in scripts[3]
+    else:
+        assert [re.search(r'#SBATCH --array=1-(\d+)', s).group(1) for s in scripts] == ['1', '3', '2', '1']
+        assert '--dependency' not in scripts[0]
+        assert '#SBATCH --dependency=afterok:1000' in scripts[1]
+        assert '#SBATCH --dependency=afterok:1001:1002' in scripts[3]
+
+    manifest_path = re.search(r'--array-manifest (\S+)', scripts[2]).group(1)
+    assert read_array_manifest_entry(manifest_path, 1) == ['t4']
+    assert read_array_manifest_entry(manifest_path, 2) == ['t5']
+
+
+@pytest.mark.parametrize('submit_module, ext', [(bsub_task_submit, 'bsub'), (slurm_remake_run, 'sbatch')])
+def test_submit_packed_task_arrays(fake_sched, submit_module, ext):
+    sched_dir, config_path, scripts_dir = fake_sched
+    task_ctrl = FakeTaskCtrl()
+    kwargs = {'queue': 'par-multi', 'max_runtime': '04:00', 'mem': 1000}
+    submitter = submit_module.TaskSubmitter(scripts_dir, config_path, task_ctrl, kwargs)
+    submitter.submit_task_arrays(task_ctrl.sorted_tasks, pack_size=2, ncores=2)
+
+    # Levels: [t0], [t1-t5] in 3 packs, [t6].
+    scripts = [(sched_dir / f'{jobid}.{ext}').read_text() for jobid in range(1000, 1003)]
+    assert not (sched_dir / f'1003.{ext}').exists()
+    if ext == 'bsub':
+        assert [re.search(r'#BSUB -J \w+\[1-(\d+)\]', s).group(1) for s in scripts] == ['1', '3', '1']
+        assert '#BSUB -n 2' in scripts[1]
+        assert '#BSUB -w "done(1001)"' in scripts[2]
+    else:
+        assert [re.search(r'#SBATCH --array=1-(\d+)', s).group(1) for s in scripts] == ['1', '3', '1']
+        assert '#SBATCH --cpus-per-task=2' in scripts[1]
+        assert '#SBATCH --dependency=afterok:1001' in scripts[2]
+
+    manifest_path = re.search(r'--array-manifest (\S+)', scripts[1]).group(1)
+    assert read_array_manifest_entry(manifest_path, 1) == ['t1', 't2']
+    assert read_array_manifest_entry(manifest_path, 3) == ['t5']
+
+
+@pytest.mark.parametrize('submit_module, ext', [(bsub_task_submit, 'bsub'), (slurm_remake_run, 'sbatch')])
+def test_resources_from_history(fake_sched, submit_module, ext):
+    sched_dir, config_path, scripts_dir = fake_sched
+    task_ctrl = FakeTaskCtrl()
+    history = TaskResourceHistory(scripts_dir / 'history.jsonl')
+    history.record(task_ctrl.sorted_tasks[0], 2000, 3600)
+    kwargs = {'queue': 'short-serial', 'max_runtime': '04:00:00', 'mem': 16000}
+    submitter = submit_module.TaskSubmitter(scripts_dir, config_path, task_ctrl, kwargs, history)
+    submitter.submit_task(task_ctrl.sorted_tasks[0])
+    script = (sched_dir / f'1000.{ext}').read_text()
+    # 20% mem margin, 50% runtime margin.
+    if ext == 'bsub':
+        assert '#BSUB -M 2400' in script
+        assert '#BSUB -W 01:30' in script
+    else:
+        assert '#SBATCH --mem=2400' in script
+        assert '#SBATCH --time=01:30:00' in script
+
+
+@pytest.mark.parametrize('submit_module, ext', [(bsub_task_submit, 'bsub'), (slurm_remake_run, 'sbatch')])
+def test_resubmit_oom_tasks(fake_sched, monkeypatch, submit_module, ext):
+    sched_dir, config_path, scripts_dir = fake_sched
+    monkeypatch.setenv('COSMIC_TASK_RESOURCES', str(scripts_dir / 'history.jsonl'))
+    task_ctrl = FakeTaskCtrl()
+    task_ctrl.task_from_path_hash_key = {task.key: task for task in task_ctrl.sorted_tasks}
+    # Different function, so not affected by OOM kill of t2.
+    task_ctrl.sorted_tasks[6].func = fake_plot_func
+    kwargs = {'queue': 'short-serial', 'max_runtime': '04:00', 'mem': 1000}
+    submitter = submit_module.TaskSubmitter(scripts_dir, config_path, task_ctrl, kwargs)
+    submitter.submit_task_arrays(task_ctrl.sorted_tasks, max_array_size=3)
+
+    # t2 (1001[2]) OOM killed, t6 (1003[1]) waiting on it.
+    if ext == 'bsub':
+        (sched_dir / 'bjobs.out').write_text('1000|1|DONE|-\n1001|1|DONE|-\n1001|2|EXIT|TERM_MEMLIMIT: killed\n'
+                                             '1001|3|DONE|-\n1002|1|RUN|-\n1002|2|DONE|-\n1003|1|PEND|-\n')
+    else:
+        (sched_dir / 'sacct.out').write_text('1000_1|COMPLETED\n1001_1|COMPLETED\n1001_2|OUT_OF_MEMORY\n'
+                                             '1001_3|COMPLETED\n1002_1|RUNNING\n1002_2|COMPLETED\n1003_1|PENDING\n')
+    resubmitter = submit_module.TaskSubmitter(scripts_dir, config_path, task_ctrl, dict(kwargs))
+    resubmitted_tasks = resubmitter.resubmit_oom_tasks(submitter.submitted_jobs)
+
+    assert [task.key for task in resubmitted_tasks] == ['t2', 't6']
+    assert (sched_dir / 'cancelled').read_text().split() == ['1003[1]' if ext == 'bsub' else '1003_1']
+    t2_script = (sched_dir / f'1004.{ext}').read_text()
+    t6_script = (sched_dir / f'1005.{ext}').read_text()
+    if ext == 'bsub':
+        assert '#BSUB -M 2000' in t2_script
+        assert '#BSUB -M 1000' in t6_script
+        # Depends on the running element t4 only, not on the whole array or on done elements.
+        assert '#BSUB -w "done(1004) && done(1002[1])"' in t6_script
+    else:
+        assert '#SBATCH --mem=2000' in t2_script
+        assert '#SBATCH --mem=1000' in t6_script
+        assert '#SBATCH --dependency=afterok:1004:1002_1' in t6_script
+
+
+@pytest.mark.parametrize('submit_module, ext', [(bsub_task_submit, 'bsub'), (slurm_remake_run, 'sbatch')])
+def test_submit_with_task_specs(fake_sched, submit_module, ext):
+    sched_dir, config_path, scripts_dir = fake_sched
+    task_ctrl = FakeTaskCtrl()
+    kwargs = {'queue': 'short-serial', 'max_runtime': '04:00', 'mem': 1000}
+    submitter = submit_module.TaskSubmitter(scripts_dir, config_path, task_ctrl, kwargs)
+    submitter.write_task_specs(task_ctrl.sorted_tasks)
+    submitter.submit_task(task_ctrl.sorted_tasks[0])
+    submitter.submit_task_arrays(task_ctrl.sorted_tasks[1:])
+
+    for jobid in [1000, 1001]:
+        script = (sched_dir / f'{jobid}.{ext}').read_text()
+        specs_path = re.search(r'--task-specs (\S+)', script).group(1)
+        assert specs_path == str(submitter.task_specs_path)
+    assert read_task_spec(specs_path, 't6').func_name == 'fake_func'
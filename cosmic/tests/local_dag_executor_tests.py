@@ -0,0 +1,88 @@
+from hashlib import sha1
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from cosmic.cosmic_errors import CosmicError
+from cosmic.processing.local_dag_executor import LocalDagExecutor
+
+
+def _gen_dag():
+    # Two independent diamonds: a -> (b1, b2, b3) -> c, and d -> e.
+    prev_tasks = {
+        'b1': ['a'], 'b2': ['a'], 'b3': ['a'],
+        'c': ['b1', 'b2', 'b3'],
+        'e': ['d'],
+    }
+    tasks = ['a', 'd', 'b1', 'b2', 'b3', 'e', 'c']
+    return tasks, prev_tasks
+
+
+class FileTaskRunner:
+    """Each task writes a hash of its inputs (the outputs of the tasks it depends on) to its output."""
+    def __init__(self, output_dir, prev_tasks, fail_tasks=()):
+        self.output_dir = output_dir
+        self.prev_tasks = prev_tasks
+        self.fail_tasks = fail_tasks
+
+    def __call__(self, task):
+        if task in self.fail_tasks:
+            raise Exception(f'task {task} failed')
+        inputs = b''.join([(self.output_dir / prev_task).read_bytes() for prev_task in self.prev_tasks.get(task, [])])
+        (self.output_dir / task).write_text(sha1(inputs + task.encode()).hexdigest())
+
+
+def _read_outputs(output_dir):
+    return {path.name: path.read_text() for path in sorted(output_dir.glob('*'))}
+
+
+def test_local_dag_executor_same_as_serial(tmp_path):
+    tasks, prev_tasks = _gen_dag()
+    serial_dir = tmp_path / 'serial'
+    serial_dir.mkdir()
+    runner = FileTaskRunner(serial_dir, prev_tasks)
+    for task in tasks:
+        runner(task)
+
+    parallel_dir = tmp_path / 'parallel'
+    parallel_dir.mkdir()
+    executor = LocalDagExecutor(tasks, prev_tasks, FileTaskRunner(parallel_dir, prev_tasks), num_procs=3)
+    completed_tasks = executor.run()
+
+    assert sorted(completed_tasks) == sorted(tasks)
+    assert completed_tasks.index('c') > max(completed_tasks.index(b) for b in ['b1', 'b2', 'b3'])
+    assert _read_outputs(parallel_dir) == _read_outputs(serial_dir)
+
+
+def test_local_dag_executor_serial_order(tmp_path):
+    tasks, prev_tasks = _gen_dag()
+    executor = LocalDagExecutor(tasks, prev_tasks, FileTaskRunner(tmp_path, prev_tasks), num_procs=1)
+    assert executor.run() == tasks
+
+
+def test_local_dag_executor_failure(tmp_path):
+    tasks, prev_tasks = _gen_dag()
+    executor = LocalDagExecutor(tasks, prev_tasks, FileTaskRunner(tmp_path, prev_tasks, fail_tasks=['b2']),
+                                num_procs=2)
+    with pytest.raises(CosmicError):
+        executor.run()
+    assert executor.failed_tasks == ['b2']
+    assert executor.skipped_tasks == ['c']
+    # Independent tasks are still run.
+    assert sorted(_read_outputs(tmp_path)) == ['a', 'b1', 'b3', 'd', 'e']
+
+
+def _alloc_task(task):
+    np.ones(int(task) * 1024 ** 2 // 8).sum()
+
+
+def test_local_dag_executor_mem_limit():
+    # Address space of this process, plus some headroom: the 4096 MB task cannot run, the 1 MB one can.
+    vm_size_kb = [int(l.split()[1]) for l in Path('/proc/self/status').read_text().split('\n')
+                  if l.startswith('VmSize')][0]
+    executor = LocalDagExecutor(['1', '4096'], {}, _alloc_task, num_procs=2, mem_limit_mb=vm_size_kb / 1024 + 500)
+    with pytest.raises(CosmicError):
+        executor.run()
+    assert executor.completed_tasks == ['1']
+    assert executor.failed_tasks == ['4096']
@@ -0,0 +1,67 @@
+import iris
+import iris.coords
+import iris.cube
+import numpy as np
+import pytest
+
+from cosmic.cosmic_errors import CosmicError
+from cosmic.regions import Region, get_region, extract_region, load_region_cube
+
+CONSTRAINT_ASIA = (iris.Constraint(coord_values={'latitude': lambda cell: 0.9 < cell < 56.1})
+                   & iris.Constraint(coord_values={'longitude': lambda cell: 56.9 < cell < 151.1}))
+CONSTRAINT_EU = iris.Constraint(coord_values={'latitude': lambda cell: 28 < cell < 67})
+
+
+def _make_cube(lon, dlat=0.25):
+    lat = np.arange(-89.875, 90, dlat)
+    lat_coord = iris.coords.DimCoord(lat, standard_name='latitude', units='degrees')
+    lon_coord = iris.coords.DimCoord(lon, standard_name='longitude', units='degrees', circular=True)
+    lon_coord.guess_bounds()
+    time_coord = iris.coords.DimCoord(np.arange(3), standard_name='time', units='hours since 2000-01-01')
+    data = np.random.default_rng(0).random((3, len(lat), len(lon))).astype(np.float32)
+    return iris.cube.Cube(data, long_name='precipitation', units='mm hr-1',
+                          dim_coords_and_dims=[(time_coord, 0), (lat_coord, 1), (lon_coord, 2)])
+
+
+def test_asia_matches_constraint():
+    cube = _make_cube(np.arange(0.125, 360, 0.25))
+    asia_cube = extract_region(cube, 'asia')
+    expected = cube.extract(CONSTRAINT_ASIA)
+    assert asia_cube.coord('latitude') == expected.coord('latitude')
+    assert asia_cube.coord('longitude') == expected.coord('longitude')
+    np.testing.assert_array_equal(asia_cube.data, expected.data)
+
+
+@pytest.mark.parametrize('lon', [np.arange(0.125, 360, 0.25), np.arange(-179.875, 180, 0.25)])
+def test_europe_wraps(lon):
+    cube = _make_cube(lon)
+    eu_cube = extract_region(cube, 'europe')
+    expected = cube.extract(CONSTRAINT_EU).intersection(longitude=(-22, 37), ignore_bounds=True)
+    eu_lon = eu_cube.coord('longitude').points
+    assert np.all(np.diff(eu_lon) > 0)
+    np.testing.assert_allclose(eu_lon, expected.coord('longitude').points)
+    np.testing.assert_allclose(eu_cube.coord('longitude').bounds, expected.coord('longitude').bounds)
+    np.testing.assert_array_equal(eu_cube.data, expected.data)
+
+
+def test_index_cached_by_grid():
+    region = Region('test', (10, 20), (30, 40))
+    lat = np.arange(-89.5, 90)
+    lon = np.arange(0.5, 360)
+    region_index = region.index(lat, lon)
+    assert region.index(lat.copy(), lon.copy()) is region_index
+    assert region.index(lat, lon + 0.25) is not region_index
+    assert region.index_slices(lat, lon) == (slice(100, 110), slice(30, 40))
+
+    with pytest.raises(CosmicError):
+        get_region('europe').index_slices(lat, lon)
+    with pytest.raises(CosmicError):
+        get_region('atlantis')
+
+
+def test_load_region_cube(tmp_path):
+    cube = _make_cube(np.arange(0.125, 360, 0.25))
+    iris.save(cube, str(tmp_path / 'global.nc'))
+    asia_cube = load_region_cube(tmp_path / 'global.nc', 'asia')
+    assert asia_cube.has_lazy_data()
+    np.testing.assert_array_equal(asia_cube.data, cube.extract(CONSTRAINT_ASIA).data)
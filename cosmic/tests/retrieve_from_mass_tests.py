@@ -0,0 +1,101 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from cosmic.datasets.UM_N1280.retrieve_from_mass import main, parse_pp_year_month
+
+FAKE_BIN_DIR = Path(__file__).parent / 'fake_bin'
+
+CONFIG_TEMPLATE = """
+from pathlib import Path
+
+BASE_OUTPUT_DIRPATH = Path('{output_dir}')
+ACTIVE_RUNIDS = ['u-ak543']
+MASS_INFO = {{
+    'u-ak543': {{
+        'stream': {{
+            'ap9': {{
+                'stashcodes': [4203, 4204],
+                'extra_elements': {{}},
+                'output_name': 'precip',
+                'start_year_month': (2005, 11),
+                'end_year_month': (2006, 2),
+            }},
+        }},
+    }},
+}}
+"""
+
+EXPECTED_FILES = [
+    'precip_200511/ak543a.p92005nov.pp',
+    'precip_200512/ak543a.p92005dec.pp',
+    'precip_200601/ak543a.p92006jan.pp',
+    'precip_200602/ak543a.p92006feb.pp',
+]
+
+
+@pytest.fixture
+def fake_moo(tmp_path, monkeypatch):
+    output_dir = tmp_path / 'output'
+    config_filepath = tmp_path / 'config.py'
+    config_filepath.write_text(CONFIG_TEMPLATE.format(output_dir=output_dir))
+    state_dir = tmp_path / 'state'
+    state_dir.mkdir()
+
+    monkeypatch.setenv('PATH', f'{FAKE_BIN_DIR}{os.pathsep}{os.environ["PATH"]}')
+    monkeypatch.setenv('FAKE_MOO_STATE_DIR', str(state_dir))
+    monkeypatch.chdir(tmp_path)
+    return config_filepath, output_dir / 'u-ak543' / 'ap9.pp'
+
+
+def _retrieved_files(stream_dir):
+    return sorted(str(p.relative_to(stream_dir)) for p in stream_dir.glob('*/*.pp'))
+
+
+@pytest.mark.parametrize('batch_months', [False, True])
+def test_retrieve(fake_moo, batch_months):
+    config_filepath, stream_dir = fake_moo
+    argv = [str(config_filepath), '--max-concurrent', '3']
+    if batch_months:
+        argv.append('--batch-months')
+    failed = main(argv)
+    assert failed == []
+    assert _retrieved_files(stream_dir) == EXPECTED_FILES
+    # No batch dirs left.
+    assert sorted(p.name for p in stream_dir.iterdir()) == [f.split('/')[0] for f in EXPECTED_FILES]
+
+
+def test_retrieve_transient_error_retried(fake_moo, monkeypatch):
+    config_filepath, stream_dir = fake_moo
+    monkeypatch.setenv('FAKE_MOO_FAILURES', '2')
+    monkeypatch.setenv('FAKE_MOO_ERROR', 'SSC_TASK_REJECTION')
+    failed = main([str(config_filepath), '--retry-delay', '0.01', '--max-retries', '2'])
+    assert failed == []
+    assert _retrieved_files(stream_dir) == EXPECTED_FILES
+
+
+def test_retrieve_failures_reported(fake_moo, monkeypatch):
+    config_filepath, stream_dir = fake_moo
+    monkeypatch.setenv('FAKE_MOO_FAILURES', '3')
+    failed = main([str(config_filepath), '--retry-delay', '0.01', '--max-retries', '1', '--batch-months'])
+    assert sorted(r.year for r, e in failed) == [2005, 2006]
+    assert 'SSC_STORAGE_SYSTEM_UNAVAILABLE' in failed[0][1].stderr
+
+
+def test_retrieve_path_already_exists(fake_moo):
+    config_filepath, stream_dir = fake_moo
+    assert main([str(config_filepath)]) == []
+    # Second retrieval: moo reports that files exist, which is not a failure.
+    assert main([str(config_filepath)]) == []
+    assert _retrieved_files(stream_dir) == EXPECTED_FILES
+
+
+@pytest.mark.parametrize('filename, expected', [
+    ('ak543a.p92006jan.pp', (2006, 1)),
+    ('ak543a.p920061201.pp', (2006, 12)),
+    ('al508a.p82009aug.pp', (2009, 8)),
+])
+def test_parse_pp_year_month(filename, expected):
+    stream = 'ap' + filename.split('.')[1][1]
+    assert parse_pp_year_month(filename, stream) == expected
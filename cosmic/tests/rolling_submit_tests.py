@@ -0,0 +1,122 @@
+import os
+import re
+from collections import defaultdict
+from pathlib import Path
+
+import pytest
+
+from cosmic.cosmic_errors import CosmicError
+from cosmic.util import sysrun
+from cosmic.processing.rolling_submit import RollingSubmitter
+from cosmic.processing.task_resources import query_lsf_job_states
+from cosmic.processing.task_status import write_task_status, read_task_status, record_task_status
+
+FAKE_BIN_DIR = Path(__file__).parent / 'fake_bin'
+
+
+class FakeTask:
+    def __init__(self, key):
+        self.key = key
+
+    def path_hash_key(self):
+        return self.key
+
+    def __repr__(self):
+        return f'FakeTask({self.key})'
+
+
+def _gen_dag():
+    """Diamond DAG: t0 -> (t1, ..., t5) -> t6."""
+    tasks = [FakeTask(f't{i}') for i in range(7)]
+    prev_tasks = defaultdict(list)
+    for task in tasks[1:6]:
+        prev_tasks[task] = [tasks[0]]
+    prev_tasks[tasks[6]] = tasks[1:6]
+    return tasks, prev_tasks
+
+
+@pytest.fixture
+def fake_sched(tmp_path, monkeypatch):
+    sched_dir = tmp_path / 'sched'
+    sched_dir.mkdir()
+    monkeypatch.setenv('PATH', f'{FAKE_BIN_DIR}{os.pathsep}{os.environ["PATH"]}')
+    monkeypatch.setenv('FAKE_SCHED_DIR', str(sched_dir))
+    monkeypatch.setenv('COSMIC_TASK_STATUS_DIR', str(tmp_path / 'task_status'))
+    return sched_dir
+
+
+def _submit_task(task):
+    output = sysrun(f'echo "python bsub_task_run.py config.py {task.key}" | bsub').stdout
+    return re.match(r'Job <(\d+)>', output).group(1)
+
+
+def _rolling_submitter(tmp_path, max_jobs=2):
+    tasks, prev_tasks = _gen_dag()
+    return RollingSubmitter(tasks, prev_tasks, _submit_task, query_lsf_job_states, max_jobs,
+                            state_path=tmp_path / 'state.json')
+
+
+def test_rolling_submit(fake_sched, tmp_path):
+    rolling_submitter = _rolling_submitter(tmp_path)
+    rolling_submitter.step()
+    assert rolling_submitter.submitted == {'t0': '1000'}
+
+    write_task_status('t0', 'done')
+    rolling_submitter.step()
+    assert rolling_submitter.submitted == {'t1': '1001', 't2': '1002'}
+
+    write_task_status('t1', 'done')
+    rolling_submitter.step()
+    assert rolling_submitter.submitted == {'t2': '1002', 't3': '1003'}
+
+    for key in ['t2', 't3', 't4', 't5', 't6']:
+        while key not in rolling_submitter.submitted:
+            rolling_submitter.step()
+            assert len(rolling_submitter.submitted) <= 2
+        write_task_status(key, 'done')
+    rolling_submitter.run(poll_interval=0)
+    assert rolling_submitter.finished
+    assert len(rolling_submitter.done) == 7
+    # One job per task.
+    assert (fake_sched / 'last_jobid').read_text() == '1006'
+
+
+def test_rolling_submit_restart(fake_sched, tmp_path):
+    rolling_submitter = _rolling_submitter(tmp_path)
+    rolling_submitter.step()
+    write_task_status('t0', 'done')
+    rolling_submitter.step()
+
+    restarted_submitter = _rolling_submitter(tmp_path)
+    assert restarted_submitter.done == {'t0'}
+    assert restarted_submitter.submitted == {'t1': '1001', 't2': '1002'}
+    restarted_submitter.step()
+    # Nothing resubmitted.
+    assert (fake_sched / 'last_jobid').read_text() == '1002'
+
+
+def test_rolling_submit_job_died(fake_sched, tmp_path):
+    rolling_submitter = _rolling_submitter(tmp_path)
+    rolling_submitter.step()
+    (fake_sched / 'bjobs.out').write_text('1000|0|RUN|-\n')
+    rolling_submitter.step()
+    assert rolling_submitter.submitted == {'t0': '1000'}
+
+    # Killed without writing a status file.
+    (fake_sched / 'bjobs.out').write_text('1000|0|EXIT|TERM_RUNLIMIT: job killed after reaching LSF run time limit\n')
+    rolling_submitter.step()
+    assert rolling_submitter.failed == {'t0'}
+    assert rolling_submitter.finished
+    with pytest.raises(CosmicError):
+        rolling_submitter.run(poll_interval=0)
+
+
+def test_record_task_status(tmp_path):
+    with record_task_status('k1', tmp_path):
+        pass
+    assert read_task_status('k1', tmp_path) == 'done'
+    with pytest.raises(ValueError):
+        with record_task_status('k1', tmp_path):
+            raise ValueError('task failed')
+    assert read_task_status('k1', tmp_path) == 'failed'
+    assert read_task_status('k2', tmp_path) is None
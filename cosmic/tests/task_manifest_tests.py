@@ -0,0 +1,68 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from cosmic.cosmic_errors import CosmicError
+from cosmic.processing.task_manifest import (calc_task_levels, split_into_groups, write_array_manifest,
+                                             read_array_manifest_entry, array_index_from_env, num_procs_from_env,
+                                             run_task_pack)
+
+
+def test_calc_task_levels():
+    # a -> c -> d, b -> d, e independent.
+    tasks = ['a', 'b', 'e', 'c', 'd']
+    prev_tasks = {'c': ['a'], 'd': ['c', 'b']}
+    assert calc_task_levels(tasks, prev_tasks) == [['a', 'b', 'e'], ['c'], ['d']]
+    # Dependencies on tasks that are not being run are ignored.
+    assert calc_task_levels(['c', 'd'], prev_tasks) == [['c'], ['d']]
+    assert calc_task_levels([], prev_tasks) == []
+
+
+def test_split_into_groups():
+    assert split_into_groups(list(range(5)), 2) == [[0, 1], [2, 3], [4]]
+
+
+def test_array_manifest(tmp_path, monkeypatch):
+    manifest_path = tmp_path / 'manifest.json'
+    write_array_manifest(manifest_path, [['k1'], ['k2', 'k3']])
+    assert read_array_manifest_entry(manifest_path, 2) == ['k2', 'k3']
+    with pytest.raises(CosmicError):
+        read_array_manifest_entry(manifest_path, 0)
+
+    monkeypatch.delenv('LSB_JOBINDEX', raising=False)
+    monkeypatch.delenv('SLURM_ARRAY_TASK_ID', raising=False)
+    with pytest.raises(CosmicError):
+        array_index_from_env()
+    monkeypatch.setenv('SLURM_ARRAY_TASK_ID', '7')
+    assert array_index_from_env() == 7
+
+
+def _touch_task(key):
+    # key is the path of the output file, tasks with 'fail' in the filename fail.
+    if 'fail' in Path(key).name:
+        raise Exception(f'task {key} failed')
+    Path(key).write_text(str(os.getpid()))
+
+
+@pytest.mark.parametrize('num_procs', [1, 3])
+def test_run_task_pack(tmp_path, num_procs):
+    keys = [str(tmp_path / f'out{i}') for i in range(5)]
+    run_task_pack(_touch_task, keys, num_procs)
+    assert all(Path(key).exists() for key in keys)
+
+
+def test_run_task_pack_failure(tmp_path):
+    keys = [str(tmp_path / 'out0'), str(tmp_path / 'fail1'), str(tmp_path / 'out2')]
+    with pytest.raises(CosmicError, match='1/3 tasks failed'):
+        run_task_pack(_touch_task, keys, 2)
+    # Other tasks in the pack are still run.
+    assert (tmp_path / 'out0').exists() and (tmp_path / 'out2').exists()
+
+
+def test_num_procs_from_env(monkeypatch):
+    monkeypatch.delenv('LSB_DJOB_NUMPROC', raising=False)
+    monkeypatch.delenv('SLURM_CPUS_PER_TASK', raising=False)
+    assert num_procs_from_env() == os.cpu_count()
+    monkeypatch.setenv('LSB_DJOB_NUMPROC', '4')
+    assert num_procs_from_env() == 4
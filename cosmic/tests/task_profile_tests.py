@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from cosmic.processing.task_profile import profile_task, load_profiles, func_costs, critical_path, main
+
+
+def convert(inputs, outputs):
+    pass
+
+
+def plot(inputs, outputs):
+    pass
+
+
+class FakeTask:
+    def __init__(self, key, func, inputs, outputs):
+        self.key = key
+        self.func = func
+        self.inputs = inputs
+        self.outputs = outputs
+
+    def path_hash_key(self):
+        return self.key
+
+
+def _record(key, func, wall_time, inputs, outputs):
+    return {'func': func, 'path_hash_key': key, 'wall_time': wall_time, 'cpu_time': wall_time / 2,
+            'peak_rss_mb': 100, 'input_bytes': 0, 'output_bytes': 0, 'read_bytes': None, 'write_bytes': 1000,
+            'inputs': inputs, 'outputs': outputs}
+
+
+def _gen_profiles():
+    """Diamond DAG: a -> (b, c) -> d, with c slower than b."""
+    records = [
+        _record('a', 'mod.convert', 1, ['in.nc'], ['a.nc']),
+        _record('b', 'mod.convert', 2, ['a.nc'], ['b.nc']),
+        _record('c', 'mod.analyse', 5, ['a.nc'], ['c.nc']),
+        _record('d', 'mod.plot', 1, ['b.nc', 'c.nc'], ['d.png']),
+    ]
+    return {r['path_hash_key']: r for r in records}
+
+
+def test_profile_task(tmp_path):
+    path = tmp_path / 'profiles.jsonl'
+    input_path = tmp_path / 'in.nc'
+    input_path.write_bytes(b'0' * 100)
+    output_path = tmp_path / 'out.nc'
+    task = FakeTask('k1', convert, {'input': str(input_path)}, [str(output_path)])
+    with profile_task(task, path):
+        output_path.write_bytes(b'0' * 200)
+
+    with pytest.raises(ValueError):
+        with profile_task(FakeTask('k2', plot, [], []), path):
+            raise ValueError('task failed')
+
+    profiles = load_profiles(path)
+    # Only successful tasks recorded.
+    assert list(profiles) == ['k1']
+    record = profiles['k1']
+    assert record['func'] == f'{__name__}.convert'
+    assert record['input_bytes'] == 100
+    assert record['output_bytes'] == 200
+    assert record['wall_time'] >= 0
+    assert record['peak_rss_mb'] > 0
+
+
+def test_func_costs():
+    costs = func_costs(_gen_profiles())
+    assert costs['mod.convert']['count'] == 2
+    assert costs['mod.convert']['wall_time'] == 3
+    assert costs['mod.convert']['peak_rss_mb'] == 100
+    assert costs['mod.convert']['read_bytes'] == 0
+    assert costs['mod.convert']['write_bytes'] == 2000
+
+
+def test_critical_path():
+    path, path_time = critical_path(_gen_profiles())
+    assert [r['path_hash_key'] for r in path] == ['a', 'c', 'd']
+    assert path_time == 7
+    assert critical_path({}) == ([], 0)
+
+
+def test_main(tmp_path, capsys):
+    path = tmp_path / 'profiles.jsonl'
+    path.write_text(''.join(json.dumps(r) + '\n' for r in _gen_profiles().values()))
+    main([str(path), '--json'])
+    report = json.loads(capsys.readouterr().out)
+    assert report['critical_path'] == ['a', 'c', 'd']
+    main([str(path), '--sort', 'cpu_time'])
+    output = capsys.readouterr().out
+    # Ranked by total cost.
+    assert output.index('mod.analyse') < output.index('mod.convert') < output.index('mod.plot')
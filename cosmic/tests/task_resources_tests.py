@@ -0,0 +1,148 @@
+import os
+from collections import defaultdict
+from pathlib import Path
+
+import pytest
+
+from cosmic.processing.task_resources import (TaskResourceHistory, record_task_resources, estimate_resources,
+                                              parse_runtime, format_runtime, query_lsf_job_states,
+                                              query_slurm_job_states, tasks_to_resubmit, MIN_MEM_MB,
+                                              MIN_RUNTIME_S, OOM_MEM_FACTOR)
+
+FAKE_BIN_DIR = Path(__file__).parent / 'fake_bin'
+
+
+def convert(inputs, outputs):
+    pass
+
+
+def plot(inputs, outputs):
+    pass
+
+
+class FakeTask:
+    def __init__(self, key, func, inputs):
+        self.key = key
+        self.func = func
+        self.inputs = inputs
+
+    def path_hash_key(self):
+        return self.key
+
+    def __repr__(self):
+        return f'FakeTask({self.key})'
+
+
+def _input_file(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b'0' * size)
+    return str(path)
+
+
+def test_history_estimate(tmp_path):
+    history = TaskResourceHistory(tmp_path / 'history.jsonl')
+    small_task = FakeTask('k1', convert, [_input_file(tmp_path, 'small', 1000)])
+    large_task = FakeTask('k2', convert, {'in': _input_file(tmp_path, 'large', 4000)})
+    history.record(small_task, 2000, 1000)
+
+    assert history.estimate(FakeTask('k3', plot, [])) is None
+    assert history.estimate(small_task, mem_margin=0.5, runtime_margin=1) == (3000, 2000)
+    # Scaled up for larger inputs.
+    assert history.estimate(large_task, mem_margin=0, runtime_margin=0) == (8000, 4000)
+    # Missing inputs: use all runs for func.
+    assert history.estimate(FakeTask('k4', convert, [str(tmp_path / 'missing')]), 0, 0) == (2000, 1000)
+
+    # Reloaded from file.
+    history = TaskResourceHistory(tmp_path / 'history.jsonl')
+    history.record(FakeTask('k5', plot, []), 10, 1)
+    assert history.estimate(FakeTask('k5', plot, []), 0, 0) == (MIN_MEM_MB, MIN_RUNTIME_S)
+    assert len(history.records) == 2
+
+
+def test_history_oom(tmp_path):
+    history = TaskResourceHistory(tmp_path / 'history.jsonl')
+    task = FakeTask('k1', convert, [_input_file(tmp_path, 'in', 1000)])
+    history.record_oom(task, 16000)
+    assert history.estimate(task) == (16000 * OOM_MEM_FACTOR, None)
+
+    history.record(task, 2000, 1000)
+    assert history.estimate(task, 0, 0) == (16000 * OOM_MEM_FACTOR, 1000)
+
+
+def test_record_task_resources(tmp_path):
+    history = TaskResourceHistory(tmp_path / 'history.jsonl')
+    task = FakeTask('k1', convert, [])
+    with record_task_resources(task, history):
+        pass
+    with pytest.raises(Exception):
+        with record_task_resources(task, history):
+            raise Exception('task failed')
+    assert len(TaskResourceHistory(tmp_path / 'history.jsonl').records) == 1
+    assert history.records[0]['peak_rss_mb'] > 0
+
+
+def test_estimate_resources(tmp_path):
+    history = TaskResourceHistory(tmp_path / 'history.jsonl')
+    tasks = [FakeTask(f'k{i}', convert, []) for i in range(4)]
+    history.record(tasks[0], 2000, 1000)
+    mem, runtime = estimate_resources(tasks, history, 16000, 3600, mem_margin=0, runtime_margin=0)
+    assert (mem, runtime) == (2000, 4000)
+    # 4 tasks on 2 cores: twice the memory, half the time.
+    mem, runtime = estimate_resources(tasks, history, 16000, 3600, ncores=2, mem_margin=0, runtime_margin=0)
+    assert (mem, runtime) == (4000, 2000)
+    assert estimate_resources(tasks, history, 16000, 3600, max_mem=1500)[0] == 1500
+    # No history for one task: defaults.
+    assert estimate_resources(tasks + [FakeTask('p', plot, [])], history, 16000, 3600) == (16000, 3600)
+
+
+def test_runtime_format():
+    assert parse_runtime('04:00') == 4 * 3600
+    assert parse_runtime('01:30:10') == 5410
+    assert format_runtime(5410) == '01:31'
+    assert format_runtime(5410, include_seconds=True) == '01:31:00'
+
+
+@pytest.fixture
+def fake_sched(tmp_path, monkeypatch):
+    sched_dir = tmp_path / 'sched'
+    sched_dir.mkdir()
+    monkeypatch.setenv('PATH', f'{FAKE_BIN_DIR}{os.pathsep}{os.environ["PATH"]}')
+    monkeypatch.setenv('FAKE_SCHED_DIR', str(sched_dir))
+    return sched_dir
+
+
+def test_query_lsf_job_states(fake_sched):
+    (fake_sched / 'bjobs.out').write_text('1000|0|DONE|-\n'
+                                          '1001|1|EXIT|TERM_MEMLIMIT: job killed after reaching LSF memory usage limit\n'
+                                          '1001|2|PEND|-\n')
+    states = query_lsf_job_states([('1000', None), ('1001', 1), ('1001', 2)])
+    assert states == {('1000', None): 'DONE', ('1001', 1): 'OOM', ('1001', 2): 'PEND'}
+
+
+def test_query_slurm_job_states(fake_sched):
+    (fake_sched / 'sacct.out').write_text('1000|COMPLETED\n'
+                                          '1000.batch|COMPLETED\n'
+                                          '1001_1|FAILED\n'
+                                          '1001_1.batch|OUT_OF_MEMORY\n'
+                                          '1001_2|CANCELLED by 123\n'
+                                          '1002|PENDING\n')
+    states = query_slurm_job_states([('1000', None), ('1001', 1), ('1001', 2), ('1002', None)])
+    assert states == {('1000', None): 'COMPLETED', ('1001', 1): 'OOM', ('1001', 2): 'CANCELLED',
+                      ('1002', None): 'PENDING'}
+
+
+def test_tasks_to_resubmit(tmp_path):
+    # a -> b -> c, d independent.
+    tasks = {key: FakeTask(key, convert, []) for key in 'abcd'}
+
+    class FakeTaskCtrl:
+        task_from_path_hash_key = tasks
+        prev_tasks = defaultdict(list, {tasks['b']: [tasks['a']], tasks['c']: [tasks['b']]})
+
+    submitted_jobs = [{'path_hash_key': key, 'jobid': f'100{i}', 'index': None, 'mem': 1000}
+                      for i, key in enumerate('abcd')]
+    job_states = {('1000', None): 'DONE', ('1001', None): 'OOM', ('1002', None): 'PEND', ('1003', None): 'RUN'}
+    history = TaskResourceHistory(tmp_path / 'history.jsonl')
+    resubmit = tasks_to_resubmit(FakeTaskCtrl(), submitted_jobs, job_states, history)
+    assert [task.key for task, _ in resubmit] == ['b', 'c']
+    assert history.estimate(tasks['b'])[0] == 1000 * OOM_MEM_FACTOR
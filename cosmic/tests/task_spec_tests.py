@@ -0,0 +1,84 @@
+import os
+import time
+
+import pytest
+
+from cosmic.cosmic_errors import CosmicError
+from cosmic.util import load_module
+from cosmic.processing.task_spec import TaskSpec, write_task_specs, read_task_spec
+
+CONFIG = '''
+def double(inputs, outputs, factor=2):
+    outputs[0].write_text(str(int(inputs['in'].read_text()) * factor))
+'''
+
+
+def concat(inputs, outputs, sep):
+    outputs['out'].write_text(sep.join(p.read_text() for p in inputs))
+
+
+class FakeTask:
+    def __init__(self, key, func, inputs, outputs, func_args=(), func_kwargs=None):
+        self.key = key
+        self.func = func
+        self.inputs = inputs
+        self.outputs = outputs
+        self.func_args = func_args
+        self.func_kwargs = func_kwargs or {}
+
+    def path_hash_key(self):
+        return self.key
+
+
+def _set_mtime(path, mtime):
+    os.utime(path, (mtime, mtime))
+
+
+def test_task_spec_run(tmp_path):
+    config_path = tmp_path / 'config.py'
+    config_path.write_text(CONFIG)
+    config = load_module(config_path)
+    (tmp_path / 'a').write_text('3')
+    (tmp_path / 'b').write_text('4')
+    tasks = [
+        FakeTask('k1', config.double, {'in': tmp_path / 'a'}, [tmp_path / 'out' / 'a2'], func_kwargs={'factor': 5}),
+        FakeTask('k2', concat, [tmp_path / 'a', tmp_path / 'b'], {'out': tmp_path / 'ab'}, func_args=('-', )),
+    ]
+    specs_path = tmp_path / 'specs.pkl'
+    write_task_specs(specs_path, config_path, tasks)
+
+    # Function from config file.
+    spec = read_task_spec(specs_path, 'k1')
+    assert spec.func_module == 'config'
+    assert spec.run()
+    assert (tmp_path / 'out' / 'a2').read_text() == '15'
+    # Function from a module.
+    assert read_task_spec(specs_path, 'k2').run()
+    assert (tmp_path / 'ab').read_text() == '3-4'
+
+    with pytest.raises(CosmicError):
+        read_task_spec(specs_path, 'k3')
+
+
+def test_task_spec_freshness(tmp_path):
+    (tmp_path / 'a').write_text('a')
+    (tmp_path / 'b').write_text('b')
+    spec = TaskSpec('k1', tmp_path / 'config.py', concat.__module__, concat.__qualname__,
+                    [tmp_path / 'a', tmp_path / 'b'], {'out': tmp_path / 'ab'}, ('', ))
+    assert not spec.is_up_to_date()
+    now = time.time()
+    assert spec.run(since=now)
+    _set_mtime(tmp_path / 'ab', now + 10)
+    assert spec.is_up_to_date(now)
+    # Outputs produced since: not run.
+    assert not spec.run(since=now)
+    # Input newer than output.
+    _set_mtime(tmp_path / 'b', now + 20)
+    assert not spec.is_up_to_date(now)
+    # No since: always run.
+    _set_mtime(tmp_path / 'b', now)
+    assert spec.run()
+
+    (tmp_path / 'a').unlink()
+    with pytest.raises(CosmicError):
+        spec.run()
@@ -0,0 +1,94 @@
+import datetime as dt
+import json
+import os
+import time
+
+import pytest
+
+from cosmic.processing.task_status_service import (TaskStatusIndex, TaskStatusService, parse_status_file,
+                                                   format_summary, main)
+
+NOW = dt.datetime(2020, 6, 1, 12, 0, 0)
+
+
+def _write_status(status_dir, key, *statuses):
+    """statuses: (minutes before NOW, status)."""
+    lines = [f'{NOW - dt.timedelta(minutes=minutes)};{status}\n' for minutes, status in statuses]
+    (status_dir / f'{key}.status').write_text(''.join(lines))
+
+
+def _gen_status_dir(tmp_path):
+    status_dir = tmp_path / 'task_status'
+    status_dir.mkdir()
+    # Three tasks completed in the last 5 minutes, one running, one error.
+    _write_status(status_dir, 'k1', (9, 'PENDING'), (8, 'RUNNING'), (5, 'COMPLETE'))
+    _write_status(status_dir, 'k2', (8, 'RUNNING'), (3, 'COMPLETE'))
+    _write_status(status_dir, 'k3', (4, 'RUNNING'), (2, 'COMPLETE'))
+    _write_status(status_dir, 'k4', (2, 'RUNNING'))
+    _write_status(status_dir, 'k5', (3, 'RUNNING'), (1, 'ERROR'))
+    return status_dir
+
+
+def test_parse_status_file(tmp_path):
+    status_dir = _gen_status_dir(tmp_path)
+    status, start, end = parse_status_file(status_dir / 'k1.status')
+    assert status == 'COMPLETE'
+    assert end - start == 180
+    assert parse_status_file(status_dir / 'k4.status')[0] == 'RUNNING'
+    (status_dir / 'k6.done').touch()
+    assert parse_status_file(status_dir / 'k6.done')[0] == 'COMPLETE'
+
+
+def test_task_status_index_summary(tmp_path):
+    status_dir = _gen_status_dir(tmp_path)
+    index = TaskStatusIndex(task_funcs={'k1': 'mod.convert', 'k2': 'mod.convert', 'k3': 'mod.plot'},
+                            total_tasks=10)
+    index.scan(status_dir)
+    summary = index.summary(now=NOW.timestamp(), window=600)
+    assert summary['counts'] == {'COMPLETE': 3, 'RUNNING': 1, 'ERROR': 1}
+    # 3 tasks since first completion 5 mins ago.
+    assert summary['tasks_per_minute'] == pytest.approx(3 / 5)
+    assert summary['mean_runtimes'] == {'mod.convert': 240, 'mod.plot': 120}
+    # 7 tasks left.
+    assert summary['eta'] == pytest.approx(7 / (3 / 5) * 60)
+    assert 'Complete: 3/10' in format_summary(summary)
+
+
+def test_task_status_index_incremental_scan(tmp_path):
+    status_dir = _gen_status_dir(tmp_path)
+    index = TaskStatusIndex()
+    index.scan(status_dir)
+    mtime = (status_dir / 'k4.status').stat().st_mtime
+    _write_status(status_dir, 'k4', (2, 'RUNNING'), (0, 'COMPLETE'))
+    (status_dir / 'k5.status').unlink()
+    os.utime(status_dir / 'k4.status', (mtime + 1, mtime + 1))
+    # Unchanged mtime: not re-read.
+    k1_mtime = (status_dir / 'k1.status').stat().st_mtime
+    _write_status(status_dir, 'k1', (8, 'RUNNING'), (5, 'ERROR'))
+    os.utime(status_dir / 'k1.status', (k1_mtime, k1_mtime))
+    index.scan(status_dir)
+    assert index.summary(now=NOW.timestamp())['counts'] == {'COMPLETE': 4}
+
+
+def test_task_status_service_watchdog(tmp_path):
+    pytest.importorskip('watchdog')
+    status_dir = _gen_status_dir(tmp_path)
+    index = TaskStatusIndex()
+    service = TaskStatusService(status_dir, index, polling=True)
+    service.start()
+    try:
+        _write_status(status_dir, 'k6', (1, 'RUNNING'))
+        for _ in range(50):
+            if 'k6' in index.tasks:
+                break
+            time.sleep(0.1)
+        assert index.tasks['k6'][0] == 'RUNNING'
+    finally:
+        service.stop()
+
+
+def test_main_json(tmp_path, capsys):
+    status_dir = _gen_status_dir(tmp_path)
+    summary = main([str(status_dir), '--json', '--total', '5',
+                    '--resource-history', str(tmp_path / 'history.jsonl')])
+    assert json.loads(capsys.readouterr().out)['counts'] == summary['counts']
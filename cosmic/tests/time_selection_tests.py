@@ -0,0 +1,46 @@
+import cf_units
+import iris.coords
+import iris.cube
+import numpy as np
+import pytest
+
+from cosmic.time_selection import TimeIndex, select_time
+
+
+def _time_coord(points, units, calendar):
+    return iris.coords.DimCoord(points, standard_name='time', units=cf_units.Unit(units, calendar=calendar))
+
+
+@pytest.mark.parametrize('calendar', ['gregorian', 'proleptic_gregorian', '360_day', '365_day', 'all_leap',
+                                      'julian'])
+@pytest.mark.parametrize('units, step', [('hours since 1970-01-01 00:00:00', 0.5),
+                                         ('days since 1850-01-01', 1 / 24),
+                                         ('minutes since 1998-01-01 00:00', 30)])
+def test_matches_cftime(calendar, units, step):
+    rng = np.random.default_rng(0)
+    # Several years of times, including before the origin.
+    max_steps = int(5 * 365 * 24 / (step * {'hours': 1, 'days': 24, 'minutes': 1 / 60}[units.split()[0]]))
+    points = np.unique(rng.integers(-max_steps // 5, max_steps, 2000)) * step
+    time_coord = _time_coord(points, units, calendar)
+    time_index = TimeIndex(time_coord)
+
+    dates = time_coord.units.num2date(points)
+    for attr in ['year', 'month', 'day', 'hour']:
+        np.testing.assert_array_equal(getattr(time_index, attr), [getattr(d, attr) for d in dates])
+
+    jja_index = time_index.select(season='jja')
+    np.testing.assert_array_equal(jja_index, [i for i, d in enumerate(dates) if 6 <= d.month <= 8])
+    djf_00_index = time_index.select(season='DJF', hours=[0, 12])
+    np.testing.assert_array_equal(djf_00_index, [i for i, d in enumerate(dates)
+                                                 if d.month in [12, 1, 2] and d.hour in [0, 12]])
+
+
+def test_select_time():
+    time_coord = _time_coord(np.arange(360 * 24) + 0.5, 'hours since 2005-01-01', '360_day')
+    cube = iris.cube.Cube(np.arange(360 * 24), long_name='precip', dim_coords_and_dims=[(time_coord, 0)])
+    cube_jja = select_time(cube, season='JJA')
+    assert cube_jja.shape == (90 * 24, )
+    assert cube_jja.data[0] == 150 * 24
+    cube_jul_06 = select_time(cube, months=[7], hours=[6])
+    assert cube_jul_06.shape == (30, )
+    assert select_time(cube, months=[13]) is None
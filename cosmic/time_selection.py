@@ -0,0 +1,149 @@
+"""Vectorised, calendar-aware selection of times by season, month or hour of day.
+
+A time coord is converted to year, month, day and hour arrays once, using numpy arithmetic rather than
+creating a datetime/cftime object for each point. Supports the gregorian calendars (via datetime64) and the
+fixed-length-year calendars used by climate models: 360_day (e.g. HadGEM3), 365_day/noleap and 366_day/all_leap.
+Other calendars fall back to cftime.
+
+example usage:
+    cube_jja = select_time(cube, season='JJA')
+    time_index = TimeIndex(cube.coord('time'))
+    cube_jja_00utc = cube[time_index.select(season='JJA', hours=[0])]
+"""
+import os
+import sys
+import logging
+
+import numpy as np
+
+from cosmic.cosmic_errors import CosmicError
+
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
+SEASONS = {
+    'DJF': (12, 1, 2),
+    'MAM': (3, 4, 5),
+    'JJA': (6, 7, 8),
+    'SON': (9, 10, 11),
+}
+
+SECONDS_PER_STEP = {
+    'day': 86400, 'days': 86400, 'd': 86400,
+    'hour': 3600, 'hours': 3600, 'hr': 3600, 'h': 3600,
+    'minute': 60, 'minutes': 60, 'min': 60,
+    'second': 1, 'seconds': 1, 'sec': 1, 's': 1,
+}
+
+GREGORIAN_CALENDARS = ['standard', 'gregorian', 'proleptic_gregorian']
+_MONTH_LENGTHS = {
+    '360_day': [30] * 12,
+    '365_day': [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    'noleap': [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    '366_day': [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+    'all_leap': [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31],
+}
+
+
+def _seconds_since_origin(points, units):
+    step = units.origin.split()[0].lower()
+    if step not in SECONDS_PER_STEP:
+        raise CosmicError(f'Unknown time units: {units}')
+    # Round to the nearest second to remove floating point error, e.g. 0.9999999 hours.
+    return np.round(np.asarray(points, dtype=np.float64) * SECONDS_PER_STEP[step]).astype(np.int64)
+
+
+class TimeIndex:
+    """Year, month, day and hour arrays for each point of a time coord.
+
+    :param time_coord: iris time coord (or anything with points and cf_units units)
+    """
+
+    def __init__(self, time_coord):
+        units = time_coord.units
+        calendar = units.calendar or 'standard'
+        points = time_coord.points
+        if calendar in GREGORIAN_CALENDARS:
+            self._from_datetime64(points, units)
+        elif calendar in _MONTH_LENGTHS:
+            self._from_fixed_year(points, units, _MONTH_LENGTHS[calendar])
+        else:
+            logger.debug(f'no vectorised conversion for calendar {calendar}: using cftime')
+            dates = units.num2date(points)
+            self.year = np.array([d.year for d in dates])
+            self.month = np.array([d.month for d in dates])
+            self.day = np.array([d.day for d in dates])
+            self.hour = np.array([d.hour for d in dates])
+
+    @classmethod
+    def from_cube(cls, cube):
+        return cls(cube.coord('time'))
+
+    def _from_datetime64(self, points, units):
+        origin = units.num2date(0)
+        origin = np.datetime64(f'{origin.year:04}-{origin.month:02}-{origin.day:02}T'
+                               f'{origin.hour:02}:{origin.minute:02}:{origin.second:02}', 's')
+        dates = origin + _seconds_since_origin(points, units).astype('timedelta64[s]')
+        months = dates.astype('datetime64[M]').astype(np.int64)
+        self.year = months // 12 + 1970
+        self.month = months % 12 + 1
+        self.day = (dates.astype('datetime64[D]') - dates.astype('datetime64[M]')).astype(np.int64) + 1
+        self.hour = (dates - dates.astype('datetime64[D]')).astype(np.int64) // 3600
+
+    def _from_fixed_year(self, points, units, month_lengths):
+        origin = units.num2date(0)
+        days_per_year = sum(month_lengths)
+        month_starts = np.cumsum([0] + month_lengths)
+        origin_seconds = ((origin.year * days_per_year + month_starts[origin.month - 1] + origin.day - 1) * 86400
+                          + origin.hour * 3600 + origin.minute * 60 + origin.second)
+        seconds = origin_seconds + _seconds_since_origin(points, units)
+        days, seconds_of_day = np.divmod(seconds, 86400)
+        self.year, day_of_year = np.divmod(days, days_per_year)
+        month_index = np.searchsorted(month_starts, day_of_year, side='right') - 1
+        self.month = month_index + 1
+        self.day = day_of_year - month_starts[month_index] + 1
+        self.hour = seconds_of_day // 3600
+
+    def select(self, season=None, months=None, hours=None):
+        """Indices of all times that match all of season, months and hours.
+
+        :param season: one of SEASONS (e.g. 'JJA', case insensitive)
+        :param months: months to select, e.g. [6, 7, 8]
+        :param hours: hours of day to select, e.g. [0, 12]
+        :return: index array
+        """
+        keep = np.ones(len(self.month), dtype=bool)
+        if season is not None:
+            if season.upper() not in SEASONS:
+                raise CosmicError(f'Unknown season: {season}, must be one of {list(SEASONS)}')
+            keep &= np.isin(self.month, SEASONS[season.upper()])
+        if months is not None:
+            keep &= np.isin(self.month, months)
+        if hours is not None:
+            keep &= np.isin(self.hour, hours)
+        return np.where(keep)[0]
+
+    def season_index(self, season):
+        return self.select(season=season)
+
+    def month_index(self, months):
+        return self.select(months=months)
+
+    def hour_index(self, hours):
+        return self.select(hours=hours)
+
+
+def select_time(cube, season=None, months=None, hours=None):
+    """Subset cube to times matching season, months and hours (see TimeIndex.select).
+
+    :return: subset cube, or None if no times match
+    """
+    time_coord = cube.coord('time')
+    time_dim = cube.coord_dims(time_coord)[0]
+    index = TimeIndex(time_coord).select(season, months, hours)
+    if not len(index):
+        return None
+    keys = [slice(None)] * cube.ndim
+    keys[time_dim] = index
+    return cube[tuple(keys)]
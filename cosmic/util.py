@@ -9,10 +9,13 @@ import itertools
 from timeit import default_timer as timer
 
 import iris
+import iris.analysis
 import iris.coords
+import iris.cube
 import matplotlib as mpl
 import numpy as np
-from scipy import stats
+from scipy import sparse, stats
+from scipy.spatial import cKDTree
 
 from cosmic.cosmic_errors import CosmicError
 
@@ -206,7 +209,8 @@ def predominant_pixel_2d(arr: np.ndarray, grain_size: List[int],
     for i, j in itertools.product(range(num0), range(num1)):
         arr_slice = (slice(offset0 + i * grain_size[0], offset0 + (i + 1) * grain_size[0]),
                      slice(offset1 + j * grain_size[1], offset1 + (j + 1) * grain_size[1]))
-        out_arr[i, j] = stats.mode(arr[arr_slice], axis=None).mode[0]
+        # N.B. mode is an array in scipy < 1.11, and a scalar after.
+        out_arr[i, j] = np.atleast_1d(stats.mode(arr[arr_slice], axis=None).mode)[0]
     return out_arr
 
 
@@ -276,6 +280,14 @@ def calc_uniform_lat_lon_grad(cube: iris.cube.Cube) -> iris.cube.CubeList:
     return iris.cube.CubeList(ret_cubes)
 
 
+def grid_fingerprint(lat, lon):
+    """Unique key for a lat/lon grid, based on the hash of its coords."""
+    sha1hash = sha1()
+    sha1hash.update(np.asarray(lat, dtype=np.float64).tobytes())
+    sha1hash.update(np.asarray(lon, dtype=np.float64).tobytes())
+    return sha1hash.hexdigest()
+
+
 class CalcLatLonDistanceMask:
     """Class to allow quick calculation of closeness on lat/lon grid.
 
@@ -372,6 +384,97 @@ class CalcLatLonDistanceMask:
         return close_to_mask
 
 
+class CressmanGridder:
+    """Cressman gridding operator for scattered (e.g. gauge) data.
+
+    Reproduces MetPy's interpolate_to_grid(..., interp_type='cressman'): the grid spans the bounding box of
+    the points with spacing hres, and each grid point is the Cressman weighted mean of all points within
+    search_radius, with weights (r**2 - d**2) / (r**2 + d**2). Grid points with fewer than
+    minimum_neighbors points are NaN.
+
+    The weights depend only on the point positions, grid and search radius, so they are calculated once
+    using a KD-tree and stored as a sparse matrix. Gridding any number of fields (e.g. each day of a
+    record) is then a sparse matmul. Missing (NaN) values are left out of the weighted mean for that field.
+    Also, caches the weights to a file for quicker subsequent use."""
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, hres: float, search_radius: float,
+                 minimum_neighbors: int = 1, cache_key: str = None):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.hres = hres
+        self.search_radius = search_radius
+        self.minimum_neighbors = minimum_neighbors
+        # As metpy.interpolate.generate_grid, for boundary from get_boundary_coords.
+        nx = int(np.ceil((x.max() - x.min()) / hres)) + 1
+        ny = int(np.ceil((y.max() - y.min()) / hres)) + 1
+        self.gx, self.gy = np.meshgrid(np.linspace(x.min(), x.max(), nx), np.linspace(y.min(), y.max(), ny))
+
+        if not cache_key:
+            # Calculate a unique cache key based on the hash of all the arguments.
+            sha1hash = sha1()
+            sha1hash.update(x.tobytes())
+            sha1hash.update(y.tobytes())
+            sha1hash.update(np.array([hres, search_radius, minimum_neighbors], dtype=float).tobytes())
+            cache_key = Path(f'.cache_cressman.{sha1hash.hexdigest()}.npz')
+        else:
+            cache_key = Path(cache_key)
+
+        if cache_key.exists():
+            print(f'loading cressman weights from file {cache_key}')
+            cache = np.load(cache_key)
+            weights, indices, indptr = cache['weights'], cache['indices'], cache['indptr']
+            shape = tuple(cache['shape'])
+            self.weights = sparse.csr_matrix((weights, indices, indptr), shape=shape)
+            self.neighbors = sparse.csr_matrix((np.ones_like(weights), indices, indptr), shape=shape)
+        else:
+            print(f'generating cressman weights and saving to {cache_key}')
+            self.weights, self.neighbors = CressmanGridder.gen_weights(x, y, self.gx, self.gy, search_radius)
+            np.savez(cache_key, weights=self.weights.data, indices=self.weights.indices,
+                     indptr=self.weights.indptr, shape=np.array(self.weights.shape))
+
+    @staticmethod
+    def gen_weights(x, y, gx, gy, search_radius):
+        """Sparse (num grid points x num points) matrices of Cressman weights and of neighbours.
+
+        N.B. points exactly search_radius away are neighbours with a weight of zero, as in MetPy."""
+        tree = cKDTree(np.column_stack([x, y]))
+        grid_points = np.column_stack([gx.ravel(), gy.ravel()])
+        matches = tree.query_ball_point(grid_points, r=search_radius)
+
+        indptr = np.zeros(len(grid_points) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(m) for m in matches])
+        indices = np.concatenate([np.sort(m) for m in matches] + [np.array([], dtype=int)]).astype(np.int64)
+        rows = np.repeat(np.arange(len(grid_points)), np.diff(indptr))
+        sq_dist = (x[indices] - grid_points[rows, 0])**2 + (y[indices] - grid_points[rows, 1])**2
+        r_sq = search_radius**2
+        weights = (r_sq - sq_dist) / (r_sq + sq_dist)
+
+        shape = (len(grid_points), len(x))
+        return (sparse.csr_matrix((weights, indices, indptr), shape=shape),
+                sparse.csr_matrix((np.ones_like(weights), indices, indptr), shape=shape))
+
+    def grid(self, z: np.ndarray) -> np.ndarray:
+        """Grid values at the points.
+
+        :param z: values, shape (num points,) or (num points, num fields) - e.g. one column per day
+        :return: gridded values, shape gx.shape or (num fields,) + gx.shape
+        """
+        z = np.asarray(z, dtype=float)
+        valid = ~np.isnan(z)
+        z_filled = np.where(valid, z, 0)
+
+        total_weights = self.weights @ valid
+        num_neighbors = self.neighbors @ valid
+        with np.errstate(invalid='ignore', divide='ignore'):
+            griddata = (self.weights @ z_filled) / total_weights
+        griddata[num_neighbors < self.minimum_neighbors] = np.nan
+
+        if z.ndim == 1:
+            return griddata.reshape(self.gx.shape)
+        else:
+            return griddata.T.reshape((z.shape[1],) + self.gx.shape)
+
+
 def calc_latlon_distance(lat1, lat2, lon1, lon2):
     """Accurate lat lon distance in km.
 
@@ -2,7 +2,8 @@ import iris
 
 from remake import Task, TaskControl, remake_task_control
 
-from cosmic.config import PATHS, CONSTRAINT_ASIA
+from cosmic.config import PATHS
+from cosmic.regions import load_region, load_region_cube
 
 BSUB_KWARGS = {
     'queue': 'short-serial',
@@ -11,15 +12,14 @@ BSUB_KWARGS = {
 
 
 def extract_asia(inputs, outputs):
-    asia_cubes = iris.load([str(i) for i in inputs], constraints=CONSTRAINT_ASIA)
+    asia_cubes = load_region(inputs, 'asia')
     iris.save(asia_cubes, str(outputs[0]))
 
 
 def regrid_extract_asia(inputs, outputs):
-    constraints = iris.Constraint(name='surface_altitude') & CONSTRAINT_ASIA
-    target_cube = iris.load_cube(str(inputs[0]), constraint=constraints)
+    target_cube = load_region_cube(inputs[0], 'asia', iris.Constraint(name='surface_altitude'))
 
-    asia_cubes = iris.load([str(i) for i in inputs[1:]], constraints=CONSTRAINT_ASIA)
+    asia_cubes = load_region(inputs[1:], 'asia')
 
     u_cubes = asia_cubes.extract('x_wind')
     v_cubes = asia_cubes.extract('y_wind')
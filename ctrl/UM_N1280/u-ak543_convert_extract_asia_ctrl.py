@@ -0,0 +1,40 @@
+from pathlib import Path
+
+RUNID = 'u-ak543'
+STREAM = 'ap9'
+
+SCRIPT_PATH = '/gws/nopw/j04/cosmic/mmuetz/projects/cosmic/cosmic/processing/convert_pp_to_region_nc.py'
+BASE_PATH = Path(f'/gws/nopw/j04/cosmic/mmuetz/data/{RUNID}/{STREAM}.pp')
+
+# One job per month: replaces u-ak543_convert_ctrl.py (one job per pp file) and u-ak543_extract_asia_ctrl.py.
+paths = sorted(BASE_PATH.glob('precip_??????'))
+CONFIG_KEYS = [p.stem for p in paths]
+
+# pp files converted at once: one core each.
+NUM_PROCS = 4
+BSUB_KWARGS = {
+    'job_name': 'conv_asia',
+    'queue': 'par-single',
+    'max_runtime': '04:00',
+    'mem': 64000,
+    'ncores': NUM_PROCS,
+}
+
+IRIS_CUBE_ATTRS = {
+    'grid': 'N1280',
+    'institution': 'Met Office Hadley Centre, Fitzroy Road, Exeter, Devon, EX1 3PB, UK',
+    'institution_id': 'MOHC',
+    'source_type': 'AGCM',
+    'model': 'u-ak543',
+    'experiment_details': 'explicit convection',
+}
+
+REGIONS = ['asia']
+STRATIFORM = True
+# Set to also write global netCDF files for each pp file.
+KEEP_GLOBAL_NC = False
+DELETE_PP = True
+
+SCRIPT_ARGS = {}
+for k, path in zip(CONFIG_KEYS, paths):
+    SCRIPT_ARGS[k] = path
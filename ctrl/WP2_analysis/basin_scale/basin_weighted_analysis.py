@@ -16,7 +16,8 @@ from cosmic.fourier_series import FourierSeries
 from remake import Task, TaskControl, remake_task_control
 from remake.util import tmp_to_actual_path
 
-from cosmic.config import PATHS, CONSTRAINT_ASIA
+from cosmic.config import PATHS
+from cosmic.regions import load_region_cube
 
 from basin_weighted_config import (SLIDING_SCALES, SCALES, DATASETS, PRECIP_MODES, HB_NAMES, HADGEM_FILENAMES,
                                    DATASET_RESOLUTION)
@@ -50,7 +51,7 @@ def gen_hydrobasins_raster_cubes(inputs, outputs, scales=SCALES):
 
 def gen_weights_cube(inputs, outputs):
     dataset, hb_name = inputs.keys()
-    cube = iris.load_cube(str(inputs[dataset]), constraint=CONSTRAINT_ASIA)
+    cube = load_region_cube(inputs[dataset], 'asia')
     hb = gpd.read_file(str(inputs[hb_name]))
     weights_cube = build_weights_cube_from_cube(hb.geometry, cube, f'weights_{hb_name}')
     # Cubes are very sparse. You can get a 800x improvement in file size using zlib!
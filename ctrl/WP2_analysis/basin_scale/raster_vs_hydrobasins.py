@@ -12,7 +12,8 @@ from basmati.hydrosheds import load_hydrobasins_geodataframe
 from remake import Task, TaskControl, remake_task_control
 from cosmic import util
 # from cosmic.task import Task, TaskControl
-from cosmic.config import PATHS, CONSTRAINT_ASIA
+from cosmic.config import PATHS
+from cosmic.regions import extract_region
 
 FILENAME_TPL = str(PATHS['datadir']) + '/PRIMAVERA_HighResMIP_MOHC/{model}/' \
                'highresSST-present/r1i1p1f1/E1hr/pr/gn/{timestamp}/' \
@@ -38,10 +39,10 @@ def gen_raster_cube(inputs, outputs, hb_name, method):
     if method == 'global':
         # Build global raster, then extract Asia.
         raster_cube = basmati.utils.build_raster_cube_from_cube(hb.geometry, cube, hb_name)
-        raster_cube_asia = raster_cube.extract(CONSTRAINT_ASIA)
+        raster_cube_asia = extract_region(raster_cube, 'asia')
     elif method == 'local':
         # extract asia from cube, then build local raster (uses affine_tx under the hood).
-        cube_asia = cube.extract(CONSTRAINT_ASIA)
+        cube_asia = extract_region(cube, 'asia')
         raster_cube_asia = basmati.utils.build_raster_cube_from_cube(hb.geometry, cube_asia, hb_name)
     iris.save(raster_cube_asia, str(outputs[0]))
 
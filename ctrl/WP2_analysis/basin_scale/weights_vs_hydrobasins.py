@@ -10,7 +10,8 @@ import geopandas as gpd
 import basmati.utils
 from remake import Task, TaskControl, remake_task_control
 import cosmic.util as util
-from cosmic.config import PATHS, CONSTRAINT_ASIA
+from cosmic.config import PATHS
+from cosmic.regions import load_region_cube
 
 FILENAME_TPL = 'PRIMAVERA_HighResMIP_MOHC/{model}/' \
                'highresSST-present/r1i1p1f1/E1hr/pr/gn/{timestamp}/' \
@@ -36,7 +37,7 @@ FILENAMES['u-ak543'] = PATHS['datadir'] / 'u-ak543/ap9.pp/precip_200601/ak543a.p
 HB_NAMES = ['large', 'medium', 'small']
 
 def gen_weights_cube(inputs, outputs, hb_name):
-    cube = iris.load_cube(str(inputs['model']), constraint=CONSTRAINT_ASIA)
+    cube = load_region_cube(inputs['model'], 'asia')
     hb = gpd.read_file(str(inputs['hb_name_shp']))
     weights_cube = basmati.utils.build_weights_cube_from_cube(hb.geometry, cube, f'weights_{hb_name}')
     # Cubes are very sparse. You can get a 800x improvement in file size using zlib!
@@ -9,15 +9,16 @@ import pandas as pd
 
 from remake import Task, TaskControl, remake_task_control
 from cosmic import util
-from cosmic.config import CONSTRAINT_ASIA, PATHS
+from cosmic.config import PATHS
+from cosmic.regions import extract_region, load_region_cube
 from orog_precip_paths import (land_sea_mask, extended_rclim_mask, precip_path_tpl,
                                diag_orog_precip_path_tpl, diag_orog_precip_frac_path_tpl,
                                diag_combine_frac_path, fmtp)
 
 
 def calc_orog_precip(inputs, outputs, index_month):
-    extended_rclim_mask = iris.load_cube(str(inputs['extended_rclim_mask']), CONSTRAINT_ASIA)
-    lsm_asia = iris.load_cube(str(inputs['land_sea_mask']), CONSTRAINT_ASIA)
+    extended_rclim_mask = load_region_cube(inputs['extended_rclim_mask'], 'asia')
+    lsm_asia = load_region_cube(inputs['land_sea_mask'], 'asia')
     precip_asia = iris.load_cube(str(inputs['precip']))
     precip_asia_mean = precip_asia.collapsed('time', iris.analysis.MEAN)
     # Need to regrid to mask resolution.
@@ -53,8 +54,8 @@ def calc_orog_precip_fracs(inputs, outputs, index_month):
 
     lsm_coarse = util.regrid(lsm, orog_mask)
 
-    orog_mask_asia = orog_mask.extract(CONSTRAINT_ASIA)
-    lsm_coarse_asia = lsm_coarse.extract(CONSTRAINT_ASIA)
+    orog_mask_asia = extract_region(orog_mask, 'asia')
+    lsm_coarse_asia = extract_region(lsm_coarse, 'asia')
 
     orog_precip = orog_precip_cubes.extract_strict('orog_precipitation_flux')
     non_orog_precip = orog_precip_cubes.extract_strict('non_orog_precipitation_flux')
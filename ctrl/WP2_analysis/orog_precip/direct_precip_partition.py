@@ -6,7 +6,7 @@ import pandas as pd
 
 from remake import Task, TaskControl, remake_task_control
 from cosmic import util
-from cosmic.config import CONSTRAINT_ASIA
+from cosmic.regions import extract_region, load_region_cube
 from orog_precip_paths import (orog_path, land_sea_mask, cache_key_tpl, surf_wind_path_tpl,
                                orog_mask_path_tpl, precip_path_tpl, orog_precip_path_tpl,
                                orog_precip_frac_path_tpl, combine_frac_path,
@@ -15,7 +15,7 @@ from orog_precip_paths import (orog_path, land_sea_mask, cache_key_tpl, surf_win
 
 def gen_dist_cache(inputs, outputs, dist_thresh):
     orog = iris.load_cube(str(inputs['orog']), 'surface_altitude')
-    orog_asia = orog.extract(CONSTRAINT_ASIA)
+    orog_asia = extract_region(orog, 'asia')
     lat_asia = orog_asia.coord('latitude').points
     lon_asia = orog_asia.coord('longitude').points
     Lon_asia, Lat_asia = np.meshgrid(lon_asia, lat_asia)
@@ -25,9 +25,9 @@ def gen_dist_cache(inputs, outputs, dist_thresh):
 
 def gen_orog_mask(inputs, outputs, dotprod_val_thresh, dist_thresh):
     orog = iris.load_cube(str(inputs['orog']), 'surface_altitude')
-    orog_asia = orog.extract(CONSTRAINT_ASIA)
+    orog_asia = extract_region(orog, 'asia')
     grad_orog = util.calc_uniform_lat_lon_grad(orog)
-    grad_orog_asia = grad_orog.extract(CONSTRAINT_ASIA)
+    grad_orog_asia = iris.cube.CubeList([extract_region(c, 'asia') for c in grad_orog])
 
     cache_key = inputs['cache_key']
 
@@ -71,7 +71,7 @@ def gen_orog_mask(inputs, outputs, dotprod_val_thresh, dist_thresh):
 
 
 def calc_orog_precip(inputs, outputs):
-    lsm_asia = iris.load_cube(str(inputs['land_sea_mask']), CONSTRAINT_ASIA)
+    lsm_asia = load_region_cube(inputs['land_sea_mask'], 'asia')
     mask_asia = iris.load_cube(str(inputs['orog_mask']), f'expanded surf_wind x del orog > thresh')
     precip_asia = iris.load_cube(str(inputs['precip']))
     assert mask_asia.shape == precip_asia.shape
@@ -94,7 +94,7 @@ def calc_orog_precip(inputs, outputs):
 
 def calc_orog_precip_fracs(inputs, outputs):
     # TODO: area weighting.
-    lsm_asia = iris.load_cube(str(inputs['land_sea_mask']), CONSTRAINT_ASIA)
+    lsm_asia = load_region_cube(inputs['land_sea_mask'], 'asia')
 
     mask_asia = iris.load_cube(str(inputs['orog_mask']), f'expanded surf_wind x del orog > thresh')
     orog_precip_asia_cubes = iris.load(str(inputs['orog_precip']))
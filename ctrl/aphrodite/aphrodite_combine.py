@@ -1,51 +1,100 @@
-import datetime as dt
+import os
+import sys
+import logging
 
 import iris
 from iris.experimental import equalise_cubes
+import netCDF4
 import numpy as np
 
 from remake import TaskControl, Task, remake_task_control
 
-from cosmic.config import PATHS, CONSTRAINT_ASIA
+from cosmic.config import PATHS
+from cosmic.regions import load_region_cube
+from cosmic.time_selection import TimeIndex
 from cosmic.datasets.aphrodite import ALL_YEARS, FILE_TPL
 
+logging.basicConfig(stream=sys.stdout, level=os.getenv('COSMIC_LOGLEVEL', 'INFO'),
+                    format='%(asctime)s %(levelname)8s: %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _append_along_time(ds, var_name, cube):
+    """Append cube's data and time points to var_name in an open netCDF4 dataset along unlimited time."""
+    time_var = ds.variables['time']
+    start = len(time_var)
+    end = start + cube.shape[0]
+    time_var[start:end] = cube.coord('time').points
+    if cube.coord('time').has_bounds():
+        ds.variables[time_var.bounds][start:end] = cube.coord('time').bounds
+    ds.variables[var_name][start:end] = cube.data
+
 
 def combine_years(inputs, outputs):
+    """Combine all years into one file (outputs[0]), and JJA and its mean into another (outputs[1]).
+
+    Streams over the years: each year is loaded, rebased to the first year's time units, and appended to
+    the outputs along an unlimited time dimension, so that only one year is in memory at a time. The JJA
+    mean is accumulated in the same pass and written at the end.
+    """
     constraint_name = iris.Constraint(name=' daily precipitation analysis interpolated onto 0.25deg grids')
-    cubes = []
+    # N.B. lazy: only loads metadata.
+    cubes = iris.cube.CubeList([load_region_cube(inputpath, 'asia', constraint_name)
+                                for inputpath in inputs])
+    equalise_cubes.equalise_attributes(cubes)
+
     # Each cube has its own time coords starting with that cube's year,
     # e.g.units = Unit('minutes since 1998-01-01 00:00', calendar='gregorian')
     # Normalize them to all use the first one.
-    for year, inputpath in zip(ALL_YEARS, inputs):
-        cube = iris.load_cube(str(inputpath), constraint=(CONSTRAINT_ASIA & constraint_name))
-        if year == ALL_YEARS[0]:
-            start_year = dt.datetime(year, 1, 1)
-            time_coord = cube.coord('time')
+    time_units = cubes[0].coord('time').units
+    jja_sum = None
+    for year, cube in zip(ALL_YEARS, cubes):
+        logger.info(f'combining {year}')
+        cube_time_coord = cube.coord('time')
+        assert cube_time_coord.units.origin.split()[0] == time_units.origin.split()[0]
+        offset = time_units.date2num(cube_time_coord.units.num2date(0))
+        cube_time_coord.points = cube_time_coord.points + offset
+        cube_time_coord.units = time_units
+
+        # Convert from mm to mm hr-1.
+        # N.B. orig units are mm, but this is really mm day-1 as each timeslice is one day.
+        assert cube.units == 'mm'
+        cube.units = 'mm hr-1'
+        cube.data /= 24
+        cube.var_name = 'precip'
+
+        cube_jja = cube[TimeIndex(cube_time_coord).select(season='JJA')]
+        year_jja_sum = np.ma.filled(cube_jja.data.sum(axis=0, dtype=np.float64), 0)
+        year_jja_count = np.ma.count(cube_jja.data, axis=0)
+
+        if jja_sum is None:
+            jja_sum, jja_count = year_jja_sum, year_jja_count
+            jja_time_bounds = [cube_jja.coord('time').points[0], cube_jja.coord('time').points[-1]]
+            # Placeholder: its data and time coord are overwritten with the mean over all years at the end.
+            precip_flux_mean = cube_jja.collapsed('time', iris.analysis.MEAN)
+            precip_flux_mean.rename('precip_flux_mean')
+            precip_flux_mean.var_name = 'precip_flux_mean'
+            iris.save(cube, str(outputs[0]), unlimited_dimensions=['time'])
+            iris.save(iris.cube.CubeList([cube_jja, precip_flux_mean]), str(outputs[1]),
+                      unlimited_dimensions=['time'])
         else:
-            curr_year = dt.datetime(year, 1, 1)
-            diff_in_minutes = (curr_year - start_year).total_seconds() / 60
-            cube.coord('time').units = time_coord.units
-            cube.coord('time').points = np.array([p + diff_in_minutes for p in cube.coord('time').points])
-        cubes.append(cube)
+            jja_sum += year_jja_sum
+            jja_count += year_jja_count
+            jja_time_bounds[1] = cube_jja.coord('time').points[-1]
+            with netCDF4.Dataset(str(outputs[0]), 'a') as ds:
+                _append_along_time(ds, 'precip', cube)
+            with netCDF4.Dataset(str(outputs[1]), 'a') as ds:
+                _append_along_time(ds, 'precip', cube_jja)
 
-    cubes = iris.cube.CubeList(cubes)
-    equalise_cubes.equalise_attributes(cubes)
-    cube = cubes.concatenate_cube()
-
-    dates = [start_year + dt.timedelta(minutes=p) for p in cube.coord('time').points]
-    jja = [d.month in [6, 7, 8] for d in dates]
-
-    # Convert from mm to mm hr-1.
-    # N.B. orig units are mm, but this is really mm day-1 as each timeslice is one day.
-    assert cube.units == 'mm'
-    cube.units = 'mm hr-1'
-    cube.data /= 24
-    iris.save(cube, str(outputs[0]))
-    cube_jja = cube[jja]
-    precip_flux_mean = cube_jja.collapsed('time', iris.analysis.MEAN)
-    precip_flux_mean.rename('precip_flux_mean')
-
-    iris.save(iris.cube.CubeList([cube_jja, precip_flux_mean]), str(outputs[1]))
+    with netCDF4.Dataset(str(outputs[1]), 'a') as ds:
+        mean_var = ds.variables['precip_flux_mean']
+        mean_var[:] = np.ma.masked_array(jja_sum, jja_count == 0) / np.maximum(jja_count, 1)
+        # Scalar time coord of mean: point is mid-point of the bounds, as for iris.analysis.MEAN.
+        for coord_name in getattr(mean_var, 'coordinates', '').split():
+            coord_var = ds.variables[coord_name]
+            if getattr(coord_var, 'standard_name', None) == 'time':
+                coord_var[:] = np.mean(jja_time_bounds)
+                ds.variables[coord_var.bounds][:] = jja_time_bounds
 
 
 @remake_task_control
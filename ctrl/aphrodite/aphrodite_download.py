@@ -5,13 +5,13 @@ import pickle
 from remake import TaskControl, Task, remake_task_control
 
 from cosmic.config import PATHS
-from cosmic.datasets.aphrodite import AphroditeDownloader, ALL_YEARS, FILE_TPL
+from cosmic.datasets.aphrodite import StreamingAphroditeDownloader, ALL_YEARS, FILE_TPL
 
 
 def download_year(inputs, outputs, year, datadir):
     with open(os.path.expandvars('$HOME/.aphrodite_credentials.pkl'), 'rb') as f:
         aphrodite_credentials = pickle.load(f)
-    downloader = AphroditeDownloader(datadir, **aphrodite_credentials)
+    downloader = StreamingAphroditeDownloader(datadir, **aphrodite_credentials)
     downloader.download(year)
 
 
@@ -7,12 +7,16 @@ import iris
 from cosmic.datasets.cmorph.cmorph_downloader import CmorphDownloader
 from cosmic.datasets.cmorph.cmorph_convert import convert_cmorph_8km_30min_to_netcdf4_month
 from cosmic.datasets.cmorph.cmorph_convert import extract_asia_8km_30min
+from cosmic.datasets.cmorph.cmorph_convert import convert_cmorph_8km_30min_to_asia_netcdf4_month
 from cosmic.util import load_module, filepath_regrid
 
 from remake import TaskControl, Task, remake_task_control, remake_required
 
 
 BASEDIR = Path('/gws/nopw/j04/cosmic/mmuetz/data/cmorph_data/8km-30min')
+# If True, write the global daily netCDF files then extract Asia from them.
+# Otherwise, go straight from raw files to the Asia netCDF file.
+KEEP_GLOBAL_NC = False
 
 
 @remake_required(depends_on=[CmorphDownloader])
@@ -39,6 +43,12 @@ def extract_year_month(inputs, outputs, year, month):
     extract_asia_8km_30min(inputs, outputs[0], year, month)
 
 
+@remake_required(depends_on=[convert_cmorph_8km_30min_to_asia_netcdf4_month])
+def convert_extract_year_month(inputs, outputs, year, month):
+    print(f'{year}, {month}')
+    convert_cmorph_8km_30min_to_asia_netcdf4_month(inputs[0], outputs[0], year, month)
+
+
 def regrid_asia(inputs, outputs):
     target_filepath = inputs['target']
     cmorph_filepath = inputs['cmorph']
@@ -65,21 +75,27 @@ def gen_task_ctrl():
         raw_filename = (BASEDIR / 'raw' /
                         f'precip_{year}{month:02}' /
                         f'CMORPH_V1.0_ADJ_8km-30min_{year}{month:02}.tar')
-        nc_filenames = {day: (BASEDIR /
-                              f'precip_{year}{month:02}' /
-                              f'cmorph_ppt_{year}{month:02}{day:02}.nc')
-                        for day in range(1, calendar.monthrange(year, month)[1] + 1)}
-        task_ctrl.add(Task(convert_year_month,
-                           [raw_filename],
-                           nc_filenames,
-                           func_args=(year, month)))
-
         nc_asia_filename = (BASEDIR / f'precip_{year}{month:02}' /
                             f'cmorph_ppt_{year}{month:02}.asia.nc')
-        task_ctrl.add(Task(extract_year_month,
-                           nc_filenames,
-                           [nc_asia_filename],
-                           func_args=(year, month)))
+        if KEEP_GLOBAL_NC:
+            nc_filenames = {day: (BASEDIR /
+                                  f'precip_{year}{month:02}' /
+                                  f'cmorph_ppt_{year}{month:02}{day:02}.nc')
+                            for day in range(1, calendar.monthrange(year, month)[1] + 1)}
+            task_ctrl.add(Task(convert_year_month,
+                               [raw_filename],
+                               nc_filenames,
+                               func_args=(year, month)))
+
+            task_ctrl.add(Task(extract_year_month,
+                               nc_filenames,
+                               [nc_asia_filename],
+                               func_args=(year, month)))
+        else:
+            task_ctrl.add(Task(convert_extract_year_month,
+                               [raw_filename],
+                               [nc_asia_filename],
+                               func_args=(year, month)))
 
         regrid_inputs = {}
         regrid_inputs['target'] = Path(f'/gws/nopw/j04/cosmic/mmuetz/data/u-al508/ap9.pp/precip_200501/al508a.p9200501.asia_precip.nc')
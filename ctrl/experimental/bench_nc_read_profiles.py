@@ -0,0 +1,79 @@
+"""Benchmark reading netCDF files written with each write profile, for each access pattern.
+
+Writes a synthetic (time, lat, lon) precip cube with each profile in cosmic.nc_write_profiles, then times:
+    map: reading whole maps at individual times
+    timeseries: reading full time series at individual grid points
+    day: reading one day (num_per_day times) of full maps, as AFI low_mem does
+
+usage:
+    python bench_nc_read_profiles.py [output_dir] [ntime] [nlat] [nlon]
+"""
+import sys
+from pathlib import Path
+from timeit import default_timer as timer
+
+import netCDF4
+import numpy as np
+import iris
+import iris.coords
+import iris.cube
+
+from cosmic.nc_write_profiles import save_cubes, WRITE_PROFILES
+
+NUM_PER_DAY = 24
+NUM_READS = 10
+
+
+def gen_synthetic_cube(ntime, nlat, nlon):
+    rng = np.random.default_rng(1)
+    # Mostly dry, so that compression behaves roughly like real precip.
+    data = rng.exponential(0.5, (ntime, nlat, nlon)).astype(np.float32)
+    data[data < 0.7] = 0
+    time_coord = iris.coords.DimCoord(np.arange(ntime) + 0.5, standard_name='time',
+                                      units='hours since 1970-01-01 00:00:00')
+    lat_coord = iris.coords.DimCoord(np.linspace(1, 56, nlat), standard_name='latitude', units='degrees')
+    lon_coord = iris.coords.DimCoord(np.linspace(57, 151, nlon), standard_name='longitude', units='degrees')
+    return iris.cube.Cube(data, long_name='precipitation', units='mm hr-1',
+                          dim_coords_and_dims=[(time_coord, 0), (lat_coord, 1), (lon_coord, 2)])
+
+
+def time_reads(filename, access):
+    rng = np.random.default_rng(2)
+    with netCDF4.Dataset(filename) as ds:
+        var = ds['precipitation']
+        ntime, nlat, nlon = var.shape
+        start = timer()
+        for i in range(NUM_READS):
+            if access == 'map':
+                var[rng.integers(ntime)]
+            elif access == 'timeseries':
+                var[:, rng.integers(nlat), rng.integers(nlon)]
+            elif access == 'day':
+                day = rng.integers(ntime // NUM_PER_DAY)
+                var[day * NUM_PER_DAY: (day + 1) * NUM_PER_DAY]
+    return (timer() - start) / NUM_READS
+
+
+def main(output_dir, ntime, nlat, nlon):
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    cube = gen_synthetic_cube(ntime, nlat, nlon)
+
+    accesses = ['map', 'timeseries', 'day']
+    print(f'{"profile":>12} {"write (s)":>10} {"size (MB)":>10} ' +
+          ' '.join(f'{a + " (ms)":>16}' for a in accesses))
+    for profile in WRITE_PROFILES:
+        filename = output_dir / f'bench_{profile}.nc'
+        start = timer()
+        save_cubes(cube, filename, profile=profile)
+        write_time = timer() - start
+        size = filename.stat().st_size / 1e6
+        read_times = [time_reads(filename, access) * 1000 for access in accesses]
+        print(f'{profile:>12} {write_time:>10.2f} {size:>10.1f} ' +
+              ' '.join(f'{t:>16.1f}' for t in read_times))
+
+
+if __name__ == '__main__':
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else 'data/bench_nc_read_profiles'
+    ntime, nlat, nlon = [int(a) for a in sys.argv[2:5]] if len(sys.argv) > 4 else (24 * 30, 400, 600)
+    main(output_dir, ntime, nlat, nlon)
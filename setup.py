@@ -34,6 +34,9 @@ setup(
         'bin/cosmic-bsub-submit',
         'bin/cosmic-bsub-task-submit',
         'bin/cosmic-remake-slurm-submit',
+        'bin/cosmic-run-local',
+        'bin/cosmic-task-status',
+        'bin/cosmic-task-profile-report',
         ],
     python_requires='>=3.6',
     # These should all be met if you use the conda_env in envs.